@@ -1,15 +1,125 @@
+import atexit
+import hashlib
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+
+from app.config.settings import (
+    LOG_BACKUP_COUNT,
+    LOG_DEBUG_SAMPLE_EVERY,
+    LOG_LEVEL,
+    LOG_MAX_BYTES,
+    LOG_PAYLOAD_MAX_CHARS,
+    LOG_QUEUE_SIZE
+)
+from app.utils.metrics import metrics
+
+_listener = None
+
+
+class LogPayload:
+    """
+    Wraps a message body passed as a logging argument, e.g.
+    logging.debug('Received message: %s', LogPayload(message)).
+
+    It renders as a truncated prefix with the total length and a short digest. The
+    rendering happens on the background log writer, and not at all if the record is
+    filtered out.
+    """
+
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        text = self.payload if isinstance(self.payload, str) else repr(self.payload)
+        if len(text) <= LOG_PAYLOAD_MAX_CHARS:
+            return text
+        digest = hashlib.sha256(text.encode('utf-8', errors='replace')).hexdigest()[:12]
+        return f'{text[:LOG_PAYLOAD_MAX_CHARS]}... [{len(text)} chars, sha256 {digest}]'
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Keeps the first and then every Nth DEBUG record of each call site, so high-volume
+    debug lines are thinned out while rare ones are always kept.
+    """
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, every)
+        self.counts = {}
+
+    def filter(self, record):
+        if record.levelno != logging.DEBUG or self.every == 1:
+            return True
+        key = (record.pathname, record.lineno)
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        return count % self.every == 0
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the background writer without formatting them and drops records
+    instead of blocking when the queue is full. The number dropped is exported as the
+    log_records_dropped_total metric.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.drop_lock = threading.Lock()
+
+    def prepare(self, record):
+        # The listener runs in this process, so records need not be made picklable
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.drop_lock:
+                self.dropped += 1
 
 
 def setup_logging():
+    """
+    Routes all logging through a bounded queue to a background thread that writes a
+    size-rotated log file, so log I/O never runs on the event loop. Records dropped
+    because the queue was full are counted in the metrics, since they cannot show up in
+    the log itself.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
     log_directory = os.path.join(os.path.dirname(__file__), '..', 'logs')
     os.makedirs(log_directory, exist_ok=True)
     log_path = os.path.join(log_directory, 'websocket_receiver.log')
-    
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_path,
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    queue_handler = BoundedQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    queue_handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_EVERY))
+    metrics.add_collector(lambda: {'log_records_dropped_total': queue_handler.dropped})
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, file_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
     logging.basicConfig(
-        filename=log_path,
-        level=logging.DEBUG,
-        format='%(asctime)s - %(levelname)s - %(message)s'
+        handlers=[queue_handler],
+        level=LOG_LEVEL,
+        force=True
     )
     logging.debug('Logging is configured.')
@@ -0,0 +1,127 @@
+import os
+
+
+def _env_str(name, default):
+    return os.environ.get(name, default)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Directory holding server-side caches (content hashes, indexes, ...)
+CACHE_DIRECTORY = _env_str('CHATGPT_TO_FILE_CACHE_DIR', os.path.join('tmp', 'cache'))
+
+# Persistent content-hash cache used by incremental SYNC
+HASH_CACHE_PATH = os.path.join(CACHE_DIRECTORY, 'hash_cache.json')
+
+# Ids and content digests of the assistant messages and snippets already stored
+DEDUP_INDEX_PATH = os.path.join(CACHE_DIRECTORY, 'dedup_index.jsonl')
+
+# Full-text search index of the archived messages
+SEARCH_INDEX_PATH = os.path.join(CACHE_DIRECTORY, 'search.sqlite3')
+
+# Rollback journals of batches being applied, replayed on startup after a crash
+JOURNAL_DIRECTORY = os.path.join(CACHE_DIRECTORY, 'journal')
+
+# JSON table mapping snippet paths from other machines to local project roots;
+# see app/utils/path_mapper.py. Without the file, paths are used as written.
+PATH_MAPPINGS_PATH = _env_str('CHATGPT_TO_FILE_PATH_MAPPINGS', 'path_mappings.json')
+
+# Seconds a cached git ls-files result is reused at most; see git_utils.get_tracked_files
+TRACKED_FILES_CACHE_MAX_AGE_S = _env_int('CHATGPT_TO_FILE_TRACKED_FILES_CACHE_MAX_AGE_S', 60)
+
+# Number of worker threads reading files during SYNC; twice as many files are prefetched
+SYNC_READ_CONCURRENCY = _env_int('CHATGPT_TO_FILE_SYNC_READ_CONCURRENCY', 8)
+
+# FILE_BATCH frames are flushed once they hold this many content bytes or files
+SYNC_BATCH_MAX_BYTES = _env_int('CHATGPT_TO_FILE_SYNC_BATCH_MAX_BYTES', 256 * 1024)
+SYNC_BATCH_MAX_FILES = _env_int('CHATGPT_TO_FILE_SYNC_BATCH_MAX_FILES', 200)
+
+# Files larger than this are streamed as FILE_CHUNK frames of this size
+SYNC_CHUNK_BYTES = _env_int('CHATGPT_TO_FILE_SYNC_CHUNK_BYTES', 1024 * 1024)
+
+# Compression level used when zstd is negotiated for SYNC
+SYNC_ZSTD_LEVEL = _env_int('CHATGPT_TO_FILE_SYNC_ZSTD_LEVEL', 3)
+
+# Files larger than this are never shipped during SYNC
+SYNC_MAX_FILE_BYTES = _env_int('CHATGPT_TO_FILE_SYNC_MAX_FILE_BYTES', 64 * 1024 * 1024)
+
+# Number of leading bytes inspected to tell text from binary files
+SYNC_SNIFF_BYTES = _env_int('CHATGPT_TO_FILE_SYNC_SNIFF_BYTES', 8 * 1024)
+
+# Messages processed concurrently per connection; messages for the same file stay ordered
+MAX_CONCURRENT_MESSAGES = _env_int('CHATGPT_TO_FILE_MAX_CONCURRENT_MESSAGES', 8)
+
+# Writes to the same path arriving within this window are coalesced into one;
+# a burst is flushed after the maximum delay at the latest. 0 disables coalescing.
+WRITE_COALESCE_WINDOW_MS = _env_int('CHATGPT_TO_FILE_WRITE_COALESCE_WINDOW_MS', 50)
+WRITE_COALESCE_MAX_DELAY_MS = _env_int('CHATGPT_TO_FILE_WRITE_COALESCE_MAX_DELAY_MS', 500)
+
+# Maximum number of snippets in one batch message
+BATCH_MAX_ITEMS = _env_int('CHATGPT_TO_FILE_BATCH_MAX_ITEMS', 500)
+
+# JSON list of commands run on files after they are written, e.g. formatters;
+# see app/utils/hook_runner.py. Without the file, no hooks run.
+HOOKS_CONFIG_PATH = _env_str('CHATGPT_TO_FILE_HOOKS', 'post_write_hooks.json')
+
+# Written files are handed to their hooks once no file was added for this long;
+# at most HOOK_CONCURRENCY hook processes run at once
+HOOK_DEBOUNCE_MS = _env_int('CHATGPT_TO_FILE_HOOK_DEBOUNCE_MS', 300)
+HOOK_CONCURRENCY = _env_int('CHATGPT_TO_FILE_HOOK_CONCURRENCY', 2)
+
+# Hook output reported to the client is cut to its last this many characters
+HOOK_OUTPUT_MAX_CHARS = _env_int('CHATGPT_TO_FILE_HOOK_OUTPUT_MAX_CHARS', 4000)
+
+# Whether saves keep the content they replace in the project's version store, and the
+# size above which files are not kept
+VERSION_STORE_ENABLED = _env_int('CHATGPT_TO_FILE_VERSION_STORE', 1) != 0
+VERSION_STORE_MAX_FILE_BYTES = _env_int('CHATGPT_TO_FILE_VERSION_STORE_MAX_FILE_BYTES', 16 * 1024 * 1024)
+
+# Directory of the assistant message archive, and the size at which its active segment
+# is sealed and a new one started
+MESSAGE_ARCHIVE_DIRECTORY = _env_str('CHATGPT_TO_FILE_MESSAGE_ARCHIVE_DIR', os.path.join('tmp', 'messages'))
+MESSAGE_ARCHIVE_SEGMENT_BYTES = _env_int('CHATGPT_TO_FILE_MESSAGE_ARCHIVE_SEGMENT_BYTES', 64 * 1024 * 1024)
+
+# How archived messages are compressed: 'auto' (zstd with a dictionary trained on the
+# archive if the zstandard package is installed, else gzip), 'zstd', 'gzip' or 'none'
+MESSAGE_ARCHIVE_COMPRESSION = _env_str('CHATGPT_TO_FILE_MESSAGE_ARCHIVE_COMPRESSION', 'auto')
+
+# Archived messages are fsync'ed once this many are pending, or when one is appended
+# this long after the last fsync
+MESSAGE_ARCHIVE_FSYNC_RECORDS = _env_int('CHATGPT_TO_FILE_MESSAGE_ARCHIVE_FSYNC_RECORDS', 32)
+MESSAGE_ARCHIVE_FSYNC_INTERVAL_MS = _env_int('CHATGPT_TO_FILE_MESSAGE_ARCHIVE_FSYNC_INTERVAL_MS', 1000)
+
+# Assistant messages waiting to be archived, beyond which senders wait, and the number
+# archived per fsync
+MESSAGE_WRITE_QUEUE_SIZE = _env_int('CHATGPT_TO_FILE_MESSAGE_WRITE_QUEUE_SIZE', 1000)
+MESSAGE_WRITE_BATCH_SIZE = _env_int('CHATGPT_TO_FILE_MESSAGE_WRITE_BATCH_SIZE', 64)
+
+# Assistant messages kept in memory; beyond either limit the least recently used ones
+# are dropped from memory and read back from the message archive when asked for
+MESSAGE_STORE_MAX_MESSAGES = _env_int('CHATGPT_TO_FILE_MESSAGE_STORE_MAX_MESSAGES', 1000)
+MESSAGE_STORE_MAX_BYTES = _env_int('CHATGPT_TO_FILE_MESSAGE_STORE_MAX_BYTES', 64 * 1024 * 1024)
+
+# Whether saved files are fsync'ed before being renamed into place
+WRITE_FSYNC = _env_int('CHATGPT_TO_FILE_WRITE_FSYNC', 1) != 0
+
+# Server log level and size-based rotation of logs/websocket_receiver.log
+LOG_LEVEL = _env_str('CHATGPT_TO_FILE_LOG_LEVEL', 'DEBUG').upper()
+LOG_MAX_BYTES = _env_int('CHATGPT_TO_FILE_LOG_MAX_BYTES', 10 * 1024 * 1024)
+LOG_BACKUP_COUNT = _env_int('CHATGPT_TO_FILE_LOG_BACKUP_COUNT', 5)
+
+# Records waiting for the background log writer; further records are dropped
+LOG_QUEUE_SIZE = _env_int('CHATGPT_TO_FILE_LOG_QUEUE_SIZE', 10000)
+
+# Logged message bodies are truncated to this many characters
+LOG_PAYLOAD_MAX_CHARS = _env_int('CHATGPT_TO_FILE_LOG_PAYLOAD_MAX_CHARS', 200)
+
+# Keep only every Nth DEBUG record of each call site; 1 keeps all of them
+LOG_DEBUG_SAMPLE_EVERY = _env_int('CHATGPT_TO_FILE_LOG_DEBUG_SAMPLE_EVERY', 1)
+
+# Local HTTP endpoint serving metrics in the Prometheus text format; port 0 disables it
+METRICS_HOST = _env_str('CHATGPT_TO_FILE_METRICS_HOST', 'localhost')
+METRICS_PORT = _env_int('CHATGPT_TO_FILE_METRICS_PORT', 8766)
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+
+from websockets.exceptions import ConnectionClosed
+
+from app.config.logging_config import LogPayload
+from app.config.settings import MAX_CONCURRENT_MESSAGES
+from app.utils.codec import get_connection_codec
+from app.utils.metrics import Timer, message_kind, metrics, record_frame_received, record_frame_sent
+from app.handlers.message_handler import generate_error_response, parse_message, route_message
+
+
+def ordering_key(data):
+    """
+    Returns the key of the resource a message modifies. Messages sharing a key are
+    applied in the order they were received; messages without one run independently.
+
+    Snippets and batches need no key: WriteCoalescer applies writes to the same path in arrival
+    order, and serializing them here would keep bursts from being coalesced. This relies on
+    message tasks starting in submission order and on there being no await between the start
+    of a task and its call to get_write_coalescer().write(), write_new() or write_batch();
+    parsing, deduplication and path resolution on that route must stay synchronous. A handler
+    that needs to await before writing has to get a key here instead.
+
+    Args:
+        data (dict): The parsed JSON data.
+
+    Returns:
+        tuple | None: The ordering key.
+    """
+    if data.get('type') == 'SYNC':
+        return ('SYNC', data.get('destination'))
+    return None
+
+
+class MessageDispatcher:
+    """
+    Processes the messages of one connection concurrently.
+
+    At most `limit` messages are in flight; once the limit is reached the connection is
+    not read until one finishes. Messages with the same ordering key are serialized in
+    arrival order.
+    """
+
+    def __init__(self, websocket, limit=MAX_CONCURRENT_MESSAGES):
+        self.websocket = websocket
+        self.codec = get_connection_codec(websocket)
+        self.slots = asyncio.Semaphore(max(1, limit))
+        self.key_locks = {}
+        self.tasks = set()
+
+    async def submit(self, message):
+        """
+        Schedules a raw message for processing, waiting for a free slot first.
+        """
+        record_frame_received(message)
+        data, error_response = parse_message(message, self.codec)
+        if error_response:
+            metrics.inc('errors_total', kind='unknown')
+            await self.send_response(error_response)
+            return
+
+        await self.slots.acquire()
+        task = asyncio.create_task(self.process(data, ordering_key(data)))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def process(self, data, key):
+        metrics.add_gauge('messages_in_flight', 1)
+        try:
+            if key is None:
+                response = await self.run(data)
+            else:
+                # Tasks start in creation order and asyncio.Lock wakes waiters FIFO
+                lock, waiters = self.key_locks.get(key, (asyncio.Lock(), 0))
+                self.key_locks[key] = (lock, waiters + 1)
+                try:
+                    async with lock:
+                        response = await self.run(data)
+                finally:
+                    lock, waiters = self.key_locks[key]
+                    if waiters == 1:
+                        del self.key_locks[key]
+                    else:
+                        self.key_locks[key] = (lock, waiters - 1)
+            if response:
+                await self.send_response(response)
+        except ConnectionClosed:
+            logging.info(f'Connection closed before responding to message {data.get("id")}.')
+        finally:
+            metrics.add_gauge('messages_in_flight', -1)
+            self.slots.release()
+
+    async def run(self, data):
+        kind = message_kind(data)
+        with Timer('message_duration_seconds', kind=kind):
+            try:
+                response = await route_message(data, self.websocket)
+            except ConnectionClosed:
+                raise
+            except Exception as e:
+                logging.error(f'Error handling message {data.get("id")}: {e}')
+                response = generate_error_response('Internal server error.', data.get('id'))
+        if response and response.get('status') == 'error':
+            metrics.inc('errors_total', kind=kind)
+        return response
+
+    async def send_response(self, response):
+        frame = self.codec.dumps(response)
+        await self.websocket.send(frame)
+        record_frame_sent(frame)
+        logging.debug('Sent response: %s', LogPayload(response))
+
+    async def drain(self):
+        """
+        Waits for every in-flight message, e.g. before the connection handler returns.
+        """
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
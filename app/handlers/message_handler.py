@@ -1,8 +1,20 @@
-import json
+import asyncio
 import logging
 
-from app.utils.file_utils import save_file, send_all_files
+from app.utils.codec import JSON_CODEC, CodecError, get_connection_codec
+from app.config.settings import BATCH_MAX_ITEMS
+from app.utils.file_utils import save_file, save_files, send_all_files
+from app.utils.dedup_index import get_dedup_index
+from app.utils.file_writer import get_write_coalescer
+from app.utils.hash_cache import hash_bytes
+from app.utils.hook_runner import get_hook_runner
+from app.utils.path_mapper import PathMappingError, get_path_mapper
+from app.utils.snippet_merge import MergeError, has_elision
+from app.utils.version_store import get_version_store
 from app.managers.message_manager import store_message
+from app.utils.metrics import metrics
+
+SNIPPET_MODES = (None, 'overwrite', 'merge')
 
 
 async def handle_message(message, websocket):
@@ -17,22 +29,66 @@ async def handle_message(message, websocket):
     Returns:
         dict or None: Response to send back to the client, or None if handled internally.
     """
+    data, error_response = parse_message(message, get_connection_codec(websocket))
+    if error_response:
+        return error_response
+    return await route_message(data, websocket)
+
+
+def parse_message(message, codec=JSON_CODEC):
+    """
+    Decodes a raw WebSocket message.
+
+    Args:
+        message (str | bytes): The raw message received from the WebSocket.
+        codec (JsonCodec | MsgpackCodec): The codec negotiated for the connection.
+
+    Returns:
+        tuple: (data, error_response). Exactly one of them is None.
+    """
     try:
-        data = json.loads(message)
-    except json.JSONDecodeError:
-        logging.error('Invalid JSON format received.')
-        return generate_error_response('Invalid JSON format.')
+        data = codec.loads(message)
+    except CodecError:
+        logging.error(f'Invalid {codec.name} format received.')
+        return None, generate_error_response(f'Invalid {codec.name} format.')
+    if not isinstance(data, dict):
+        logging.error('Message is not a JSON object.')
+        return None, generate_error_response('Invalid message format.')
+    return data, None
 
+
+async def route_message(data, websocket):
+    """
+    Delegates a decoded message to its handler. Responses to messages carrying an 'id'
+    always echo it, so the client can match acks that arrive out of order.
+
+    Args:
+        data (dict): The parsed JSON data.
+        websocket (WebSocketServerProtocol): The WebSocket connection.
+
+    Returns:
+        dict or None: Response to send back to the client, or None if handled internally.
+    """
     message_type = data.get('type')
     if message_type == 'SYNC':
-        return await handle_sync_message(data, websocket)
+        response = await handle_sync_message(data, websocket)
+    elif message_type == 'METRICS':
+        response = handle_metrics_message(data)
+    elif message_type == 'VERSIONS':
+        response = await handle_versions_message(data)
     else:
-        return await handle_data_message(data, websocket)
+        response = await handle_data_message(data, websocket)
+    if response and 'id' not in response and data.get('id') is not None:
+        response['id'] = data['id']
+    return response
 
 
 async def handle_sync_message(data, websocket):
     """
     Handles messages of type 'SYNC' by sending all tracked files to the client.
+    If the message carries a 'manifest' of the client's files, only added or changed
+    files are sent along with a list of deleted paths. Optional 'framing' and
+    'compression' fields select batched/chunked frames and their compression.
 
     Args:
         data (dict): The parsed JSON data.
@@ -42,14 +98,91 @@ async def handle_sync_message(data, websocket):
         dict or None: Error response if destination is missing, else None.
     """
     destination = data.get('destination')
+    manifest = data.get('manifest')
+    if manifest is not None and not isinstance(manifest, dict):
+        logging.error('SYNC message has an invalid manifest.')
+        return generate_error_response('Invalid manifest in SYNC message.')
     if destination:
-        await send_all_files(websocket, destination)
+        await send_all_files(
+            websocket,
+            destination,
+            manifest,
+            framing=data.get('framing'),
+            compression=data.get('compression')
+        )
         return None  # Responses are handled within send_all_files
     else:
         logging.error('SYNC message missing destination.')
         return generate_error_response('Missing destination in SYNC message.')
 
 
+def handle_metrics_message(data):
+    """
+    Handles messages of type 'METRICS' by returning a snapshot of the server metrics.
+
+    Args:
+        data (dict): The parsed JSON data.
+
+    Returns:
+        dict: The metrics response.
+    """
+    return {
+        'type': 'METRICS',
+        'status': 'success',
+        'metrics': metrics.snapshot()
+    }
+
+
+async def handle_versions_message(data):
+    """
+    Handles messages of type 'VERSIONS', which list or restore the versions of a file
+    kept in its project's version store. 'action' is 'list' or 'restore'; a restore
+    names the version by its 'hash', and the content it replaces is stored in turn.
+
+    Args:
+        data (dict): The parsed JSON data.
+
+    Returns:
+        dict: The versions, or the outcome of the restore.
+    """
+    action = data.get('action')
+    file_path = data.get('filePath')
+    if not isinstance(file_path, str) or not file_path:
+        logging.error('VERSIONS message missing filePath.')
+        return generate_error_response('Missing filePath in VERSIONS message.')
+    try:
+        file_path = get_path_mapper().resolve(file_path)
+    except PathMappingError as e:
+        logging.error(f'Rejected path: {e}')
+        return generate_error_response(str(e))
+
+    loop = asyncio.get_running_loop()
+    store = get_version_store(file_path)
+    if action == 'list':
+        versions = await loop.run_in_executor(None, store.list_versions, file_path)
+        return {'type': 'VERSIONS', 'status': 'success', 'filePath': file_path, 'versions': versions}
+    elif action == 'restore':
+        try:
+            content = await loop.run_in_executor(None, store.read_version, file_path, data.get('hash'))
+        except KeyError as e:
+            logging.error(str(e))
+            return generate_error_response(f'Unknown version of {file_path}.')
+        try:
+            result = await get_write_coalescer().write(file_path, content, coalesce=False)
+        except Exception as e:
+            logging.error(f'Error restoring {file_path}: {e}')
+            return generate_error_response('Failed to restore file.')
+        return {
+            'type': 'VERSIONS',
+            'status': 'unchanged' if result['unchanged'] else 'success',
+            'filePath': file_path,
+            'hash': data.get('hash')
+        }
+    else:
+        logging.error(f'Unknown VERSIONS action: {action}')
+        return generate_error_response(f'Unknown VERSIONS action: {action}')
+
+
 async def handle_data_message(data, websocket):
     """
     Handles data messages based on their 'kind' field.
@@ -63,20 +196,34 @@ async def handle_data_message(data, websocket):
     """
     kind = data.get('kind')
     if kind == 'snippet':
-        return await handle_snippet_message(data)
+        return await handle_snippet_message(data, websocket)
+    elif kind == 'batch':
+        return await handle_batch_message(data, websocket)
     elif kind == 'assistant':
-        return handle_assistant_message(data)
+        return await handle_assistant_message(data)
     else:
         logging.error('Unknown message type received.')
         return generate_error_response('Unknown message type.')
 
 
-async def handle_snippet_message(data):
+async def handle_snippet_message(data, websocket=None):
     """
-    Processes 'snippet' kind messages by saving the provided file content.
+    Processes 'snippet' kind messages by saving the provided file content. The status is
+    'unchanged' when the file already held the content and was left untouched, and
+    'already_stored' when the same snippet id was already saved with this content to this
+    path, in which case the file is not even looked at.
+
+    Snippets with mode 'merge', or without a mode but with '... existing code ...' style
+    comments, are merged into the existing file and the response lists the result of
+    each hunk. A merge that cannot place every hunk writes nothing and is an error.
+    Mode 'overwrite' always replaces the whole file.
+
+    Post-write hooks for the saved file are queued in the background and report to the
+    websocket with a HOOK_RESULT message; the response does not wait for them.
 
     Args:
         data (dict): The parsed JSON data.
+        websocket (WebSocketServerProtocol, optional): The connection hook results go to.
 
     Returns:
         dict: Success or error response.
@@ -89,14 +236,48 @@ async def handle_snippet_message(data):
         logging.error('Snippet message missing id.')
         return generate_error_response('Missing snippet id.', snippet_id)
 
+    mode = data.get('mode')
+    if mode not in SNIPPET_MODES:
+        logging.error(f'Unknown snippet mode: {mode}')
+        return generate_error_response(f'Unknown snippet mode: {mode}', snippet_id)
+
     if file_path and content:
-        saved_path = await save_file(file_path, content)
-        if saved_path:
+        digest = hash_bytes(content.encode('utf-8'))
+        dedup_index = get_dedup_index()
+        stored = dedup_index.lookup('snippet', snippet_id, digest)
+        if stored is not None and stored['filePath'] == file_path:
+            metrics.inc('duplicates_total', kind='snippet')
             return {
-                'status': 'success',
-                'savedPath': saved_path,
+                'status': 'already_stored',
+                'savedPath': stored['savedPath'],
                 'id': snippet_id
             }
+        merge = is_merge(mode, content)
+        try:
+            saved = await save_file(file_path, content, language=data.get('language'), merge=merge)
+        except MergeError as e:
+            return {
+                'status': 'error',
+                'message': str(e),
+                'id': snippet_id,
+                'hunks': e.hunks
+            }
+        if saved:
+            dedup_index.record('snippet', snippet_id, digest, filePath=file_path, savedPath=saved['path'])
+            if not saved['unchanged']:
+                get_hook_runner().schedule(saved['path'], websocket)
+            return {
+                'status': 'unchanged' if saved['unchanged'] else 'success',
+                'savedPath': saved['path'],
+                'id': snippet_id,
+                'language': saved['language'].extension,
+                'languageSource': saved['language'].source,
+                'languageConfidence': saved['language'].confidence,
+                'writeLatencyMs': saved['latencyMs'],
+                'coalesced': saved['coalesced'],
+                'superseded': saved['superseded'],
+                'hunks': saved['hunks']
+            }
         else:
             return {
                 'status': 'error',
@@ -112,25 +293,99 @@ async def handle_snippet_message(data):
         }
 
 
-def handle_assistant_message(data):
+def is_merge(mode, content):
     """
-    Processes 'assistant' kind messages by storing the message content.
+    Returns whether a snippet is merged into the existing file rather than replacing it.
+    """
+    return mode == 'merge' or (mode is None and has_elision(content))
+
+
+async def handle_batch_message(data, websocket=None):
+    """
+    Processes 'batch' kind messages carrying several snippets in 'items', each shaped
+    like a snippet message. The snippets are applied all-or-nothing: writes to distinct
+    files run in parallel, and if any of them fails every file is restored. Post-write
+    hooks are queued as for single snippets.
 
     Args:
         data (dict): The parsed JSON data.
+        websocket (WebSocketServerProtocol, optional): The connection hook results go to.
 
     Returns:
-        dict: Success or error response.
+        dict: One response with the batch 'status' and the status of each item.
+    """
+    batch_id = data.get('id')
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        logging.error('Batch message without items.')
+        return generate_error_response('Missing items in batch message.', batch_id)
+    if len(items) > BATCH_MAX_ITEMS:
+        logging.error(f'Batch message with {len(items)} items exceeds the limit of {BATCH_MAX_ITEMS}.')
+        return generate_error_response(f'Too many items in batch message (max {BATCH_MAX_ITEMS}).', batch_id)
+
+    snippets = []
+    for item in items:
+        if (not isinstance(item, dict) or not isinstance(item.get('filePath'), str)
+                or not isinstance(item.get('content'), str) or not item['content']
+                or item.get('mode') not in SNIPPET_MODES):
+            logging.error('Invalid item in batch message.')
+            return generate_error_response('Invalid item in batch message.', batch_id)
+        snippets.append({
+            'filePath': item['filePath'].split(' ')[0],
+            'content': item['content'],
+            'language': item.get('language'),
+            'merge': is_merge(item.get('mode'), item['content'])
+        })
+
+    result = await save_files(snippets)
+    responses = []
+    for item, outcome in zip(items, result['items']):
+        if outcome['status'] == 'success' and result['committed']:
+            get_hook_runner().schedule(outcome['path'], websocket)
+        response = {'id': item.get('id'), 'status': outcome['status'], 'savedPath': outcome.get('path')}
+        if outcome.get('language') is not None:
+            response['language'] = outcome['language'].extension
+        if outcome.get('hunks') is not None:
+            response['hunks'] = outcome['hunks']
+        if 'message' in outcome:
+            response['message'] = outcome['message']
+        responses.append(response)
+    return {
+        'status': 'success' if result['committed'] else 'error',
+        'id': batch_id,
+        'writeLatencyMs': result['latencyMs'],
+        'items': responses
+    }
+
+
+async def handle_assistant_message(data):
+    """
+    Processes 'assistant' kind messages by storing the message content. The content is
+    archived in the background; the reply only acknowledges that it was queued and is
+    sent before the message is durable (see MessageWriter). The status is
+    'already_stored' for a message re-sent with the same id and content.
+
+    Args:
+        data (dict): The parsed JSON data.
+
+    Returns:
+        dict: An ack with the message id and the SHA-256 digest of the content, or an
+            error response.
     """
     content = data.get('content')
     snippet_id = data.get('id')
     file_path = data.get('filePath')
 
     if content:
-        store_message(content, snippet_id, file_path)
+        try:
+            message_id, digest, duplicate = await store_message(content, snippet_id, file_path)
+        except Exception as e:
+            logging.error(f'Error storing message: {e}')
+            return generate_error_response('Error storing message.', snippet_id)
         return {
-            'status': 'success',
-            'content': content
+            'status': 'already_stored' if duplicate else 'success',
+            'id': message_id,
+            'hash': digest
         }
     else:
         logging.error('Invalid assistant message format.')
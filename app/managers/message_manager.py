@@ -1,42 +1,247 @@
+import asyncio
 import logging
-import os
-from datetime import datetime
-import pytz
+import threading
+import time
+import uuid
+from collections import OrderedDict
 
-# Assuming there's a storage mechanism, e.g., database or in-memory storage
-# For demonstration, we'll use a simple in-memory list
+from app.config.logging_config import LogPayload
+from app.config.settings import (
+    MESSAGE_STORE_MAX_BYTES,
+    MESSAGE_STORE_MAX_MESSAGES,
+    MESSAGE_WRITE_BATCH_SIZE,
+    MESSAGE_WRITE_QUEUE_SIZE
+)
+from app.utils.dedup_index import get_dedup_index
+from app.utils.hash_cache import hash_bytes
+from app.utils.message_archive import get_message_archive
+from app.utils.metrics import metrics
+from app.utils.search_index import get_search_index
 
-message_store = []
+# Seconds between attempts to archive a batch that failed, doubling up to the maximum
+RETRY_DELAY_MIN = 0.1
+RETRY_DELAY_MAX = 5.0
+# Seconds drain waits for the queued messages before giving up on them
+DRAIN_TIMEOUT = 30.0
 
 
-def store_message(content, snippet_id=None, file_path=None):
-    try:
-        message = {
-            'content': content,
-            'snippet_id': snippet_id,
-            'file_path': file_path
-        }
-        message_store.append(message)
-        save_to_file(content, snippet_id, file_path)
-        logging.debug(f'Message stored: {message}')
-    except Exception as e:
-        logging.error(f'Error storing message: {e}')
+class MessageStore:
+    """
+    Bounded in-memory store of assistant messages, indexed by message id.
 
+    Messages are kept in least-recently-used order and evicted once the store holds more
+    than max_messages messages or max_bytes bytes of UTF-8 content. Every message is
+    queued for the message archive when it is stored, and the writer keeps it until it
+    is archived; evicting one only drops the copy in memory, never touches the archive,
+    and get reads it back from the writer queue or the archive.
+    """
 
-def save_to_file(html_text, message_id, project_path):
-    timestamp_ms = int(message_id.split('-')[1])
-    timestamp_s = timestamp_ms / 1000
+    def __init__(self, max_messages=MESSAGE_STORE_MAX_MESSAGES, max_bytes=MESSAGE_STORE_MAX_BYTES):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.messages = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {'stored': 0, 'evicted': 0, 'hits': 0, 'archive_reads': 0, 'misses': 0}
 
-    # Convert to datetime object and format as yyyy-mm-dd-hh-mm-ss
-    dt = datetime.fromtimestamp(timestamp_s, pytz.timezone('Asia/Tokyo'))
-    timestamp_s = dt.strftime('%Y-%m-%d-%H-%M-%S')
+    def __len__(self):
+        return len(self.messages)
 
-    file_path = f'tmp/messages/{timestamp_s}.html'
+    def __contains__(self, message_id):
+        return message_id in self.messages or message_id in get_message_archive()
 
-    # mkdir
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    def add(self, message_id, message):
+        """
+        Stores a message, evicting the least recently used ones beyond the limits.
 
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(f'<path>{project_path}</path>\n')
-        f.write(html_text)
-    logging.info(f'Saved message to: {file_path}')
+        Args:
+            message_id (str): The message id.
+            message (dict): The message, with its 'content'.
+        """
+        size = len((message.get('content') or '').encode('utf-8'))
+        with self.lock:
+            if message_id in self.messages:
+                self.total_bytes -= self.sizes.pop(message_id)
+                del self.messages[message_id]
+            self.messages[message_id] = message
+            self.sizes[message_id] = size
+            self.total_bytes += size
+            self.stats['stored'] += 1
+            evicted = self.evict()
+        if evicted:
+            metrics.inc('message_store_evictions_total', len(evicted))
+
+    def evict(self):
+        evicted = []
+        while self.messages and (len(self.messages) > self.max_messages or self.total_bytes > self.max_bytes):
+            message_id, message = self.messages.popitem(last=False)
+            self.total_bytes -= self.sizes.pop(message_id)
+            evicted.append((message_id, message))
+        self.stats['evicted'] += len(evicted)
+        return evicted
+
+    def get(self, message_id):
+        """
+        Returns the message with this id, reading it back from the archive if it was
+        evicted, or None if it is unknown.
+        """
+        with self.lock:
+            message = self.messages.get(message_id)
+            if message is not None:
+                self.messages.move_to_end(message_id)
+                self.stats['hits'] += 1
+                return message
+        message = message_writer.pending.get(message_id)
+        if message is not None:
+            self.stats['hits'] += 1
+            return message
+        archived = get_message_archive().read(message_id)
+        if archived is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['archive_reads'] += 1
+        metrics.inc('message_store_archive_reads_total')
+        return {'content': archived.content, 'snippet_id': archived.id, 'file_path': archived.path}
+
+
+class MessageWriter:
+    """
+    Write-behind persistence of assistant messages.
+
+    submit queues a message and returns at once; a background task takes the queued
+    messages in batches of up to batch_size, appends them to the message archive in an
+    executor and fsyncs once per batch. The queue holds at most max_pending messages,
+    beyond which submit waits, so a stalled disk slows senders down instead of growing
+    memory. Messages stay readable from pending until their batch is written.
+
+    A batch that fails to archive is retried, with a growing delay, until it succeeds;
+    its messages stay pending meanwhile. submit returns before the message is durable,
+    so a message acked just before a crash may be lost. It is only recorded in the dedup
+    index once archived, so the client re-sending it stores it again.
+    """
+
+    def __init__(self, max_pending=MESSAGE_WRITE_QUEUE_SIZE, batch_size=MESSAGE_WRITE_BATCH_SIZE):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.queue = None
+        self.task = None
+        self.pending = {}
+
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def submit(self, message_id, message):
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.max_pending)
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        self.pending[message_id] = message
+        await self.queue.put(message_id)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            delay = RETRY_DELAY_MIN
+            while True:
+                # The message objects written by this batch; a message re-sent during the
+                # flush replaces its pending entry and stays pending for its own batch
+                flushing = {message_id: self.pending.get(message_id) for message_id in batch}
+                start = time.perf_counter()
+                try:
+                    await loop.run_in_executor(None, self.flush, flushing)
+                except Exception as e:
+                    logging.error(f'Error archiving {len(batch)} messages, retrying in {delay:.1f} s: {e}')
+                    metrics.inc('errors_total', kind='assistant')
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, RETRY_DELAY_MAX)
+                else:
+                    break
+                finally:
+                    metrics.observe('message_flush_seconds', time.perf_counter() - start)
+            metrics.inc('messages_archived_total', len(batch))
+            for message_id in batch:
+                if message_id in flushing and self.pending.get(message_id) is flushing.pop(message_id):
+                    del self.pending[message_id]
+                self.queue.task_done()
+
+    def flush(self, messages):
+        archive = get_message_archive()
+        archived = []
+        documents = []
+        for message_id, message in messages.items():
+            if message is None:
+                continue  # Re-sent while queued and archived with the earlier batch
+            entry = archive.append(message_id, message['content'], message.get('file_path'))
+            archived.append({'kind': 'assistant', 'id': message_id, 'hash': message['hash']})
+            documents.append((message_id, entry.timestamp, message.get('file_path'), message['content']))
+        archive.sync()
+        # Recorded once durable, so a message lost in a crash is stored again when re-sent
+        get_dedup_index().record_many(archived)
+        logging.info(f'Archived {len(archived)} messages')
+        try:
+            get_search_index().add_messages(documents)
+        except Exception as e:
+            logging.error(f'Error indexing {len(documents)} messages: {e}')
+
+    async def drain(self, timeout=DRAIN_TIMEOUT):
+        """
+        Waits until every queued message is archived, then stops the background task.
+        Messages that still fail to archive after timeout seconds are given up on.
+        """
+        if self.task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.error(f'Gave up archiving {len(self.pending)} messages after {timeout} s')
+        self.task.cancel()
+        self.task = None
+
+
+async def store_message(content, snippet_id=None, file_path=None):
+    """
+    Stores an assistant message and queues it for archiving. A message already stored
+    with the same id and content, or still queued, is left alone.
+
+    Returns:
+        tuple: The message id, the SHA-256 digest of the content, and whether the message
+            was already stored.
+    """
+    digest = hash_bytes(content.encode('utf-8'))
+    if snippet_id is not None:
+        pending = message_writer.pending.get(snippet_id)
+        if (pending is not None and pending['hash'] == digest) or \
+                get_dedup_index().lookup('assistant', snippet_id, digest) is not None:
+            metrics.inc('duplicates_total', kind='assistant')
+            return snippet_id, digest, True
+    message = {
+        'content': content,
+        'snippet_id': snippet_id,
+        'file_path': file_path,
+        'hash': digest
+    }
+    message_id = snippet_id if snippet_id is not None else uuid.uuid4().hex
+    message_store.add(message_id, message)
+    await message_writer.submit(message_id, message)
+    logging.debug('Message stored: %s', LogPayload(message))
+    return message_id, digest, False
+
+
+def get_message(message_id):
+    """
+    Returns a stored assistant message by id, or None.
+    """
+    return message_store.get(message_id)
+
+
+message_store = MessageStore()
+message_writer = MessageWriter()
+metrics.add_collector(lambda: {
+    'message_store_messages': len(message_store),
+    'message_store_bytes': message_store.total_bytes,
+    'message_write_queue_depth': message_writer.depth()
+})
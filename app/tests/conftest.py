@@ -0,0 +1,8 @@
+# conftest.py
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cwd(tmp_path, monkeypatch):
+    # The caches, journals and stores default to paths relative to the working directory
+    monkeypatch.chdir(tmp_path)
@@ -0,0 +1,81 @@
+# test_archive_codec.py
+import gzip
+import os
+
+import pytest
+
+from app.utils.archive_codec import CODEC_GZIP, CODEC_NONE, CODEC_ZSTD, RecordCodec, read_document_file
+from app.utils.message_archive import MessageArchive
+
+zstandard = pytest.importorskip('zstandard')
+
+
+def message_html(number):
+    return (
+        f'<div data-message-author-role="assistant" data-message-id="msg-{number}">'
+        f'<div class="markdown prose w-full break-words dark:prose-invert light"><p>Answer {number}: '
+        f'update the handler so that request {number * 7} retries.</p><pre><div class="code-header">python</div>'
+        f'<code class="language-python">def handler_{number}(request):\n    return retry(request, {number})\n'
+        '</code></pre></div></div>'
+    )
+
+
+@pytest.mark.parametrize('codec', [CODEC_NONE, CODEC_GZIP, CODEC_ZSTD])
+def test_codecs_round_trip(tmp_path, codec):
+    record_codec = RecordCodec(str(tmp_path), codec)
+    data = message_html(1).encode('utf-8') * 4
+    flags, encoded = record_codec.compress(data)
+    assert flags & 0xFF == codec
+    assert codec == CODEC_NONE or len(encoded) < len(data)
+    assert RecordCodec(str(tmp_path), CODEC_NONE).decompress(flags, encoded) == data
+
+
+def test_content_that_does_not_shrink_is_stored_as_is(tmp_path):
+    data = os.urandom(64)
+    assert RecordCodec(str(tmp_path), CODEC_ZSTD).compress(data) == (CODEC_NONE, data)
+
+
+def test_dictionary_is_trained_when_the_first_segment_is_sealed(tmp_path):
+    directory = os.path.join(tmp_path, 'messages')
+    archive = MessageArchive(directory, segment_bytes=64 * 1024, codec=CODEC_ZSTD)
+    for number in range(600):
+        archive.append(f'msg-{number}', message_html(number))
+    assert archive.codec.dictionary_id == 1
+    assert os.path.exists(os.path.join(directory, 'dictionary-001.zstd'))
+    archive.close()
+
+    # Records of both sides of the dictionary read back, also in a fresh process
+    reopened = MessageArchive(directory, readonly=True, codec=CODEC_GZIP)
+    assert reopened.read('msg-3').content == message_html(3)
+    assert reopened.read('msg-599').content == message_html(599)
+    reopened.close()
+
+
+def test_migration_recompresses_every_message(tmp_path):
+    directory = os.path.join(tmp_path, 'messages')
+    archive = MessageArchive(directory, segment_bytes=32 * 1024, codec=CODEC_NONE)
+    for number in range(300):
+        archive.append(f'msg-{number}', message_html(number))
+    archive.append('msg-5', 'superseded')
+    archive.close()
+
+    migrating = MessageArchive(directory, segment_bytes=32 * 1024, codec=CODEC_ZSTD)
+    before, after = migrating.recompress(workers=2)
+    assert after * 3 < before
+    migrating.close()
+
+    reopened = MessageArchive(directory, readonly=True)
+    assert len(reopened) == 300
+    assert reopened.read('msg-5').content == 'superseded'
+    assert all(reopened.read(f'msg-{number}').content == message_html(number) for number in range(6, 300))
+    reopened.close()
+
+
+def test_read_document_file_decompresses(tmp_path):
+    html = message_html(1)
+    paths = {'plain.html': html.encode('utf-8'), 'gzip.html.gz': gzip.compress(html.encode('utf-8')),
+             'zstd.html.zst': zstandard.ZstdCompressor().compress(html.encode('utf-8'))}
+    for name, data in paths.items():
+        with open(os.path.join(tmp_path, name), 'wb') as f:
+            f.write(data)
+        assert read_document_file(os.path.join(tmp_path, name)) == html
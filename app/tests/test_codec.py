@@ -0,0 +1,27 @@
+# test_codec.py
+import msgpack
+import pytest
+
+from app.utils.codec import CodecError, JsonCodec, MsgpackCodec
+
+
+def test_msgpack_decodes_byte_content_of_snippets_and_batch_items():
+    codec = MsgpackCodec()
+    frame = msgpack.packb({
+        'kind': 'batch',
+        'items': [{'filePath': 'a.py', 'content': 'print(1)\n'.encode('utf-8')}]
+    }, use_bin_type=True)
+    assert codec.loads(frame)['items'][0]['content'] == 'print(1)\n'
+    frame = msgpack.packb({'kind': 'snippet', 'content': 'ü'.encode('utf-8')}, use_bin_type=True)
+    assert codec.loads(frame)['content'] == 'ü'
+
+
+def test_invalid_frames_raise_codec_error():
+    with pytest.raises(CodecError):
+        MsgpackCodec().loads(msgpack.packb({'content': b'\xff\xfe'}, use_bin_type=True))
+    with pytest.raises(CodecError):
+        MsgpackCodec().loads(msgpack.packb({'items': [{'content': b'\xff'}]}, use_bin_type=True))
+    with pytest.raises(CodecError):
+        MsgpackCodec().loads('{"kind": "snippet"}')
+    with pytest.raises(CodecError):
+        JsonCodec().loads('{"kind": ')
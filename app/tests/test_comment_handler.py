@@ -0,0 +1,17 @@
+# test_comment_handler.py
+from app.utils.handlers import EXTENSION_HANDLER_MAP
+from app.utils.language_detection import detect_language
+
+
+def test_php_path_comment_on_the_preamble_line():
+    handler = EXTENSION_HANDLER_MAP['.php']
+    for content in ('<?php // Path: web/index.php\necho 1;\n', '<?php\n// Path: web/index.php\n\necho 1;\n'):
+        assert detect_language(content).source == 'path_comment'
+        assert handler.process_content(content, 'base') == ('<?php\n\necho 1;', 'web/index.php')
+
+
+def test_php_without_path_comment():
+    handler = EXTENSION_HANDLER_MAP['.php']
+    assert handler.process_content('<?php\necho 1;\n', 'base') == ('<?php\n\necho 1;', 'base.php')
+    assert handler.process_content('<?php', 'base') == (None, None)
+    assert handler.process_content('echo 1;\n', 'base') == (None, None)
@@ -0,0 +1,70 @@
+# test_dedup_index.py
+import asyncio
+import os
+
+from app.managers import message_manager
+from app.utils import dedup_index as dedup_module
+from app.utils.dedup_index import DedupIndex
+from app.utils.message_archive import MessageArchive
+from app.utils.search_index import SearchIndex
+
+
+def test_lookup_matches_id_and_content(tmp_path):
+    path = os.path.join(tmp_path, 'dedup_index.jsonl')
+    index = DedupIndex(path)
+    index.record('snippet', 's1', 'digest-1', path='app/main.py')
+    assert index.lookup('snippet', 's1', 'digest-1')['path'] == 'app/main.py'
+    assert index.lookup('snippet', 's1', 'digest-2') is None
+    assert index.lookup('assistant', 's1', 'digest-1') is None
+
+
+def test_reload_skips_torn_records(tmp_path):
+    path = os.path.join(tmp_path, 'dedup_index.jsonl')
+    index = DedupIndex(path)
+    index.record('snippet', 's1', 'digest-1')
+    index.record('snippet', 's1', 'digest-2')
+    index.file.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"kind": "snippet", "id": "s2", "ha')
+    reloaded = DedupIndex(path)
+    assert reloaded.lookup('snippet', 's1', 'digest-2') is not None
+    assert reloaded.lookup('snippet', 's1', 'digest-1') is None
+    assert len(reloaded.entries) == 1
+
+
+def test_superseded_records_are_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup_module, 'COMPACT_MIN_STALE_RECORDS', 10)
+    path = os.path.join(tmp_path, 'dedup_index.jsonl')
+    index = DedupIndex(path)
+    for number in range(30):
+        index.record('snippet', 's1', f'digest-{number}')
+    with open(path, 'r', encoding='utf-8') as f:
+        assert len(f.readlines()) < 30
+    assert DedupIndex(path).lookup('snippet', 's1', 'digest-29') is not None
+
+
+def test_resent_messages_are_stored_once(tmp_path, monkeypatch):
+    archive = MessageArchive(os.path.join(tmp_path, 'messages'))
+    index = DedupIndex(os.path.join(tmp_path, 'dedup_index.jsonl'))
+    search_index = SearchIndex(os.path.join(tmp_path, 'search.sqlite3'))
+    monkeypatch.setattr(message_manager, 'get_message_archive', lambda: archive)
+    monkeypatch.setattr(message_manager, 'get_dedup_index', lambda: index)
+    monkeypatch.setattr(message_manager, 'get_search_index', lambda: search_index)
+    monkeypatch.setattr(message_manager, 'message_writer', message_manager.MessageWriter())
+    monkeypatch.setattr(message_manager, 'message_store', message_manager.MessageStore())
+
+    async def scenario():
+        results = [await message_manager.store_message('<div>hello</div>', 'msg-1')]
+        # Still queued, then archived
+        results.append(await message_manager.store_message('<div>hello</div>', 'msg-1'))
+        await message_manager.message_writer.drain()
+        results.append(await message_manager.store_message('<div>hello</div>', 'msg-1'))
+        results.append(await message_manager.store_message('<div>edited</div>', 'msg-1'))
+        await message_manager.message_writer.drain()
+        return results
+
+    results = asyncio.run(scenario())
+    assert [duplicate for _, _, duplicate in results] == [False, True, True, False]
+    assert archive.read('msg-1').content == '<div>edited</div>'
+    search_index.close()
+    archive.close()
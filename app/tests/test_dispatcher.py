@@ -0,0 +1,89 @@
+# test_dispatcher.py
+import asyncio
+import json
+import os
+
+from app.handlers.dispatcher import MessageDispatcher
+
+
+class FakeWebSocket:
+    """
+    Collects the frames sent to the client.
+    """
+
+    subprotocol = None
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, frame):
+        self.sent.append(json.loads(frame))
+
+
+class RecordingDispatcher(MessageDispatcher):
+    """
+    Records the messages it runs instead of routing them; each takes data['delay'] seconds.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = []
+        self.finished = []
+        self.active = 0
+        self.max_active = 0
+
+    async def run(self, data):
+        self.started.append(data['id'])
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(data.get('delay', 0))
+        self.active -= 1
+        self.finished.append(data['id'])
+        return {'status': 'success', 'id': data['id']}
+
+
+def submit_all(dispatcher, messages):
+    async def scenario():
+        for data in messages:
+            await dispatcher.submit(json.dumps(data))
+        await dispatcher.drain()
+
+    asyncio.run(scenario())
+
+
+def test_messages_with_the_same_key_run_in_arrival_order():
+    dispatcher = RecordingDispatcher(FakeWebSocket(), limit=8)
+    submit_all(dispatcher, [
+        {'type': 'SYNC', 'destination': 'a', 'id': 1, 'delay': 0.05},
+        {'type': 'SYNC', 'destination': 'b', 'id': 2, 'delay': 0.01},
+        {'type': 'SYNC', 'destination': 'a', 'id': 3, 'delay': 0},
+        {'type': 'SYNC', 'destination': 'a', 'id': 4, 'delay': 0.02}
+    ])
+    # b is not held up by a, while a's messages never overtake each other
+    assert [id_ for id_ in dispatcher.finished if id_ != 2] == [1, 3, 4]
+    assert dispatcher.finished.index(2) < dispatcher.finished.index(1)
+    assert dispatcher.key_locks == {}
+
+
+def test_messages_in_flight_are_bounded():
+    websocket = FakeWebSocket()
+    dispatcher = RecordingDispatcher(websocket, limit=2)
+    submit_all(dispatcher, [{'kind': 'snippet', 'id': number, 'delay': 0.02} for number in range(6)])
+    assert dispatcher.max_active == 2
+    assert sorted(response['id'] for response in websocket.sent) == list(range(6))
+
+
+def test_snippets_to_the_same_path_are_applied_in_arrival_order(tmp_path):
+    base_path = os.path.join(tmp_path, 'main')
+    websocket = FakeWebSocket()
+    dispatcher = MessageDispatcher(websocket, limit=8)
+    # Unkeyed, so only their order of reaching the WriteCoalescer keeps the merge after the write
+    submit_all(dispatcher, [
+        {'kind': 'snippet', 'id': 's1', 'filePath': base_path, 'mode': 'overwrite',
+         'content': 'def one():\n    return 1\n\n\ndef two():\n    return 2\n'},
+        {'kind': 'snippet', 'id': 's2', 'filePath': base_path, 'mode': 'merge',
+         'content': '# ... existing code ...\ndef two():\n    return 22\n'}
+    ])
+    assert sorted(response['status'] for response in websocket.sent) == ['success', 'success']
+    with open(base_path + '.py', 'r', encoding='utf-8') as f:
+        assert f.read() == 'def one():\n    return 1\n\n\ndef two():\n    return 22\n'
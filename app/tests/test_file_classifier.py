@@ -0,0 +1,27 @@
+# test_file_classifier.py
+import os
+
+from app.utils.file_classifier import BINARY, TEXT, FileClassifier, has_binary_extension
+
+
+def test_skipped_extensions_and_dotfiles():
+    assert has_binary_extension(os.path.join('assets', 'Logo.PNG'))
+    assert has_binary_extension(os.path.join('project', '.cache'))
+    assert has_binary_extension(os.path.join('project', '.eslintcache'))
+    assert has_binary_extension('.eslintcache')
+    assert not has_binary_extension(os.path.join('project', '.gitignore'))
+    assert not has_binary_extension(os.path.join('project', 'cache'))
+    assert not has_binary_extension(os.path.join('project', 'main.py'))
+
+
+def test_dotfiles_in_the_skip_set_are_not_sniffed(tmp_path):
+    path = os.path.join(tmp_path, '.eslintcache')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"files": []}\n')
+    classifier = FileClassifier()
+    assert classifier.classify(path, os.stat(path)) == BINARY
+    assert not classifier.verdicts
+    other = os.path.join(tmp_path, '.prettierrc')
+    with open(other, 'w', encoding='utf-8') as f:
+        f.write('{}\n')
+    assert classifier.classify(other, os.stat(other)) == TEXT
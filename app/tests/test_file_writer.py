@@ -0,0 +1,190 @@
+# test_file_writer.py
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from app.utils import file_writer
+from app.utils.file_writer import WriteCoalescer, write_file_atomic, write_file_if_changed
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def test_atomic_write_keeps_mode_and_leaves_no_temp_files(tmp_path):
+    path = os.path.join(tmp_path, 'nested', 'script.sh')
+    write_file_atomic(path, 'echo 1\n')
+    os.chmod(path, 0o755)
+    write_file_atomic(path, 'echo 2\n')
+    assert read(path) == 'echo 2\n'
+    assert os.stat(path).st_mode & 0o777 == 0o755
+    assert os.listdir(os.path.dirname(path)) == ['script.sh']
+
+
+def test_identical_content_is_not_written(tmp_path):
+    path = os.path.join(tmp_path, 'main.py')
+    assert write_file_if_changed(path, 'print(1)\n')
+    mtime = os.stat(path).st_mtime_ns
+    assert not write_file_if_changed(path, 'print(1)\n')
+    assert os.stat(path).st_mtime_ns == mtime
+    assert write_file_if_changed(path, 'print(2)\n')
+
+
+def test_burst_is_coalesced_into_the_last_write(tmp_path):
+    path = os.path.join(tmp_path, 'main.py')
+    coalescer = WriteCoalescer(window_ms=50, max_delay_ms=500)
+
+    async def burst():
+        return await asyncio.gather(*(coalescer.write(path, f'print({number})\n') for number in range(5)))
+
+    results = asyncio.run(burst())
+    assert read(path) == 'print(4)\n'
+    assert coalescer.stats['written'] == 1 and coalescer.stats['coalesced'] == 4
+    assert [result['superseded'] for result in results] == [True, True, True, True, False]
+    assert not coalescer.pending and not coalescer.path_locks
+
+
+def test_writes_to_one_path_never_overlap(tmp_path, monkeypatch):
+    active = {}
+    concurrency = []
+    lock = threading.Lock()
+    write = file_writer.write_file_if_changed
+
+    def slow_write(path, content):
+        with lock:
+            active[path] = active.get(path, 0) + 1
+            concurrency.append((active[path], sum(active.values())))
+        time.sleep(0.02)
+        with lock:
+            active[path] -= 1
+        return write(path, content)
+
+    monkeypatch.setattr(file_writer, 'write_file_if_changed', slow_write)
+    coalescer = WriteCoalescer(window_ms=0, max_delay_ms=0)
+    first, second = os.path.join(tmp_path, 'a.py'), os.path.join(tmp_path, 'b.py')
+
+    async def writes():
+        await asyncio.gather(*(
+            coalescer.write(path, f'# {number}\n', coalesce=False)
+            for number in range(3) for path in (first, second)
+        ))
+
+    asyncio.run(writes())
+    assert max(same_path for same_path, _ in concurrency) == 1
+    assert max(total for _, total in concurrency) == 2  # Distinct paths are written in parallel
+    assert read(first) == read(second) == '# 2\n'
+
+
+def test_merge_waits_for_pending_writes(tmp_path):
+    path = os.path.join(tmp_path, 'main.py')
+    coalescer = WriteCoalescer(window_ms=50, max_delay_ms=500)
+
+    async def writes():
+        write = asyncio.ensure_future(coalescer.write(path, 'def main():\n    return 1\n'))
+        await asyncio.sleep(0)
+        merge = await coalescer.write(
+            path, '# ... existing code ...\ndef main():\n    return 2\n', merge=True)
+        await write
+        return merge
+
+    merge = asyncio.run(writes())
+    assert read(path) == 'def main():\n    return 2\n'
+    assert merge['hunks'][0]['status'] == 'applied'
+
+
+def test_uncoalesced_write_supersedes_pending_writes(tmp_path):
+    path = os.path.join(tmp_path, 'main.py')
+    coalescer = WriteCoalescer(window_ms=50, max_delay_ms=500)
+
+    async def writes():
+        coalesced = asyncio.ensure_future(coalescer.write(path, 'old\n'))
+        await asyncio.sleep(0)
+        restored = await coalescer.write(path, 'restored\n', coalesce=False)
+        return await coalesced, restored
+
+    coalesced, restored = asyncio.run(writes())
+    assert read(path) == 'restored\n'
+    assert coalesced['superseded'] and not restored['superseded']
+    assert coalescer.stats['written'] == 1 and not coalescer.pending and not coalescer.path_locks
+
+
+def test_writes_after_a_merge_are_not_applied_before_it(tmp_path):
+    path = os.path.join(tmp_path, 'main.py')
+    coalescer = WriteCoalescer(window_ms=50, max_delay_ms=500)
+
+    async def writes():
+        first = asyncio.ensure_future(coalescer.write(path, 'def main():\n    return 1\n'))
+        await asyncio.sleep(0)
+        merge = asyncio.ensure_future(coalescer.write(
+            path, '# ... existing code ...\ndef main():\n    return 2\n', merge=True))
+        await asyncio.sleep(0)
+        last = asyncio.ensure_future(coalescer.write(path, 'def main():\n    return 3\n'))
+        return await asyncio.gather(first, merge, last)
+
+    first, merge, last = asyncio.run(writes())
+    assert read(path) == 'def main():\n    return 3\n'
+    assert not first['superseded'] and merge['hunks'][0]['status'] == 'applied'
+
+
+def test_new_files_get_free_names_and_failed_writes_leave_no_claim(tmp_path, monkeypatch):
+    path = os.path.join(tmp_path, 'app.py')
+    coalescer = WriteCoalescer()
+
+    async def write_new():
+        return await coalescer.write_new(path, 'print(1)\n')
+
+    assert asyncio.run(write_new())[0] == path
+    written, result = asyncio.run(write_new())
+    assert written == os.path.join(tmp_path, 'app(1).py') and not result['unchanged']
+    assert read(written) == 'print(1)\n'
+
+    def failing_write(path, content):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(file_writer, 'write_file_if_changed', failing_write)
+    with pytest.raises(OSError):
+        asyncio.run(write_new())
+    assert sorted(os.listdir(tmp_path)) == ['app(1).py', 'app.py']
+
+
+def test_identical_save_reports_unchanged_and_keeps_the_file(tmp_path):
+    path = os.path.join(tmp_path, 'main.py')
+    coalescer = WriteCoalescer(window_ms=0, max_delay_ms=0)
+
+    async def save():
+        return await coalescer.write(path, 'print(1)\n')
+
+    assert not asyncio.run(save())['unchanged']
+    before = os.stat(path)
+    result = asyncio.run(save())
+    after = os.stat(path)
+    assert result['unchanged']
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+    assert coalescer.stats['written'] == 1 and coalescer.stats['unchanged'] == 1
+
+
+def test_writes_after_a_batch_are_not_applied_before_it(tmp_path):
+    first, second = os.path.join(tmp_path, 'a.py'), os.path.join(tmp_path, 'b.py')
+    coalescer = WriteCoalescer(window_ms=50, max_delay_ms=500)
+
+    async def writes():
+        pending = asyncio.ensure_future(coalescer.write(first, 'pending\n'))
+        await asyncio.sleep(0)
+        await coalescer.acquire_path(first)  # Something else, like a hook, holds the first path
+        batch = asyncio.ensure_future(coalescer.write_batch([(first, 'batch\n', False), (second, 'batch\n', False)]))
+        await asyncio.sleep(0)
+        # Arrives while the batch waits for the first path, and must still wait for it on the second
+        last = asyncio.ensure_future(coalescer.write(second, 'last\n', coalesce=False))
+        await asyncio.sleep(0.01)
+        assert not os.path.exists(second)
+        coalescer.release_path(first)
+        return await asyncio.gather(pending, batch, last)
+
+    pending, batch, last = asyncio.run(writes())
+    assert batch['committed'] and read(first) == 'batch\n' and read(second) == 'last\n'
+    assert not pending['superseded']
+    assert not coalescer.pending and not coalescer.path_locks
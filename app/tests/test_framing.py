@@ -0,0 +1,86 @@
+# test_framing.py
+import asyncio
+import hashlib
+import json
+import os
+
+import pytest
+
+from app.utils import framing
+from app.utils.framing import FRAMING_BATCH, FRAMING_CONTENT, FrameWriter, decode_text
+from app.utils.hash_cache import get_hash_cache
+
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send(self, frame):
+        self.frames.append(frame)
+
+    def messages(self):
+        return [json.loads(frame) for frame in self.frames]
+
+
+def record(path, content):
+    return {'filePath': path, 'content': content, 'hash': '', 'size': len(content)}
+
+
+def send(writer, records):
+    async def run():
+        for item in records:
+            await writer.send_file(item, get_hash_cache())
+        await writer.flush()
+    asyncio.run(run())
+
+
+def test_content_framing_sends_one_frame_per_file():
+    websocket = RecordingWebSocket()
+    send(FrameWriter(websocket, None, FRAMING_CONTENT), [record('a.py', 'a'), record('b.py', 'b')])
+    assert [(message['type'], message['filePath']) for message in websocket.messages()] == [
+        ('FILE_CONTENT', 'a.py'), ('FILE_CONTENT', 'b.py')]
+
+
+def test_batch_framing_packs_files(monkeypatch):
+    monkeypatch.setattr(framing, 'SYNC_BATCH_MAX_FILES', 2)
+    websocket = RecordingWebSocket()
+    send(FrameWriter(websocket, None, FRAMING_BATCH), [record(f'{name}.py', name) for name in 'abcde'])
+    batches = [[file['filePath'] for file in message['files']] for message in websocket.messages()]
+    assert batches == [['a.py', 'b.py'], ['c.py', 'd.py'], ['e.py']]
+
+
+def stream(tmp_path, raw, monkeypatch):
+    monkeypatch.setattr(framing, 'SYNC_CHUNK_BYTES', 4)
+    path = os.path.join(tmp_path, 'large.txt')
+    with open(path, 'wb') as f:
+        f.write(raw)
+    websocket = RecordingWebSocket()
+    writer = FrameWriter(websocket, None, FRAMING_BATCH)
+    send(writer, [record('small.py', 'x'), {'filePath': path, 'size': len(raw), 'stat': os.stat(path)}])
+    messages = websocket.messages()
+    assert messages[0]['type'] == 'FILE_BATCH'  # Pending batch goes out before the stream
+    return path, messages[1:]
+
+
+def test_large_files_are_streamed_in_chunks(tmp_path, monkeypatch):
+    raw = 'ab\r\ncd\r\né€ and more\rlines\n'.encode('utf-8')
+    path, chunks = stream(tmp_path, raw, monkeypatch)
+    assert len(chunks) > 3
+    assert [chunk['index'] for chunk in chunks] == list(range(len(chunks)))
+    assert [chunk['final'] for chunk in chunks] == [False] * (len(chunks) - 1) + [True]
+    assert ''.join(chunk['content'] for chunk in chunks) == decode_text(raw)
+    assert chunks[-1]['hash'] == hashlib.sha256(raw).hexdigest() and chunks[-1]['size'] == len(raw)
+    assert get_hash_cache().get_digest(path, os.stat(path)) == hashlib.sha256(raw).hexdigest()
+
+
+def test_invalid_utf8_ends_the_stream_with_an_error(tmp_path, monkeypatch):
+    _, chunks = stream(tmp_path, b'valid text\xff\xfe', monkeypatch)
+    assert chunks[-1]['final'] and chunks[-1]['error'] == 'File is not valid UTF-8.'
+
+
+def test_zstd_frames_decompress_to_the_message():
+    zstandard = pytest.importorskip('zstandard')
+    websocket = RecordingWebSocket()
+    send(FrameWriter(websocket, None, FRAMING_CONTENT, framing.COMPRESSION_ZSTD), [record('a.py', 'a' * 1000)])
+    message = json.loads(zstandard.ZstdDecompressor().decompress(websocket.frames[0]))
+    assert message['content'] == 'a' * 1000
@@ -0,0 +1,78 @@
+# test_git_utils.py
+import asyncio
+import os
+import subprocess
+
+from app.utils import git_utils
+from app.utils.file_writer import write_file_if_changed
+from app.utils.git_utils import get_tracked_files, invalidate_tracked_files
+
+
+def write(path, content=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def tracked(destination):
+    return sorted(asyncio.run(get_tracked_files(destination)))
+
+
+def test_new_files_invalidate_the_cache(tmp_path):
+    destination = str(tmp_path)
+    subprocess.run(['git', 'init', '-q', destination], check=True)
+    write(os.path.join(destination, '.gitignore'), '*.log\nbuild/\n')
+    write(os.path.join(destination, 'main.py'))
+    write(os.path.join(destination, 'logs', 'run.log'))
+    os.makedirs(os.path.join(destination, 'empty'))
+    invalidate_tracked_files()
+    assert tracked(destination) == ['.gitignore', 'main.py']
+
+    # Directories with no listed files: only ignored files, or none at all
+    write(os.path.join(destination, 'logs', 'notes.txt'))
+    assert tracked(destination) == ['.gitignore', 'logs/notes.txt', 'main.py']
+    write(os.path.join(destination, 'empty', 'new.py'))
+    assert tracked(destination) == ['.gitignore', 'empty/new.py', 'logs/notes.txt', 'main.py']
+
+    # Ignored directories are neither listed nor walked
+    write(os.path.join(destination, 'build', 'out.py'))
+    assert git_utils._tracked_files_cache[destination]['ignored'] == set()
+    invalidate_tracked_files()
+    assert tracked(destination) == ['.gitignore', 'empty/new.py', 'logs/notes.txt', 'main.py']
+    assert git_utils._tracked_files_cache[destination]['ignored'] == {'build'}
+    write(os.path.join(destination, 'build', 'more.py'))
+    assert tracked(destination) == ['.gitignore', 'empty/new.py', 'logs/notes.txt', 'main.py']
+
+
+def test_excludes_file_changes_invalidate_the_cache(tmp_path):
+    destination = os.path.join(tmp_path, 'repo')
+    subprocess.run(['git', 'init', '-q', destination], check=True)
+    write(os.path.join(destination, 'main.py'))
+    write(os.path.join(destination, 'notes.md'))
+    excludes_file = os.path.join(tmp_path, 'ignore')
+    write(excludes_file, '*.md\n')
+    invalidate_tracked_files()
+    assert tracked(destination) == ['main.py', 'notes.md']
+
+    subprocess.run(['git', 'config', 'core.excludesFile', excludes_file], cwd=destination, check=True)
+    assert tracked(destination) == ['main.py']
+    write(excludes_file, '*.py\n')
+    assert tracked(destination) == ['notes.md']
+
+
+def test_deep_changes_are_seen_when_created_here_or_after_the_max_age(monkeypatch, tmp_path):
+    destination = str(tmp_path)
+    subprocess.run(['git', 'init', '-q', destination], check=True)
+    write(os.path.join(destination, 'src', 'app', 'main.py'))
+    invalidate_tracked_files()
+    assert tracked(destination) == ['src/app/main.py']
+
+    # Below the top level nothing is stat'ed, so the listing is reused
+    write(os.path.join(destination, 'src', 'app', 'other.py'))
+    assert tracked(destination) == ['src/app/main.py']
+    monkeypatch.setattr(git_utils, 'TRACKED_FILES_CACHE_MAX_AGE_S', 0)
+    assert tracked(destination) == ['src/app/main.py', 'src/app/other.py']
+
+    monkeypatch.setattr(git_utils, 'TRACKED_FILES_CACHE_MAX_AGE_S', 3600)
+    write_file_if_changed(os.path.join(destination, 'src', 'app', 'saved.py'), 'x = 1\n')
+    assert tracked(destination) == ['src/app/main.py', 'src/app/other.py', 'src/app/saved.py']
@@ -0,0 +1,159 @@
+# test_hook_runner.py
+import asyncio
+import json
+import os
+import sys
+
+from app.utils.file_writer import get_write_coalescer
+from app.utils.hook_runner import Hook, HookBatch, HookRunner, load_hook_runner
+from app.utils.version_store import get_version_store
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def python_hook(name, script, timeout=10):
+    return Hook(name, ['.py'], [sys.executable, '-c', script, '{paths}'], timeout=timeout)
+
+
+def run_now(runner, path):
+    batch = HookBatch()
+    batch.paths[path] = None
+    return asyncio.run(runner.run(runner.hooks[0], os.path.dirname(path), batch))
+
+
+class RecordingRunner(HookRunner):
+    """
+    Records the batches instead of running processes.
+    """
+
+    def __init__(self, *args, delay=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+
+    async def execute(self, hook, directory, paths):
+        self.calls.append((hook.name, directory, sorted(paths)))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        return {'type': 'HOOK_RESULT', 'hook': hook.name, 'status': 'success', 'output': '', 'durationMs': 0}
+
+
+def test_paths_are_grouped_per_hook_and_directory(tmp_path):
+    first, second = os.path.join(tmp_path, 'a', 'one.py'), os.path.join(tmp_path, 'a', 'two.py')
+    other = os.path.join(tmp_path, 'b', 'three.py')
+    for path in (first, second, other):
+        write(path, 'x = 1\n')
+    runner = RecordingRunner([python_hook('fmt', 'pass')], debounce_ms=50)
+
+    async def scenario():
+        assert runner.schedule(first) == 1
+        await asyncio.sleep(0.02)
+        runner.schedule(second)
+        runner.schedule(other)
+        assert runner.schedule(os.path.join(tmp_path, 'a', 'notes.txt')) == 0
+        await asyncio.sleep(0.03)
+        assert not runner.calls  # The window restarted with the second path
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    assert sorted(runner.calls) == [
+        ('fmt', os.path.join(tmp_path, 'a'), sorted([first, second])),
+        ('fmt', os.path.join(tmp_path, 'b'), [other])
+    ]
+
+
+def test_concurrency_is_bounded(tmp_path):
+    paths = [os.path.join(tmp_path, str(number), 'main.py') for number in range(5)]
+    for path in paths:
+        write(path, 'x = 1\n')
+    runner = RecordingRunner([python_hook('fmt', 'pass')], debounce_ms=0, concurrency=2, delay=0.05)
+
+    async def scenario():
+        for path in paths:
+            runner.schedule(path)
+        await runner.drain()
+
+    asyncio.run(scenario())
+    assert len(runner.calls) == 5 and runner.max_active == 2
+
+
+def test_slow_hooks_are_killed(tmp_path):
+    path = os.path.join(tmp_path, 'main.py')
+    write(path, 'x = 1\n')
+    runner = HookRunner([python_hook('slow', 'import time; time.sleep(30)', timeout=0.2)], debounce_ms=0)
+    result = run_now(runner, path)
+    assert result['status'] == 'timeout' and result['returncode'] is None
+    assert result['durationMs'] < 10000
+
+
+def test_drain_runs_queued_batches_at_once(tmp_path):
+    path = os.path.join(tmp_path, 'main.py')
+    write(path, 'x = 1\n')
+    script = 'import sys; open(sys.argv[1] + ".ran", "w").close()'
+    runner = HookRunner([python_hook('touch', script)], debounce_ms=60000)
+
+    async def scenario():
+        runner.schedule(path)
+        await runner.drain()
+
+    asyncio.run(scenario())
+    assert os.path.exists(path + '.ran')
+
+
+def test_hook_holds_the_path_locks(tmp_path):
+    path = os.path.join(tmp_path, 'main.py')
+    write(path, 'old\n')
+    # Reads, takes its time, then writes: a formatter working on the old content
+    script = ('import sys, time; path = sys.argv[1]; content = open(path).read(); '
+              'time.sleep(0.3); open(path, "w").write(content.upper())')
+    runner = HookRunner([python_hook('upper', script)], debounce_ms=0)
+    results = []
+
+    async def scenario():
+        runner.schedule(path)
+        await asyncio.sleep(0.15)
+        await get_write_coalescer().write(path, 'new\n', coalesce=False)
+        results.append(read(path))
+        await runner.drain()
+
+    asyncio.run(scenario())
+    # The save waited for the hook instead of being overwritten by it
+    assert results == ['new\n'] and read(path) == 'new\n'
+
+
+def test_hook_result_lists_changed_paths(tmp_path):
+    path = os.path.join(tmp_path, 'main.py')
+    write(path, 'old\n')
+    script = 'import sys; path = sys.argv[1]; content = open(path).read(); open(path, "w").write(content.upper())'
+    result = run_now(HookRunner([python_hook('upper', script)], debounce_ms=0), path)
+    assert result['status'] == 'success' and result['changed'] == [path]
+    assert read(path) == 'OLD\n'
+    # The content the hook replaced can be restored
+    versions = get_version_store(path).list_versions(path)
+    assert [version['reason'] for version in versions] == ['hook:upper']
+    assert get_version_store(path).read_version(path, versions[0]['hash']) == b'old\n'
+
+
+def test_invalid_config_configures_no_hooks(tmp_path):
+    config_path = os.path.join(tmp_path, 'hooks.json')
+    write(config_path, json.dumps({'hooks': [{'name': 'broken', 'command': ['true']}]}))
+    assert load_hook_runner(config_path).hooks == []
+    write(config_path, '{"hooks": [')
+    assert load_hook_runner(config_path).hooks == []
+    assert load_hook_runner(os.path.join(tmp_path, 'missing.json')).hooks == []
+    write(config_path, json.dumps({'hooks': [{'extensions': ['.py'], 'command': 'black -q {paths}'}]}))
+    hooks = load_hook_runner(config_path).hooks
+    assert [hook.name for hook in hooks] == ['black'] and hooks[0].command == ['black', '-q', '{paths}']
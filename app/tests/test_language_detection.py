@@ -0,0 +1,34 @@
+# test_language_detection.py
+import json
+import os
+
+from app.utils.language_detection import detect_language
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'language_detection_corpus.json')
+
+
+def load_corpus():
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_detection_accuracy():
+    misses = []
+    for case in load_corpus():
+        detection = detect_language(case['content'], case.get('language'))
+        extension = detection.extension if detection else None
+        if extension != case['expected']:
+            misses.append((case['content'][:40], case['expected'], extension))
+    assert not misses, misses
+
+
+def test_confidence_is_bounded():
+    for case in load_corpus():
+        detection = detect_language(case['content'], case.get('language'))
+        if detection:
+            assert 0 < detection.confidence <= 1
+
+
+if __name__ == "__main__":
+    test_detection_accuracy()
+    test_confidence_is_bounded()
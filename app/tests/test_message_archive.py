@@ -0,0 +1,134 @@
+# test_message_archive.py
+import os
+
+import pytest
+
+from app.utils import archive_cli
+from app.utils.archive_codec import CODEC_NONE
+from app.utils.message_archive import ArchiveLockedError, MessageArchive, segment_name
+
+
+def open_archive(tmp_path, **options):
+    options.setdefault('segment_bytes', 1024)
+    options.setdefault('codec', CODEC_NONE)
+    return MessageArchive(os.path.join(tmp_path, 'messages'), **options)
+
+
+def archive_content(number):
+    return f'<div>message {number} ' + 'x' * 100 + '</div>'
+
+
+def fill(archive, count, start=0):
+    for number in range(start, start + count):
+        archive.append(f'msg-{1000 + number}', archive_content(number), f'/project/{number}')
+
+
+def files(tmp_path):
+    return sorted(os.listdir(os.path.join(tmp_path, 'messages')))
+
+
+def test_append_read_and_reopen(tmp_path):
+    archive = open_archive(tmp_path)
+    fill(archive, 30)
+    message = archive.read('msg-1007')
+    assert message.content.startswith('<div>message 7 ') and message.path == '/project/7'
+    assert message.timestamp == 1007
+    assert archive.read('unknown') is None
+    archive.close()
+
+    assert segment_name(1, '.idx') in files(tmp_path)  # Sealed segments have an index
+    reopened = open_archive(tmp_path)
+    assert len(reopened) == 30
+    assert reopened.read('msg-1029').content == archive_content(29)
+    reopened.close()
+
+
+def test_list_messages_newest_first_with_ranges(tmp_path):
+    archive = open_archive(tmp_path)
+    fill(archive, 10)
+    assert [message_id for _, message_id in archive.list_messages(limit=3)] == ['msg-1009', 'msg-1008', 'msg-1007']
+    assert [timestamp for timestamp, _ in archive.list_messages(since=1002, until=1005)] == [1004, 1003, 1002]
+    archive.append('msg-1003', 'updated', timestamp=2000)
+    assert archive.list_messages(limit=1) == [(2000, 'msg-1003')]
+    assert len(archive.list_messages()) == 10
+    archive.close()
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    archive = open_archive(tmp_path, segment_bytes=1 << 20)
+    fill(archive, 3)
+    archive.close()
+    path = os.path.join(tmp_path, 'messages', segment_name(1))
+    size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(b'CTFM\x00\x00\x01\x00partial')
+
+    readonly = open_archive(tmp_path, readonly=True, segment_bytes=1 << 20)
+    assert len(readonly) == 3 and os.path.getsize(path) > size  # Never modified read-only
+    readonly.close()
+    reopened = open_archive(tmp_path, segment_bytes=1 << 20)
+    assert len(reopened) == 3 and os.path.getsize(path) == size
+    reopened.append('msg-2000', 'after the crash')
+    assert reopened.read('msg-2000').content == 'after the crash'
+    reopened.close()
+
+
+def test_corrupt_record_ends_the_scan(tmp_path):
+    archive = open_archive(tmp_path, segment_bytes=1 << 20)
+    fill(archive, 3)
+    archive.close()
+    path = os.path.join(tmp_path, 'messages', segment_name(1))
+    with open(path, 'r+b') as f:
+        f.seek(os.path.getsize(path) - 10)
+        f.write(b'!')
+    reopened = open_archive(tmp_path, segment_bytes=1 << 20, readonly=True)
+    assert 'msg-1002' not in reopened and reopened.read('msg-1001') is not None
+    reopened.close()
+
+
+def test_readonly_archive_rejects_writes(tmp_path):
+    readonly = open_archive(tmp_path, readonly=True)
+    assert len(readonly) == 0 and not os.path.exists(os.path.join(tmp_path, 'messages'))
+    with pytest.raises(PermissionError):
+        readonly.append('msg-1', 'content')
+    with pytest.raises(PermissionError):
+        readonly.compact()
+
+
+def test_compaction_keeps_the_latest_records(tmp_path):
+    archive = open_archive(tmp_path)
+    fill(archive, 30)
+    # Supersede every message, then seal the segments they were written to
+    for number in range(30):
+        archive.append(f'msg-{1000 + number}', f'v2 {number}')
+    fill(archive, 20, start=100)
+    segments_before = [name for name in files(tmp_path) if name.endswith('.log')]
+    assert archive.compact() > 0
+    assert len([name for name in files(tmp_path) if name.endswith('.log')]) < len(segments_before)
+    assert archive.read('msg-1005').content == 'v2 5'
+    assert archive.read('msg-1105').content == archive_content(105)
+    assert archive.compact() == 0
+    archive.close()
+
+    reopened = open_archive(tmp_path)
+    assert len(reopened) == 50
+    assert all(reopened.read(f'msg-{1000 + number}').content == f'v2 {number}' for number in range(30))
+    reopened.close()
+
+
+def test_one_writer_at_a_time(tmp_path, capsys):
+    archive = open_archive(tmp_path)
+    fill(archive, 3)
+    with pytest.raises(ArchiveLockedError):
+        open_archive(tmp_path)
+    directory = os.path.join(tmp_path, 'messages')
+    assert archive_cli.main(['--directory', directory, 'compact']) == 1
+    assert 'Stop the server' in capsys.readouterr().err
+    # Readers need no lock
+    assert archive_cli.main(['--directory', directory, 'show', 'msg-1001']) == 0
+    archive.close()
+
+    assert archive_cli.main(['--directory', directory, 'compact']) == 0
+    reopened = open_archive(tmp_path)
+    assert len(reopened) == 3
+    reopened.close()
@@ -0,0 +1,68 @@
+# test_message_store.py
+import asyncio
+import os
+
+from app.managers import message_manager
+from app.managers.message_manager import MessageStore, MessageWriter
+from app.utils.dedup_index import DedupIndex
+from app.utils.message_archive import MessageArchive
+from app.utils.search_index import SearchIndex
+
+
+def message(content):
+    return {'content': content, 'file_path': None, 'hash': content}
+
+
+def test_count_bound_evicts_least_recently_used():
+    store = MessageStore(max_messages=3, max_bytes=1 << 20)
+    for number in range(3):
+        store.add(f'm{number}', message(f'content {number}'))
+    assert store.get('m0')['content'] == 'content 0'  # m0 is now the most recently used
+    store.add('m3', message('content 3'))
+    assert list(store.messages) == ['m2', 'm0', 'm3']
+    assert store.stats['evicted'] == 1
+
+
+def test_byte_bound_counts_utf8_content():
+    store = MessageStore(max_messages=100, max_bytes=10)
+    store.add('m1', message('ééé'))  # 6 bytes
+    store.add('m2', message('abcd'))
+    assert store.total_bytes == 10 and len(store) == 2
+    store.add('m3', message('x'))
+    assert list(store.messages) == ['m2', 'm3'] and store.total_bytes == 5
+    store.add('m2', message('abcdefgh'))  # Replacing a message updates its size
+    assert list(store.messages) == ['m3', 'm2'] and store.total_bytes == 9
+
+
+def test_evicted_messages_are_read_back_from_the_writer_and_the_archive(monkeypatch, tmp_path):
+    archive = MessageArchive(os.path.join(tmp_path, 'messages'))
+    search_index = SearchIndex(os.path.join(tmp_path, 'search.sqlite3'))
+    monkeypatch.setattr(message_manager, 'get_message_archive', lambda: archive)
+    monkeypatch.setattr(message_manager, 'get_dedup_index', lambda: DedupIndex(os.path.join(tmp_path, 'dedup.jsonl')))
+    monkeypatch.setattr(message_manager, 'get_search_index', lambda: search_index)
+    monkeypatch.setattr(message_manager, 'message_writer', MessageWriter())
+    store = MessageStore(max_messages=1)
+    monkeypatch.setattr(message_manager, 'message_store', store)
+    appended = []
+    append = archive.append
+
+    def recording_append(*args, **kwargs):
+        appended.append(args[0])
+        return append(*args, **kwargs)
+
+    monkeypatch.setattr(archive, 'append', recording_append)
+
+    async def scenario():
+        await message_manager.store_message('<div>first</div>', 'm1')
+        await message_manager.store_message('<div>second</div>', 'm2')
+        # Evicted without touching the archive, and still queued
+        assert 'm1' not in store.messages and not appended
+        assert store.get('m1')['content'] == '<div>first</div>'
+        await message_manager.message_writer.drain()
+
+    asyncio.run(scenario())
+    assert appended == ['m1', 'm2']
+    assert store.get('m1')['content'] == '<div>first</div>' and store.stats['archive_reads'] == 1
+    assert store.get('unknown') is None
+    search_index.close()
+    archive.close()
@@ -0,0 +1,116 @@
+# test_message_writer.py
+import asyncio
+import os
+
+from app.managers import message_manager
+from app.managers.message_manager import MessageWriter
+from app.utils.dedup_index import DedupIndex
+from app.utils.message_archive import MessageArchive
+from app.utils.search_index import SearchIndex
+
+
+def use_tmp_stores(monkeypatch, tmp_path):
+    archive = MessageArchive(os.path.join(tmp_path, 'messages'))
+    dedup_index = DedupIndex(os.path.join(tmp_path, 'dedup_index.jsonl'))
+    search_index = SearchIndex(os.path.join(tmp_path, 'search.sqlite3'))
+    monkeypatch.setattr(message_manager, 'get_message_archive', lambda: archive)
+    monkeypatch.setattr(message_manager, 'get_dedup_index', lambda: dedup_index)
+    monkeypatch.setattr(message_manager, 'get_search_index', lambda: search_index)
+    return archive, dedup_index, search_index
+
+
+def message(content):
+    return {'content': content, 'file_path': None, 'hash': content}
+
+
+def test_writer_archives_and_indexes(monkeypatch, tmp_path):
+    archive, dedup_index, search_index = use_tmp_stores(monkeypatch, tmp_path)
+    writer = MessageWriter(batch_size=4)
+
+    async def scenario():
+        for number in range(10):
+            await writer.submit(f'm{number}', message(f'<div>message number{number}</div>'))
+        await writer.drain()
+
+    asyncio.run(scenario())
+    assert len(archive) == 10 and not writer.pending
+    assert dedup_index.lookup('assistant', 'm3', '<div>message number3</div>') is not None
+    assert [result.id for result in search_index.search('number7')] == ['m7']
+    search_index.close()
+    archive.close()
+
+
+def test_message_resent_during_flush_is_kept(monkeypatch, tmp_path):
+    archive, _, search_index = use_tmp_stores(monkeypatch, tmp_path)
+    writer = MessageWriter(batch_size=4)
+    append = archive.append
+    resent = message('<div>second</div>')
+    loops = []
+
+    def append_and_resend(message_id, content, path=None, timestamp=None):
+        entry = append(message_id, content, path, timestamp)
+        if content == '<div>first</div>':
+            # Runs in the executor while the event loop is free to take the re-send
+            asyncio.run_coroutine_threadsafe(writer.submit('m1', resent), loops[0]).result()
+        return entry
+
+    monkeypatch.setattr(archive, 'append', append_and_resend)
+
+    async def scenario():
+        loops.append(asyncio.get_running_loop())
+        await writer.submit('m1', message('<div>first</div>'))
+        await writer.drain()
+
+    asyncio.run(scenario())
+    assert archive.read('m1').content == '<div>second</div>'
+    assert not writer.pending
+    search_index.close()
+    archive.close()
+
+
+def test_failed_batches_are_retried(monkeypatch, tmp_path):
+    archive, _, search_index = use_tmp_stores(monkeypatch, tmp_path)
+    monkeypatch.setattr(message_manager, 'RETRY_DELAY_MIN', 0.01)
+    writer = MessageWriter()
+    append = archive.append
+    failures = []
+
+    def failing_append(message_id, content, path=None, timestamp=None):
+        if len(failures) < 2:
+            failures.append(message_id)
+            raise OSError('disk full')
+        return append(message_id, content, path, timestamp)
+
+    monkeypatch.setattr(archive, 'append', failing_append)
+
+    async def scenario():
+        await writer.submit('m1', message('<div>first</div>'))
+        await asyncio.sleep(0)
+        assert writer.pending  # Still readable while the batch is retried
+        await writer.drain()
+
+    asyncio.run(scenario())
+    assert failures == ['m1', 'm1']
+    assert archive.read('m1').content == '<div>first</div>' and not writer.pending
+    search_index.close()
+    archive.close()
+
+
+def test_drain_gives_up_after_the_timeout(monkeypatch, tmp_path):
+    archive, _, search_index = use_tmp_stores(monkeypatch, tmp_path)
+    monkeypatch.setattr(message_manager, 'RETRY_DELAY_MIN', 0.01)
+    writer = MessageWriter()
+
+    def broken_append(message_id, content, path=None, timestamp=None):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(archive, 'append', broken_append)
+
+    async def scenario():
+        await writer.submit('m1', message('<div>first</div>'))
+        await writer.drain(timeout=0.1)
+
+    asyncio.run(scenario())
+    assert writer.task is None and 'm1' in writer.pending
+    search_index.close()
+    archive.close()
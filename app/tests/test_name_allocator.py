@@ -0,0 +1,60 @@
+# test_name_allocator.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.name_allocator import NameAllocator, split_name
+
+
+def touch(path):
+    with open(path, 'w', encoding='utf-8'):
+        pass
+
+
+def test_split_name():
+    assert split_name('a(3).py') == ('a', '.py', 3)
+    assert split_name('a.py') == ('a', '.py', 0)
+    assert split_name('Makefile') == ('Makefile', '', 0)
+    assert split_name('a(x).py') == ('a(x)', '.py', 0)
+
+
+def test_claims_the_plain_name_then_the_next_counter(tmp_path):
+    allocator = NameAllocator()
+    path = os.path.join(tmp_path, 'app.py')
+    assert allocator.claim(path) == path
+    assert allocator.claim(path) == os.path.join(tmp_path, 'app(1).py')
+    touch(os.path.join(tmp_path, 'other.py'))
+    assert allocator.claim(path) == os.path.join(tmp_path, 'app(2).py')
+
+
+def test_continues_after_the_highest_counter_on_disk(tmp_path):
+    for name in ('app.py', 'app(1).py', 'app(7).py', 'app(2).js'):
+        touch(os.path.join(tmp_path, name))
+    assert NameAllocator().claim(os.path.join(tmp_path, 'app.py')) == os.path.join(tmp_path, 'app(8).py')
+
+
+def test_files_created_behind_its_back_are_skipped(tmp_path):
+    allocator = NameAllocator()
+    path = os.path.join(tmp_path, 'app.py')
+    assert allocator.claim(path) == path
+    touch(os.path.join(tmp_path, 'app(1).py'))
+    assert allocator.claim(path) == os.path.join(tmp_path, 'app(2).py')
+
+
+def test_concurrent_claims_get_distinct_names(tmp_path):
+    allocator = NameAllocator()
+    path = os.path.join(tmp_path, 'app.py')
+    with ThreadPoolExecutor(8) as executor:
+        claimed = list(executor.map(lambda _: allocator.claim(path), range(32)))
+    assert len(set(claimed)) == 32
+    assert len(os.listdir(tmp_path)) == 32
+
+
+def test_release_removes_unwritten_claims_only(tmp_path):
+    allocator = NameAllocator()
+    unwritten = allocator.claim(os.path.join(tmp_path, 'a.py'))
+    written = allocator.claim(os.path.join(tmp_path, 'b.py'))
+    with open(written, 'w', encoding='utf-8') as f:
+        f.write('print(1)\n')
+    allocator.release(unwritten)
+    allocator.release(written)
+    assert os.listdir(tmp_path) == ['b.py']
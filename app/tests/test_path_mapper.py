@@ -0,0 +1,31 @@
+# test_path_mapper.py
+import os
+
+import pytest
+
+from app.utils.path_mapper import PathMapper, PathMappingError
+
+
+def test_foreign_prefix_is_mapped_to_local_root(tmp_path):
+    root = os.path.join(tmp_path, 'project')
+    os.makedirs(os.path.join(root, 'app'))
+    mapper = PathMapper([('Z:/home/user/project', root)])
+    assert mapper.resolve('Z:\\home\\user\\project\\app\\main.py') == os.path.join(root, 'app', 'main.py')
+    with pytest.raises(PathMappingError):
+        mapper.resolve('Z:/home/user/project/../secrets.txt')
+    with pytest.raises(PathMappingError):
+        mapper.resolve('/elsewhere/main.py')
+
+
+def test_directory_swapped_for_symlink_is_rejected(tmp_path):
+    root = os.path.join(tmp_path, 'project')
+    outside = os.path.join(tmp_path, 'outside')
+    os.makedirs(os.path.join(root, 'app'))
+    os.makedirs(outside)
+    mapper = PathMapper(roots=[root])
+    assert mapper.resolve(os.path.join(root, 'app', 'main.py')) == os.path.join(root, 'app', 'main.py')
+
+    os.rmdir(os.path.join(root, 'app'))
+    os.symlink(outside, os.path.join(root, 'app'))
+    with pytest.raises(PathMappingError):
+        mapper.resolve(os.path.join(root, 'app', 'main.py'))
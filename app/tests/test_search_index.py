@@ -0,0 +1,57 @@
+# test_search_index.py
+import os
+
+from app.utils.message_archive import MessageArchive
+from app.utils.search_index import SearchIndex, extract_message
+
+MESSAGE = '''<div data-message-author-role="assistant" data-message-model-slug="gpt-4o">
+<div class="markdown prose"><p>Store the settings as JSON:</p>
+<pre><div class="code-header">json</div><code class="language-json">{"a": 1}</code></pre>
+<p>Then load them in Python:</p>
+<pre><div class="code-header">python</div><code class="language-python"># Path: app/config/loader.py
+import json
+
+
+def load_settings(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+</code></pre></div></div>'''
+
+
+def test_extract_message_without_detected_language():
+    fields = extract_message('<div>hello <pre>{"a": 1}</pre></div>')
+    assert fields['text'] == 'hello'
+    assert fields['code'] == '{"a": 1}'
+
+
+def test_extract_message_markup():
+    fields = extract_message(MESSAGE)
+    assert fields['model_slug'] == 'gpt-4o'
+    assert 'load them in Python' in fields['text']
+    assert 'def load_settings' in fields['code']
+    assert 'app/config/loader.py' in fields['paths']
+
+
+def test_search_skips_messages_that_fail(tmp_path):
+    index = SearchIndex(os.path.join(tmp_path, 'search.sqlite3'))
+    indexed = index.add_messages([
+        ('good', 1, 'project', MESSAGE),
+        ('bad', 2, 'project', None),
+        ('plain', 3, None, '<div>hello <pre>{"a": 1}</pre></div>')
+    ])
+    assert indexed == 2
+    assert [result.id for result in index.search('load_settings')] == ['good']
+    assert [result.id for result in index.search('hello')] == ['plain']
+    index.close()
+
+
+def test_rebuild_from_archive(tmp_path):
+    archive = MessageArchive(os.path.join(tmp_path, 'archive'))
+    archive.append('first', MESSAGE, 'project')
+    archive.append('second', '<div>hello <pre>{"a": 1}</pre></div>')
+    archive.sync()
+    index = SearchIndex(os.path.join(tmp_path, 'search.sqlite3'))
+    assert index.rebuild(archive) == 2
+    assert [result.id for result in index.search('loader.py')] == ['first']
+    index.close()
+    archive.close()
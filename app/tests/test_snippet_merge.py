@@ -0,0 +1,139 @@
+# test_snippet_merge.py
+import os
+
+import pytest
+
+from app.utils.file_writer import merge_file
+from app.utils.snippet_merge import MergeError, has_elision, is_elision, merge_snippet
+
+ORIGINAL = '''class A:
+    def __init__(self):
+        self.x = 0
+        self.y = 1
+
+    def total(self):
+        return self.x + self.y
+
+
+class B:
+    def __init__(self):
+        self.x = 0
+        self.y = 1
+
+    def total(self):
+        return self.x * self.y
+'''
+
+
+def test_edit_inside_a_class():
+    snippet = '''# ... existing code ...
+class B:
+    def __init__(self):
+        self.x = 0
+        self.y = 2
+# ... existing code ...'''
+    merged, results = merge_snippet(ORIGINAL, snippet)
+    assert merged == ORIGINAL.replace('self.y = 1\n\n    def total(self):\n        return self.x * self.y',
+                                      'self.y = 2\n\n    def total(self):\n        return self.x * self.y')
+    assert merged.count('self.y = 1') == 1
+    assert [result['status'] for result in results] == ['applied']
+
+
+def test_edit_removing_lines_up_to_the_closing_brace():
+    original = ('function one() {\n  const x = 1;\n  const y = 2;\n  return x + y;\n}\n'
+                '\nfunction two() {\n  return 2;\n}\n')
+    snippet = '// ... existing code ...\nfunction one() {\n  const x = 1;\n  return x;\n}\n// ... existing code ...'
+    merged, results = merge_snippet(original, snippet)
+    assert merged == 'function one() {\n  const x = 1;\n  return x;\n}\n\nfunction two() {\n  return 2;\n}\n'
+    assert results[0]['removed'] == 5 and results[0]['added'] == 4
+
+
+def test_insert_between_lines():
+    snippet = '''# ... existing code ...
+    def total(self):
+        return self.x * self.y
+
+    def scale(self, factor):
+        self.x *= factor'''
+    merged, results = merge_snippet(ORIGINAL, snippet)
+    assert merged.endswith('return self.x * self.y\n\n    def scale(self, factor):\n        self.x *= factor\n')
+    assert merged.startswith(ORIGINAL.rstrip('\n'))
+    assert results[0]['status'] == 'applied'
+
+
+def test_append_new_function():
+    snippet = '''# ... existing code ...
+
+def make_b():
+    return B()'''
+    merged, results = merge_snippet(ORIGINAL, snippet)
+    assert merged == ORIGINAL.rstrip('\n') + '\n\ndef make_b():\n    return B()\n'
+    assert results == [{'hunk': 0, 'status': 'applied', 'startLine': 16, 'endLine': 16, 'removed': 0, 'added': 3}]
+
+
+def test_edit_replacing_the_tail_of_a_function():
+    original = ('def compute(x):\n    total = 0\n    y = x + 1\n    return y\n'
+                '\n\ndef other():\n    return y\n')
+    snippet = '    y = x + 1\n    z = y * 2\n    return z\n# ... rest of the file unchanged'
+    merged, results = merge_snippet(original, snippet)
+    assert merged == ('def compute(x):\n    total = 0\n    y = x + 1\n    z = y * 2\n    return z\n'
+                      '\n\ndef other():\n    return y\n')
+    assert results[0]['startLine'] == 3 and results[0]['endLine'] == 4
+
+
+def test_ambiguous_anchors_are_not_applied():
+    snippet = '''# ... existing code ...
+        self.x = 0
+        self.y = 5
+# ... existing code ...'''
+    with pytest.raises(MergeError):
+        merge_snippet(ORIGINAL, snippet)
+
+
+def test_snippet_with_an_unplaced_hunk_is_refused():
+    snippet = '''# ... existing code ...
+        self.x = 0
+        self.y = 5
+# ... existing code ...
+class B:
+    def __init__(self):
+        self.x = 7
+# ... existing code ...'''
+    with pytest.raises(MergeError) as error:
+        merge_snippet(ORIGINAL, snippet)
+    assert [result['status'] for result in error.value.hunks] == ['ambiguous', 'applied']
+
+
+def test_refused_merge_leaves_the_file_untouched(tmp_path):
+    path = os.path.join(tmp_path, 'main.py')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(ORIGINAL)
+    with pytest.raises(MergeError):
+        merge_file(path, '# ...\n        self.y = 5\n# ...\n'
+                         'class B:\n    def __init__(self):\n        self.x = 7\n# ...')
+    with open(path, 'r', encoding='utf-8') as f:
+        assert f.read() == ORIGINAL
+
+
+def test_unmatched_snippet_raises():
+    with pytest.raises(MergeError):
+        merge_snippet(ORIGINAL, '// ... existing code ...\nfunction unrelated() {}\n// ... existing code ...')
+
+
+def test_ordinary_comments_are_not_elisions():
+    for line in ('# call other functions first', '// TODO: refactor the rest of the file',
+                 '# Validate previous content before saving', ' * Returns the rest of the code', '#', '# ---'):
+        assert not is_elision(line), line
+    for line in ('# ...', '// ... existing code ...', '<!-- rest of the file unchanged -->',
+                 '/* ... */', '  # … remaining methods unchanged', '{/* existing code */}'):
+        assert is_elision(line), line
+    assert not has_elision('def main():\n    # call other functions first\n    run()\n')
+
+
+def test_merge_into_missing_file_writes_snippet(tmp_path):
+    path = os.path.join(tmp_path, 'new.py')
+    snippet = '# ... existing code ...\ndef main():\n    pass\n'
+    written, hunks = merge_file(path, snippet)
+    assert written and hunks is None
+    with open(path, 'r', encoding='utf-8') as f:
+        assert f.read() == snippet
@@ -0,0 +1,61 @@
+# test_version_store.py
+import os
+
+import pytest
+
+from app.utils.file_writer import write_file_if_changed
+from app.utils.version_store import VERSION_STORE_DIRNAME, VersionStore, get_version_store
+
+
+def make_project(tmp_path):
+    root = os.path.join(tmp_path, 'project')
+    os.makedirs(os.path.join(root, '.git'))
+    return root
+
+
+def test_saves_keep_the_replaced_versions(tmp_path):
+    root = make_project(tmp_path)
+    path = os.path.join(root, 'app', 'main.py')
+    for number in range(3):
+        write_file_if_changed(path, f'print({number})\n')
+    store = get_version_store(path)
+    assert store.directory == os.path.join(root, VERSION_STORE_DIRNAME)
+    versions = store.list_versions(path)
+    assert [entry['path'] for entry in versions] == ['app/main.py', 'app/main.py']
+    assert [store.read_version(path, entry['hash']) for entry in versions] == [b'print(1)\n', b'print(0)\n']
+    # The store ignores itself in git
+    with open(os.path.join(store.directory, '.gitignore'), 'r', encoding='utf-8') as f:
+        assert f.read() == '*\n'
+
+
+def test_identical_contents_are_stored_once(tmp_path):
+    root = make_project(tmp_path)
+    first, second = os.path.join(root, 'a.txt'), os.path.join(root, 'b.txt')
+    for path in (first, second):
+        write_file_if_changed(path, 'same\n')
+        write_file_if_changed(path, 'new\n')
+    store = get_version_store(first)
+    objects = [name for _, _, names in os.walk(os.path.join(store.directory, 'objects')) for name in names]
+    assert len(objects) == 1
+    assert len(store.list_versions(first)) == len(store.list_versions(second)) == 1
+
+
+def test_unchanged_latest_version_is_not_recorded_again(tmp_path):
+    root = make_project(tmp_path)
+    path = os.path.join(root, 'a.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('old\n')
+    store = VersionStore(root)
+    assert store.snapshot(path, os.stat(path)) is not None
+    assert store.snapshot(path, os.stat(path)) is None
+    assert len(VersionStore(root).list_versions(path)) == 1  # Reloaded from index.jsonl
+
+
+def test_unknown_version_raises(tmp_path):
+    root = make_project(tmp_path)
+    path = os.path.join(root, 'a.txt')
+    write_file_if_changed(path, 'one\n')
+    write_file_if_changed(path, 'two\n')
+    store = get_version_store(path)
+    with pytest.raises(KeyError):
+        store.read_version(os.path.join(root, 'b.txt'), store.list_versions(path)[0]['hash'])
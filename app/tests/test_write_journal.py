@@ -0,0 +1,133 @@
+# test_write_journal.py
+import asyncio
+import os
+
+import pytest
+
+from app.utils.file_writer import WriteCoalescer, write_file_if_changed
+from app.utils.write_journal import WriteJournal, recover_journals
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def leftovers(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.bak'))
+
+
+def make_targets(tmp_path):
+    existing = os.path.join(tmp_path, 'existing.txt')
+    write_file_if_changed(existing, 'old')
+    created = os.path.join(tmp_path, 'new', 'nested', 'created.txt')
+    return existing, created
+
+
+def test_commit_keeps_new_versions(tmp_path):
+    existing, created = make_targets(tmp_path)
+    journal_directory = os.path.join(tmp_path, 'journal')
+    journal = WriteJournal([existing, created], journal_directory)
+    journal.begin()
+    assert os.listdir(journal_directory) == [f'{journal.journal_id}.json']
+    write_file_if_changed(existing, 'new')
+    write_file_if_changed(created, 'created')
+    journal.commit()
+    assert read(existing) == 'new' and read(created) == 'created'
+    assert not leftovers(tmp_path) and not os.listdir(journal_directory)
+
+
+def test_rollback_restores_targets_and_removes_created_directories(tmp_path):
+    existing, created = make_targets(tmp_path)
+    journal = WriteJournal([existing, created], os.path.join(tmp_path, 'journal'))
+    journal.begin()
+    write_file_if_changed(existing, 'new')
+    write_file_if_changed(created, 'created')
+    journal.rollback()
+    assert read(existing) == 'old'
+    assert not os.path.exists(os.path.join(tmp_path, 'new'))
+    assert not leftovers(tmp_path)
+
+
+def test_recover_rolls_back_interrupted_journals(tmp_path):
+    existing, created = make_targets(tmp_path)
+    journal_directory = os.path.join(tmp_path, 'journal')
+    WriteJournal([existing, created], journal_directory).begin()
+    write_file_if_changed(existing, 'new')
+    write_file_if_changed(created, 'created')
+    # The process dies here; the next start finds the journal
+    assert recover_journals(journal_directory) == 1
+    assert read(existing) == 'old'
+    assert not os.path.exists(created)
+    assert not leftovers(tmp_path) and not os.listdir(journal_directory)
+    assert recover_journals(journal_directory) == 0
+
+
+def test_failed_begin_removes_backups(tmp_path):
+    existing = os.path.join(tmp_path, 'a.txt')
+    write_file_if_changed(existing, 'old')
+    directory = os.path.join(tmp_path, 'b')
+    os.makedirs(directory)
+    journal = WriteJournal([existing, directory], os.path.join(tmp_path, 'journal'))
+    with pytest.raises(OSError):
+        journal.begin()
+    assert not leftovers(tmp_path)
+    assert read(existing) == 'old'
+
+
+def test_batch_fails_when_targets_cannot_be_preserved(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    existing = os.path.join(tmp_path, 'a.txt')
+    write_file_if_changed(existing, 'old')
+    directory = os.path.join(tmp_path, 'b')
+    os.makedirs(directory)
+    result = asyncio.run(WriteCoalescer().write_batch([(existing, 'new', False), (directory, 'new', False)]))
+    assert not result['committed']
+    assert [item['status'] for item in result['items']] == ['error', 'error']
+    assert read(existing) == 'old' and not leftovers(tmp_path)
+
+
+def test_batch_rolls_back_all_writes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    existing, created = make_targets(tmp_path)
+    unrelated = os.path.join(tmp_path, 'unrelated.py')
+    write_file_if_changed(unrelated, 'def main():\n    pass\n')
+    result = asyncio.run(WriteCoalescer().write_batch([
+        (existing, 'new', False),
+        (created, 'created', False),
+        (unrelated, '# ... existing code ...\nfunction other() {}\n# ... existing code ...', True)
+    ]))
+    assert not result['committed']
+    assert [item['status'] for item in result['items']] == ['rolled_back', 'rolled_back', 'error']
+    assert read(existing) == 'old' and read(unrelated) == 'def main():\n    pass\n'
+    assert not os.path.exists(os.path.join(tmp_path, 'new'))
+    assert not leftovers(tmp_path)
+
+
+def test_recover_removes_the_backups_of_a_committed_journal(tmp_path, monkeypatch):
+    existing, created = make_targets(tmp_path)
+    journal_directory = os.path.join(tmp_path, 'journal')
+    journal = WriteJournal([existing, created], journal_directory)
+    journal.begin()
+    write_file_if_changed(existing, 'new')
+    write_file_if_changed(created, 'created')
+    # The process dies once the journal is marked committed, before the backups go
+    monkeypatch.setattr(journal, 'discard', lambda: None)
+    journal.commit()
+    assert leftovers(tmp_path)
+    assert recover_journals(journal_directory) == 0
+    assert read(existing) == 'new' and read(created) == 'created'
+    assert not leftovers(tmp_path) and not os.listdir(journal_directory)
+
+
+def test_recover_removes_the_backups_of_an_interrupted_begin(tmp_path):
+    existing, created = make_targets(tmp_path)
+    journal_directory = os.path.join(tmp_path, 'journal')
+    journal = WriteJournal([existing, created], journal_directory)
+    # The process dies after linking the first backup, before any write
+    journal.entries[1]['backup'] = None
+    journal.record()
+    os.link(existing, journal.entries[0]['backup'])
+    assert leftovers(tmp_path)
+    assert recover_journals(journal_directory) == 1
+    assert read(existing) == 'old' and not leftovers(tmp_path) and not os.listdir(journal_directory)
@@ -0,0 +1,98 @@
+"""
+Lists, shows, imports, compacts and compresses the assistant messages in the message archive.
+
+Run with:
+    python -m app.utils.archive_cli list [--limit N]
+    python -m app.utils.archive_cli show <message id>
+    python -m app.utils.archive_cli import <directory of legacy .html files>
+    python -m app.utils.archive_cli compact
+    python -m app.utils.archive_cli migrate [--workers N]
+
+import, compact and migrate refuse to run while the server has the archive open: the
+archive has a single writer.
+"""
+import argparse
+import datetime
+import os
+import sys
+
+from app.utils.archive_codec import read_document_file
+from app.utils.message_archive import ArchiveLockedError, MessageArchive, format_document
+
+LEGACY_SUFFIXES = ('.html', '.html.gz', '.html.zst')
+
+
+def import_html_files(archive, directory):
+    """
+    Appends the one-file-per-message archives written by earlier versions, named after
+    their timestamp and starting with a <path> line, possibly compressed (.html.gz,
+    .html.zst). The file name becomes the message id.
+
+    Returns:
+        int: The number of messages imported.
+    """
+    imported = 0
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        if not entry.name.endswith(LEGACY_SUFFIXES) or not entry.is_file():
+            continue
+        message_id = entry.name[:entry.name.rindex('.html')]
+        if message_id in archive:
+            continue
+        header, _, content = read_document_file(entry.path).partition('\n')
+        header += '\n'
+        path = None
+        if header.startswith('<path>') and header.rstrip().endswith('</path>'):
+            path = header.strip()[len('<path>'):-len('</path>')]
+        else:
+            content = header + content
+        archive.append(message_id, content, path, int(entry.stat().st_mtime * 1000))
+        imported += 1
+    return imported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.utils.archive_cli', description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--directory', help='the archive directory, by default the configured one')
+    commands = parser.add_subparsers(dest='command', required=True)
+    list_command = commands.add_parser('list', help='list the archived messages, newest first')
+    list_command.add_argument('--limit', type=int)
+    show_command = commands.add_parser('show', help='print an archived message')
+    show_command.add_argument('id')
+    import_command = commands.add_parser('import', help='import a directory of legacy .html message files')
+    import_command.add_argument('source')
+    commands.add_parser('compact', help='reclaim the space of superseded records')
+    migrate_command = commands.add_parser('migrate', help='compress every message with the configured compression')
+    migrate_command.add_argument('--workers', type=int, help='segments compressed in parallel')
+    args = parser.parse_args(argv)
+
+    options = {'directory': args.directory} if args.directory else {}
+    try:
+        archive = MessageArchive(readonly=args.command in ('list', 'show'), **options)
+    except ArchiveLockedError as e:
+        print(f'{e} Stop the server first.', file=sys.stderr)
+        return 1
+    try:
+        if args.command == 'list':
+            for timestamp, message_id in archive.list_messages(limit=args.limit):
+                archived_at = datetime.datetime.fromtimestamp(timestamp / 1000).isoformat(sep=' ', timespec='seconds')
+                print(f'{archived_at}  {message_id}')
+        elif args.command == 'show':
+            message = archive.read(args.id)
+            if message is None:
+                print(f'Unknown message {args.id}', file=sys.stderr)
+                return 1
+            print(format_document(message))
+        elif args.command == 'import':
+            print(f'Imported {import_html_files(archive, args.source)} messages')
+        elif args.command == 'compact':
+            print(f'Reclaimed {archive.compact()} bytes')
+        else:
+            before, after = archive.recompress(args.workers)
+            print(f'Compressed the archive from {before} to {after} bytes')
+    finally:
+        archive.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import gzip
+import logging
+import os
+import re
+import tempfile
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from app.config.settings import MESSAGE_ARCHIVE_COMPRESSION
+
+# The low byte of a record's flags says how its content is encoded; for zstd, the high
+# byte is the id of the dictionary it was compressed with (0 for none)
+CODEC_NONE = 0
+CODEC_GZIP = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {'none': CODEC_NONE, 'gzip': CODEC_GZIP, 'zstd': CODEC_ZSTD}
+
+ZSTD_LEVEL = 9
+GZIP_LEVEL = 6
+DICTIONARY_BYTES = 112 * 1024
+DICTIONARY_MAX_SAMPLES = 4000
+DICTIONARY_SAMPLE_BYTES = 16 * 1024
+DICTIONARY_PATTERN = re.compile(r'^dictionary-(\d{3})\.zstd$')
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def resolve_codec(name=MESSAGE_ARCHIVE_COMPRESSION):
+    """
+    Returns the codec for a setting: 'zstd', 'gzip', 'none', or 'auto' for zstd when the
+    zstandard package is installed and gzip otherwise.
+    """
+    if name == 'auto':
+        return CODEC_ZSTD if zstandard is not None else CODEC_GZIP
+    if name not in CODEC_NAMES:
+        raise ValueError(f'Unknown archive compression: {name}')
+    if name == 'zstd' and zstandard is None:
+        logging.warning('zstandard is not installed; compressing the message archive with gzip')
+        return CODEC_GZIP
+    return CODEC_NAMES[name]
+
+
+class RecordCodec:
+    """
+    Compresses the content of message archive records.
+
+    ChatGPT markup repeats the same tags and class names in every message, which a
+    zstd dictionary trained on the archive itself captures, so even short messages
+    compress well. Dictionaries are kept next to the segments as dictionary-NNN.zstd and
+    never deleted: a record names the dictionary it needs, and new records use the
+    latest one. Content that does not shrink is stored as is.
+    """
+
+    def __init__(self, directory, codec=None):
+        self.directory = directory
+        self.codec = resolve_codec() if codec is None else codec
+        self.dictionaries = {}
+        self.dictionary_id = 0
+        self.local = threading.local()
+        if os.path.isdir(directory) and zstandard is not None:
+            for name in os.listdir(directory):
+                match = DICTIONARY_PATTERN.match(name)
+                if match:
+                    self.dictionary_id = max(self.dictionary_id, int(match.group(1)))
+
+    def dictionary_path(self, dictionary_id):
+        return os.path.join(self.directory, f'dictionary-{dictionary_id:03d}.zstd')
+
+    def get_dictionary(self, dictionary_id):
+        dictionary = self.dictionaries.get(dictionary_id)
+        if dictionary is None:
+            with open(self.dictionary_path(dictionary_id), 'rb') as f:
+                dictionary = zstandard.ZstdCompressionDict(f.read())
+            dictionary = self.dictionaries.setdefault(dictionary_id, dictionary)
+        return dictionary
+
+    def zstd_compressor(self):
+        # zstd contexts are not thread-safe; each thread keeps one for the current dictionary
+        compressor = getattr(self.local, 'compressor', None)
+        if compressor is None or self.local.compressor_dictionary != self.dictionary_id:
+            dictionary = self.get_dictionary(self.dictionary_id) if self.dictionary_id else None
+            compressor = self.local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dictionary)
+            self.local.compressor_dictionary = self.dictionary_id
+        return compressor
+
+    def zstd_decompressor(self, dictionary_id):
+        decompressors = getattr(self.local, 'decompressors', None)
+        if decompressors is None:
+            decompressors = self.local.decompressors = {}
+        decompressor = decompressors.get(dictionary_id)
+        if decompressor is None:
+            dictionary = self.get_dictionary(dictionary_id) if dictionary_id else None
+            decompressor = decompressors[dictionary_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return decompressor
+
+    def compress(self, data):
+        """
+        Returns (flags, encoded content) for the content bytes of a record.
+        """
+        if self.codec == CODEC_ZSTD:
+            flags, encoded = CODEC_ZSTD | self.dictionary_id << 8, self.zstd_compressor().compress(data)
+        elif self.codec == CODEC_GZIP:
+            flags, encoded = CODEC_GZIP, gzip.compress(data, GZIP_LEVEL, mtime=0)
+        else:
+            return CODEC_NONE, data
+        if len(encoded) >= len(data):
+            return CODEC_NONE, data
+        return flags, encoded
+
+    def decompress(self, flags, data):
+        codec = flags & 0xFF
+        if codec == CODEC_NONE:
+            return data
+        if codec == CODEC_GZIP:
+            return gzip.decompress(data)
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError('The message archive holds zstd records; install zstandard to read them.')
+            return self.zstd_decompressor(flags >> 8).decompress(data)
+        raise ValueError(f'Unknown archive record encoding: {codec}')
+
+    def train(self, samples):
+        """
+        Trains a zstd dictionary on sample contents and makes it the one new records use.
+
+        Returns:
+            int | None: The id of the new dictionary, or None if it could not be trained.
+        """
+        if self.codec != CODEC_ZSTD or self.dictionary_id >= 0xFF:
+            return None
+        samples = [sample[:DICTIONARY_SAMPLE_BYTES] for sample in samples[:DICTIONARY_MAX_SAMPLES]]
+        try:
+            dictionary = zstandard.train_dictionary(DICTIONARY_BYTES, samples)
+        except zstandard.ZstdError as e:
+            logging.warning(f'Could not train a message archive dictionary on {len(samples)} messages: {e}')
+            return None
+        dictionary_id = self.dictionary_id + 1
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(dictionary.as_bytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.dictionary_path(dictionary_id))
+        self.dictionaries[dictionary_id] = dictionary
+        self.dictionary_id = dictionary_id
+        logging.info(f'Trained message archive dictionary {dictionary_id} on {len(samples)} messages')
+        return dictionary_id
+
+
+def read_document_file(path):
+    """
+    Reads a message HTML file, decompressing it if it is gzip or zstd compressed.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data.startswith(GZIP_MAGIC):
+        data = gzip.decompress(data)
+    elif data.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError(f'{path} is zstd compressed; install zstandard to read it.')
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return data.decode('utf-8')
@@ -0,0 +1,99 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class CodecError(ValueError):
+    """
+    Raised when a frame cannot be decoded.
+    """
+
+
+class JsonCodec:
+    """
+    Text frames holding JSON. Uses orjson when it is installed and the standard library
+    otherwise. This is the default codec, understood by every extension build.
+    """
+
+    name = 'json'
+    binary = False
+
+    def loads(self, frame):
+        try:
+            if orjson is not None:
+                return orjson.loads(frame)
+            return json.loads(frame)
+        except ValueError as e:
+            raise CodecError(str(e)) from e
+
+    def dumps(self, message):
+        if orjson is not None:
+            return orjson.dumps(message).decode('utf-8')
+        return json.dumps(message)
+
+
+def decode_content(message):
+    if isinstance(message.get('content'), bytes):
+        message['content'] = message['content'].decode('utf-8')
+
+
+class MsgpackCodec:
+    """
+    Binary frames holding MessagePack. File bodies travel as raw bytes instead of
+    escaped strings.
+    """
+
+    name = 'msgpack'
+    binary = True
+
+    def loads(self, frame):
+        if isinstance(frame, str):
+            raise CodecError('Expected a binary frame.')
+        try:
+            data = msgpack.unpackb(frame, raw=False)
+            # Clients may send snippet bodies as raw bytes too, also in the items of a
+            # batch; handlers work on text
+            if isinstance(data, dict):
+                decode_content(data)
+                if isinstance(data.get('items'), list):
+                    for item in data['items']:
+                        if isinstance(item, dict):
+                            decode_content(item)
+        except Exception as e:
+            raise CodecError(str(e)) from e
+        return data
+
+    def dumps(self, message):
+        return msgpack.packb(message, use_bin_type=True)
+
+
+JSON_CODEC = JsonCodec()
+CODECS = {JSON_CODEC.name: JSON_CODEC}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+
+def available_subprotocols():
+    """
+    Returns the websocket subprotocols offered at connect time, preferred first.
+    A client that requests none of them gets the JSON codec.
+    """
+    return [name for name in ('msgpack', 'json') if name in CODECS]
+
+
+def get_connection_codec(websocket):
+    """
+    Returns the codec negotiated for a connection through its subprotocol.
+    """
+    codec = CODECS.get(getattr(websocket, 'subprotocol', None))
+    if codec is None:
+        return JSON_CODEC
+    return codec
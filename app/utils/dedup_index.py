@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+import threading
+
+from app.config.settings import DEDUP_INDEX_PATH
+
+# The index file is rewritten once it holds this many superseded records and more
+# superseded records than live ones
+COMPACT_MIN_STALE_RECORDS = 1000
+
+
+class DedupIndex:
+    """
+    Persistent record of the messages already stored, by kind ('assistant', 'snippet')
+    and id, with the SHA-256 digest of their content.
+
+    The extension re-sends every response and snippet on the page each time generation
+    finishes; looking them up here lets the server answer the re-sends without touching
+    the disk. Lookups only read memory. Records are appended to a JSON lines file, loaded
+    once, and the file is rewritten when superseded records pile up.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.entries = {}
+        self.records = 0
+        self.file = None
+        self.lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def key(kind, message_id):
+        return f'{kind}:{message_id}'
+
+    def load(self):
+        """
+        Loads the index from disk. Records cut short by a crash are skipped.
+        """
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[self.key(entry['kind'], entry['id'])] = entry
+                    self.records += 1
+            logging.debug(f'Loaded {len(self.entries)} dedup index entries from {self.index_path}')
+        except FileNotFoundError:
+            pass
+
+    def lookup(self, kind, message_id, digest):
+        """
+        Returns the entry of a message stored with this exact content, or None.
+        """
+        entry = self.entries.get(self.key(kind, message_id))
+        if entry is not None and entry['hash'] == digest:
+            return entry
+        return None
+
+    def record(self, kind, message_id, digest, **fields):
+        """
+        Records a stored message. Extra fields are kept in the entry.
+        """
+        self.record_many([dict(fields, kind=kind, id=message_id, hash=digest)])
+
+    def record_many(self, entries):
+        with self.lock:
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+                self.file = open(self.index_path, 'a', encoding='utf-8')
+            for entry in entries:
+                self.file.write(json.dumps(entry) + '\n')
+                self.entries[self.key(entry['kind'], entry['id'])] = entry
+            self.file.flush()
+            self.records += len(entries)
+            stale = self.records - len(self.entries)
+            if stale >= COMPACT_MIN_STALE_RECORDS and stale > len(self.entries):
+                self.compact()
+
+    def compact(self):
+        tmp_path = f'{self.index_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + '\n')
+        self.file.close()
+        os.replace(tmp_path, self.index_path)
+        self.file = open(self.index_path, 'a', encoding='utf-8')
+        self.records = len(self.entries)
+        logging.debug(f'Compacted the dedup index to {self.records} records')
+
+
+_dedup_index = None
+
+
+def get_dedup_index():
+    """
+    Returns the process-wide dedup index, loading it on first use.
+    """
+    global _dedup_index
+    if _dedup_index is None:
+        _dedup_index = DedupIndex(DEDUP_INDEX_PATH)
+    return _dedup_index
@@ -0,0 +1,116 @@
+import codecs
+import logging
+import mmap
+import os
+import threading
+
+from app.config.settings import SYNC_MAX_FILE_BYTES, SYNC_SNIFF_BYTES
+
+TEXT = 'text'
+BINARY = 'binary'
+TOO_LARGE = 'too_large'
+
+# Extensions that are never shipped, whatever their content. Dotfiles such as '.cache'
+# have no extension to splitext and are matched by their whole name.
+BINARY_EXTENSIONS = frozenset([
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.svg', '.pdf',
+    '.mp4', '.avi', '.mov', '.mp3', '.wav', '.zip', '.tar', '.gz',
+    '.7z', '.rar', '.exe', '.dll', '.so', '.a', '.lib', '.o', '.obj',
+    '.class', '.jar', '.war', '.ear', '.swf', '.flv', '.psd', '.ai',
+    '.eps', '.ttf', '.woff', '.woff2', '.eot', '.otf', '.db', '.sqlite',
+    '.sqlite3', '.db3', '.sql', '.bak', '.log', '.tmp', '.temp',
+    '.cache', '.backup', '.old', '.swp', '.swo', '.swn', '.eslintcache'
+])
+
+
+def has_binary_extension(path):
+    """
+    Checks the extension of path, or the name of a dotfile without one, against
+    BINARY_EXTENSIONS.
+    """
+    root, extension = os.path.splitext(path)
+    if not extension:
+        extension = os.path.basename(root)
+    return extension.lower() in BINARY_EXTENSIONS
+
+
+def sniff(path, size):
+    """
+    Inspects the first SYNC_SNIFF_BYTES of a file without reading the rest.
+
+    Args:
+        path (str): The file path.
+        size (int): The file size.
+
+    Returns:
+        str: TEXT if the prefix is NUL free UTF-8, BINARY otherwise.
+    """
+    if size == 0:
+        return TEXT
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            length = min(size, SYNC_SNIFF_BYTES)
+            if mapped.find(b'\0', 0, length) != -1:
+                return BINARY
+            # A multi-byte sequence may be cut at the end of the prefix
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            try:
+                decoder.decode(mapped[:length], final=length == size)
+            except UnicodeDecodeError:
+                return BINARY
+    return TEXT
+
+
+class FileClassifier:
+    """
+    Decides whether a file can be shipped as text.
+
+    Verdicts are cached by path and validated against (inode, mtime, size), so a file
+    is sniffed at most once per change.
+    """
+
+    def __init__(self, max_size=SYNC_MAX_FILE_BYTES):
+        self.max_size = max_size
+        self.verdicts = {}
+        self.lock = threading.Lock()
+
+    def classify(self, path, stat_result):
+        """
+        Classifies a regular file.
+
+        Args:
+            path (str): The file path.
+            stat_result (os.stat_result): A fresh stat of the file.
+
+        Returns:
+            str: TEXT, BINARY or TOO_LARGE.
+        """
+        if has_binary_extension(path):
+            return BINARY
+        if stat_result.st_size > self.max_size:
+            return TOO_LARGE
+
+        key = (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+        cached = self.verdicts.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        verdict = sniff(path, stat_result.st_size)
+        with self.lock:
+            self.verdicts[path] = (key, verdict)
+        if verdict != TEXT:
+            logging.debug(f'Classified {path} as {verdict}')
+        return verdict
+
+
+_file_classifier = None
+
+
+def get_file_classifier():
+    """
+    Returns the process-wide file classifier.
+    """
+    global _file_classifier
+    if _file_classifier is None:
+        _file_classifier = FileClassifier()
+    return _file_classifier
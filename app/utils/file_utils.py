@@ -1,102 +1,333 @@
-import json
+import asyncio
 import os
 import logging
-import re
+import stat
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app.config.settings import SYNC_READ_CONCURRENCY
+from app.utils.codec import get_connection_codec
+from app.utils.file_classifier import TEXT, get_file_classifier, has_binary_extension
+from app.utils.file_writer import get_write_coalescer
+from app.utils.framing import FrameWriter, decode_text, negotiate_compression, negotiate_framing
 from app.utils.git_utils import get_tracked_files
+from app.utils.hash_cache import get_hash_cache, hash_bytes
 from app.utils.handlers import get_handler_for_extension
+from app.utils.language_detection import detect_language
+from app.utils.metrics import metrics
+from app.utils.snippet_merge import MergeError
 
 logging.basicConfig(level=logging.INFO)
 
+_read_executor = None
 
-async def save_file(full_path, content, overwrite=True):
+
+async def save_file(full_path, content, overwrite=True, language=None, merge=False):
     """
     Saves the content to the specified full_path. If the content starts with a path comment,
     it extracts the actual path and saves the content accordingly.
 
+    The write runs off the event loop and atomically replaces the target. Bursts of writes
+    to the same path are coalesced so that only the last content hits the disk, and content
+    identical to the file on disk is not written at all.
+
+    With merge, the content is a partial snippet whose hunks are placed into the existing
+    file around their context lines; see snippet_merge.merge_snippet. A file that does not
+    exist yet is written with the snippet as is.
+
     Args:
         full_path (str): The desired full file path.
         content (str): The content to save.
-        overwrite (bool): Whether to overwrite the file if it exists.
+        overwrite (bool): Whether to overwrite the file if it exists, rather than saving
+            under a free 'base(N).ext' name; see WriteCoalescer.write_new.
+        language (str, optional): The language of the code fence the snippet came from.
+        merge (bool): Whether to merge a partial snippet into the existing file.
 
     Returns:
-        str | None: The path where the file was saved or None if an error occurred.
+        dict | None: 'path' where the file was saved, the write statistics returned by
+            WriteCoalescer.write and the 'language' detection, or None if an error occurred.
+
+    Raises:
+        MergeError: If a partial snippet cannot be placed into the existing file.
     """
     try:
-        directory = os.path.dirname(full_path)
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-            logging.debug(f'Created directory: {directory}')
-
-        detected_extension = detect_extension(content)
-        handler = get_handler_for_extension(detected_extension.lower())
-        if not handler:
-            logging.error(f"No handler found for extension: {detected_extension}")
+        prepared = prepare_content(full_path, content, language)
+        if prepared is None:
             return None
+        processed_content, final_path, detection = prepared
 
-        # Process content using the handler
-        processed_content, final_path = handler.process_content(content, full_path, overwrite)
-        if not final_path:
-            logging.error(f"Failed to determine final path for file: {full_path}")
-            return None
-
-        with open(final_path, 'w', encoding='utf-8') as f:
-            f.write(processed_content)
-        logging.info(f'File saved: {final_path}')
-        return final_path
+        if overwrite or merge:
+            result = await get_write_coalescer().write(final_path, processed_content, merge=merge)
+        else:
+            final_path, result = await get_write_coalescer().write_new(final_path, processed_content)
+        if not result['unchanged']:
+            logging.info(f'File saved: {final_path} ({result["latencyMs"]} ms, {result["coalesced"]} coalesced)')
+        return {'path': final_path, 'language': detection, **result}
+    except MergeError as e:
+        logging.error(f'Not saving {full_path}: {e}')
+        raise
     except Exception as e:
         logging.error(f'Error saving file {full_path}: {e}')
         return None
 
 
-def detect_extension(content):
-    # search first 5 lines of content.
-    # find looks like .\w+\s or $
-    # ex. <!-- abc.html -->, # abc.py, // abc.js, <!-- abc.css -->
-    for line in content.splitlines()[:5]:
-        if match := re.search(r'\.\w+\s|\.\w+$', line):
-            return match.group().strip()
+def prepare_content(full_path, content, language=None):
+    """
+    Detects the language of the content and lets its handler resolve the target path and
+    strip the path comment.
+
+    Returns:
+        tuple | None: (processed_content, final_path, detection), or None if the content
+            cannot be saved.
+    """
+    detection = detect_language(content, language)
+    if detection is None:
+        logging.error(f"Could not detect the language of the content for: {full_path}")
+        return None
+    handler = get_handler_for_extension(detection.extension)
+    if not handler:
+        logging.error(f"No handler found for extension: {detection.extension}")
+        return None
+
+    # Process content using the handler
+    processed_content, final_path = handler.process_content(content, full_path)
+    if not final_path:
+        logging.error(f"Failed to determine final path for file: {full_path}")
+        return None
+    return processed_content, final_path, detection
+
+
+async def save_files(items):
+    """
+    Saves several snippets as one all-or-nothing batch; see WriteCoalescer.write_batch.
+    Nothing is written unless every snippet can be resolved to a target path.
+
+    Args:
+        items (list[dict]): 'filePath', 'content' and optionally 'language' and 'merge'
+            for each snippet.
 
+    Returns:
+        dict: 'committed', 'latencyMs' and 'items', one dict per snippet with its 'status',
+            'path', 'language' detection and merge 'hunks', or an error 'message'.
+    """
+    prepared = []
+    for item in items:
+        try:
+            prepared.append(prepare_content(item['filePath'], item['content'], item.get('language')))
+        except Exception as e:
+            logging.error(f'Error preparing {item["filePath"]}: {e}')
+            prepared.append(None)
+    if any(entry is None for entry in prepared):
+        return {
+            'committed': False,
+            'latencyMs': 0,
+            'items': [
+                {'status': 'error', 'message': 'Failed to resolve the file.'} if entry is None
+                else {'status': 'skipped', 'path': entry[1]}
+                for entry in prepared
+            ]
+        }
+
+    result = await get_write_coalescer().write_batch([
+        (final_path, processed_content, bool(item.get('merge')))
+        for item, (processed_content, final_path, _) in zip(items, prepared)
+    ])
+    for outcome, (_, final_path, detection) in zip(result['items'], prepared):
+        outcome['path'] = final_path
+        outcome['language'] = detection
+    return result
 
-async def send_all_files(websocket, destination):
+
+def detect_extension(content, language=None):
+    """
+    Returns the extension of the language detected in the content, or None.
+    See language_detection.detect_language.
+    """
+    detection = detect_language(content, language)
+    return detection.extension if detection else None
+
+
+async def send_all_files(websocket, destination, manifest=None, framing=None, compression=None):
     """
     Sends all tracked files' contents over the websocket, excluding binary files.
 
+    Files with a known binary extension are skipped without touching the disk; the
+    rest are classified by sniffing their first bytes before they are read in full.
+    Files are read and serialized on a bounded thread pool. Up to twice the configured
+    concurrency of files are prefetched while earlier frames are still being sent, and
+    each send waits for the websocket to drain so a slow client throttles the readers.
+
+    When the client supplies a manifest of the files it already holds, only added or
+    changed files are sent, followed by a SYNC_COMPLETE frame listing deleted paths: the
+    manifest paths that are no longer listed in the repository. Files that are listed but
+    not sent, because they are not text or could not be read, are not deleted.
+
+    Clients that request a framing or compression first receive a SYNC_START frame with
+    the negotiated settings; see FrameWriter. Older clients get one FILE_CONTENT frame
+    per file as before.
+
     Args:
         websocket: The websocket connection.
         destination (str): The directory to scan for tracked files.
+        manifest (dict, optional): Mapping of filePath to {'hash': str, 'size': int}
+            describing the client's current copy.
+        framing (str, optional): 'content' or 'batch'.
+        compression (list[str], optional): Compression methods the client accepts.
+    """
+    metrics.add_gauge('syncs_in_flight', 1)
+    try:
+        await sync_files(websocket, destination, manifest, framing, compression)
+    finally:
+        metrics.add_gauge('syncs_in_flight', -1)
+
+
+async def sync_files(websocket, destination, manifest, framing, compression):
+    """
+    Performs the SYNC described in send_all_files.
     """
     tracked_files = await get_tracked_files(destination)
+    hash_cache = get_hash_cache()
+    classifier = get_file_classifier()
+    loop = asyncio.get_running_loop()
+    executor = get_read_executor()
+    prefetch_limit = max(1, SYNC_READ_CONCURRENCY) * 2
+    writer = FrameWriter(
+        websocket,
+        executor,
+        negotiate_framing(framing),
+        negotiate_compression(websocket, compression),
+        get_connection_codec(websocket)
+    )
+    if framing is not None or compression is not None:
+        await writer.start(destination)
 
-    # Define binary file extensions to ignore
-    ignore_exts = [
-        '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.svg', '.pdf',
-        '.mp4', '.avi', '.mov', '.mp3', '.wav', '.zip', '.tar', '.gz',
-        '.7z', '.rar', '.exe', '.dll', '.so', '.a', '.lib', '.o', '.obj',
-        '.class', '.jar', '.war', '.ear', '.swf', '.flv', '.psd', '.ai',
-        '.eps', '.ttf', '.woff', '.woff2', '.eot', '.otf', '.db', '.sqlite',
-        '.sqlite3', '.db3', '.sql', '.bak', '.log', '.tmp', '.temp',
-        '.cache', '.bak', '.backup', '.old', '.swp', '.swo', '.swn'
-    ]
-
-    for file in tracked_files:
+    # Every listed path, shipped or not; a file that fails to read is not deleted
+    listed_paths = {os.path.join(destination, file) for file in tracked_files}
+    sent_count = 0
+    pending = deque()
+
+    async def send_next():
+        nonlocal sent_count
+        file, future = pending.popleft()
         try:
-            if any(file.lower().endswith(ext) for ext in ignore_exts):
-                continue
-            file_path = os.path.join(destination, file)
-            if not os.path.isfile(file_path):
-                continue
-            if not os.path.exists(file_path):
-                logging.error(f'File not found: {file_path}')
-                continue
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            message = {
-                'type': 'FILE_CONTENT',
-                'filePath': file_path,
-                'content': content
-            }
-            print("sent:", file_path)
-            await websocket.send(json.dumps(message))
-            logging.debug(f'Sent file content: {file_path}')
+            file_path, record = await future
+        except FileNotFoundError:
+            logging.error(f'File not found: {os.path.join(destination, file)}')
+            listed_paths.discard(os.path.join(destination, file))
+            return
         except Exception as e:
             logging.error(f'Error sending file {file}: {e}')
+            return
+        if record is None:
+            return
+        await writer.send_file(record, hash_cache)
+        sent_count += 1
+        logging.debug(f'Sent file content: {file_path}')
+
+    try:
+        for file in tracked_files:
+            if has_binary_extension(file):
+                continue
+            future = loop.run_in_executor(
+                executor, read_file_record, destination, file, manifest, hash_cache, classifier,
+                writer.max_inline_size, writer.codec.binary
+            )
+            pending.append((file, future))
+            if len(pending) >= prefetch_limit:
+                await send_next()
+        while pending:
+            await send_next()
+        await writer.flush()
+    finally:
+        # Stop prefetching if sending failed, e.g. because the connection closed
+        for _, future in pending:
+            future.cancel()
+
+    hash_cache.save()
+
+    if manifest is not None:
+        deleted = sorted(path for path in manifest if path not in listed_paths)
+        await writer.send_message({
+            'type': 'SYNC_COMPLETE',
+            'destination': destination,
+            'sent': sent_count,
+            'deleted': deleted
+        })
+        logging.info(f'Incremental sync of {destination}: {sent_count} sent, {len(deleted)} deleted.')
+
+
+def get_read_executor():
+    """
+    Returns the shared thread pool used to read files for SYNC.
+    """
+    global _read_executor
+    if _read_executor is None:
+        _read_executor = ThreadPoolExecutor(
+            max_workers=max(1, SYNC_READ_CONCURRENCY),
+            thread_name_prefix='sync-reader'
+        )
+    return _read_executor
+
+
+def read_file_record(destination, file, manifest, hash_cache, classifier, max_inline_size=None, raw_content=False):
+    """
+    Reads one tracked file for SYNC. Runs on the read executor.
+
+    Args:
+        destination (str): The directory the file is relative to.
+        file (str): The tracked file path relative to destination.
+        manifest (dict | None): The client's manifest, if any.
+        hash_cache (HashCache): The digest cache.
+        classifier (FileClassifier): Decides which files are shipped as text.
+        max_inline_size (int, optional): Files larger than this are not read here but
+            left for FrameWriter to stream.
+        raw_content (bool): Whether to return the content as the bytes read from disk
+            instead of decoded text, for binary codecs.
+
+    Returns:
+        tuple: (file_path, record). file_path is None if the file is not a regular text
+            file within the size cap, record is None if the client already holds the current content.
+    """
+    file_path = os.path.join(destination, file)
+    stat_result = os.stat(file_path)
+    if not stat.S_ISREG(stat_result.st_mode):
+        return None, None
+    if classifier.classify(file_path, stat_result) != TEXT:
+        return None, None
+    if manifest is not None and is_unchanged(manifest.get(file_path), file_path, stat_result, hash_cache):
+        return file_path, None
+    if max_inline_size is not None and stat_result.st_size > max_inline_size:
+        return file_path, {'filePath': file_path, 'size': stat_result.st_size, 'stat': stat_result}
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    content = raw if raw_content else decode_text(raw)
+    digest = hash_bytes(raw)
+    hash_cache.store(file_path, stat_result, digest)
+    return file_path, {
+        'filePath': file_path,
+        'content': content,
+        'hash': digest,
+        'size': stat_result.st_size
+    }
+
+
+def is_unchanged(entry, file_path, stat_result, hash_cache):
+    """
+    Checks whether the client's manifest entry matches the file on disk.
+
+    The size is compared first so that most changed files are detected without hashing.
+
+    Args:
+        entry (dict | None): The client's manifest entry for the file.
+        file_path (str): The file path.
+        stat_result (os.stat_result): A fresh stat of the file.
+        hash_cache (HashCache): The digest cache.
+
+    Returns:
+        bool: True if the client already holds the current content.
+    """
+    if not isinstance(entry, dict) or not entry.get('hash'):
+        return False
+    size = entry.get('size')
+    if size is not None and size != stat_result.st_size:
+        return False
+    return entry['hash'] == hash_cache.get_digest(file_path, stat_result)
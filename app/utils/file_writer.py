@@ -0,0 +1,501 @@
+import asyncio
+import collections
+import logging
+import os
+import stat
+import tempfile
+import time
+
+from app.config.settings import WRITE_COALESCE_MAX_DELAY_MS, WRITE_COALESCE_WINDOW_MS, WRITE_FSYNC
+from app.utils.git_utils import forget_tracked_files_of
+from app.utils.hash_cache import get_hash_cache, hash_bytes
+from app.utils.metrics import metrics
+from app.utils.name_allocator import get_name_allocator
+from app.utils.snippet_merge import merge_snippet
+from app.utils.version_store import snapshot_previous_version
+from app.utils.write_journal import WriteJournal
+
+# The process umask, needed to give new files their usual permissions
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+def encode_text(content):
+    """
+    Encodes text the way a text-mode write would store it on this platform.
+    """
+    if os.linesep != '\n':
+        content = content.replace('\n', os.linesep)
+    return content.encode('utf-8')
+
+
+def write_file_atomic(path, content):
+    """
+    Writes content to path through a temporary file in the same directory that is then
+    renamed over the target, so readers see either the old or the new file, never a
+    truncated one.
+
+    Args:
+        path (str): The target file path.
+        content (str | bytes): The text to write, or its encoded form.
+    """
+    if isinstance(content, str):
+        content = encode_text(content)
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~_umask
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            if WRITE_FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_file_if_changed(path, content):
+    """
+    Writes content to path with write_file_atomic unless the file already holds exactly
+    that content, so identical saves leave the file and its mtime untouched. The content
+    being replaced is kept in the version store first. Creating a file drops the cached
+    git file lists of the worktrees holding it.
+
+    The file on disk is only hashed when its size matches and the hash cache has no
+    digest for its current (inode, mtime, size).
+
+    Args:
+        path (str): The target file path.
+        content (str | bytes): The text to write, or its encoded form.
+
+    Returns:
+        bool: True if the file was written, False if it was already identical.
+    """
+    data = encode_text(content) if isinstance(content, str) else content
+    digest = hash_bytes(data)
+    hash_cache = get_hash_cache()
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        stat_result = None
+    if (stat_result is not None and stat.S_ISREG(stat_result.st_mode) and stat_result.st_size == len(data)
+            and hash_cache.get_digest(path, stat_result) == digest):
+        return False
+    if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+        snapshot_previous_version(path, stat_result)
+    write_file_atomic(path, data)
+    hash_cache.store(path, os.stat(path), digest)
+    if stat_result is None:
+        forget_tracked_files_of(path)
+    return True
+
+
+def merge_file(path, snippet):
+    """
+    Merges a partial snippet into the file at path with merge_snippet and writes the
+    result with write_file_if_changed. A file that does not exist yet is written with the
+    snippet as is.
+
+    Args:
+        path (str): The target file path.
+        snippet (str): The partial snippet.
+
+    Returns:
+        tuple: (written, per-hunk results, or None if the file was new).
+
+    Raises:
+        MergeError: If the snippet cannot be placed into the file; nothing is written.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            original = f.read()
+    except FileNotFoundError:
+        return write_file_if_changed(path, snippet), None
+    merged, hunks = merge_snippet(original, snippet)
+    return write_file_if_changed(path, merged), hunks
+
+
+def write_new_file(path, content):
+    """
+    Claims path, or the first free 'base(N).ext' name next to it, with the NameAllocator
+    and writes content there. The claimed file is removed again if the write fails.
+
+    Returns:
+        str: The path written.
+    """
+    allocator = get_name_allocator()
+    path = allocator.claim(path)
+    try:
+        write_file_if_changed(path, content)
+    except BaseException:
+        allocator.release(path)
+        raise
+    forget_tracked_files_of(path)
+    return path
+
+
+def apply_group(path, operations):
+    """
+    Applies the writes of a batch to one path in order, stopping at the first failure.
+
+    Returns:
+        list[tuple]: (operation index, item result) for each write attempted.
+    """
+    results = []
+    for index, content, merge in operations:
+        try:
+            if merge:
+                written, hunks = merge_file(path, content)
+            else:
+                written, hunks = write_file_if_changed(path, content), None
+        except Exception as e:
+            logging.error(f'Error writing {path} in batch: {e}')
+            results.append((index, {'status': 'error', 'hunks': getattr(e, 'hunks', None), 'message': str(e)}))
+            break
+        results.append((index, {'status': 'success' if written else 'unchanged', 'hunks': hunks}))
+    return results
+
+
+class PendingWrite:
+    """
+    A write waiting for its coalescing window to close.
+    """
+
+    def __init__(self, content, now, merge=False):
+        self.content = content
+        self.merge = merge
+        self.task = None
+        self.futures = []
+        self.first_arrival = now
+        self.last_arrival = now
+
+
+class WriteCoalescer:
+    """
+    Applies file writes off the event loop, collapsing bursts.
+
+    A write is delayed until no newer write for the same path has arrived for the
+    coalescing window (but no longer than the maximum delay). Only the most recent
+    content then hits the disk, and every caller in the burst receives the result.
+    Writes to the same path never overlap and are applied in arrival order. A write
+    whose content is already on disk is skipped; see write_file_if_changed. A write that
+    may not be coalesced supersedes the write of its path still waiting for its window.
+    Merges of partial snippets are never coalesced either: the waiting write is applied
+    at once, and the merge right after it.
+    """
+
+    def __init__(self, window_ms=WRITE_COALESCE_WINDOW_MS, max_delay_ms=WRITE_COALESCE_MAX_DELAY_MS):
+        self.window = window_ms / 1000
+        self.max_delay = max(window_ms, max_delay_ms) / 1000
+        self.pending = {}
+        self.path_locks = {}
+        self.tasks = set()
+        self.stats = {
+            'requested': 0,
+            'written': 0,
+            'coalesced': 0,
+            'unchanged': 0,
+            'failed': 0,
+            'latency_ms_total': 0.0,
+            'latency_ms_max': 0.0
+        }
+
+    async def write(self, path, content, coalesce=True, merge=False):
+        """
+        Schedules content to be written to path and waits until it is on disk.
+
+        Args:
+            path (str): The target file path.
+            content (str | bytes): The text to write, or its encoded form.
+            coalesce (bool): Whether the write may be folded into others to the same path.
+            merge (bool): Whether content is a partial snippet to merge into the file; see
+                merge_file.
+
+        Returns:
+            dict: 'latencyMs' of the disk write, 'coalesced', the number of writes folded
+                into it, 'superseded', True if newer content replaced this one,
+                'unchanged', True if the file already held the content and was not written,
+                and 'hunks', the per-hunk results of a merge (None otherwise).
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self.stats['requested'] += 1
+        if merge or not coalesce:
+            entry = PendingWrite(content, now, merge)
+            future = loop.create_future()
+            entry.futures.append(future)
+            # A write still waiting for its window is taken out of it, so that writes
+            # arriving from now on cannot join it and get ahead of this one
+            pending = self.pending.pop(path, None)
+            if pending is None:
+                await self.apply_locked(path, entry)
+            elif merge:
+                # The merge must see the content of the write that arrived before it
+                pending.task.cancel()
+                await self.apply_locked(path, pending, entry)
+            else:
+                pending.task.cancel()
+                entry.futures[:0] = pending.futures
+                await self.apply_locked(path, entry)
+            return await future
+        entry = self.pending.get(path)
+        if entry is None:
+            entry = PendingWrite(content, now)
+            self.pending[path] = entry
+            entry.task = asyncio.create_task(self.flush_when_quiet(path, entry))
+            self.tasks.add(entry.task)
+            entry.task.add_done_callback(self.tasks.discard)
+        else:
+            entry.content = content
+            entry.last_arrival = now
+        future = loop.create_future()
+        entry.futures.append(future)
+        return await future
+
+    async def write_new(self, path, content):
+        """
+        Writes content to a new file, never overwriting one: path itself if it is free,
+        else the first free 'base(N).ext' name next to it. The name is claimed and
+        written by one job on the executor; see write_new_file.
+
+        Args:
+            path (str): The desired file path.
+            content (str | bytes): The text to write, or its encoded form.
+
+        Returns:
+            tuple: (the path written, the write statistics as returned by write).
+        """
+        loop = asyncio.get_running_loop()
+        self.stats['requested'] += 1
+        start = time.perf_counter()
+        try:
+            path = await loop.run_in_executor(None, write_new_file, path, content)
+        except Exception:
+            self.stats['failed'] += 1
+            metrics.inc('errors_total', kind='write')
+            raise
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.stats['written'] += 1
+        self.stats['latency_ms_total'] += latency_ms
+        self.stats['latency_ms_max'] = max(self.stats['latency_ms_max'], latency_ms)
+        metrics.inc('files_written_total')
+        logging.debug(f'Wrote {path} in {latency_ms:.1f} ms')
+        return path, {
+            'latencyMs': round(latency_ms, 3),
+            'coalesced': 0,
+            'superseded': False,
+            'unchanged': False,
+            'hunks': None
+        }
+
+    async def flush_when_quiet(self, path, entry):
+        loop = asyncio.get_running_loop()
+        while True:
+            deadline = min(entry.last_arrival + self.window, entry.first_arrival + self.max_delay)
+            delay = deadline - loop.time()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        await self.apply_locked(path, entry)
+
+    def queue_path(self, path):
+        """
+        Queues a turn at the path, a future resolved once every earlier turn has left it.
+        """
+        turns = self.path_locks.setdefault(path, collections.deque())
+        turn = asyncio.get_running_loop().create_future()
+        if not turns:
+            turn.set_result(None)
+        turns.append(turn)
+        return turn
+
+    async def acquire_paths(self, paths):
+        """
+        Waits until the caller holds every path. The turns are queued before the first
+        wait, so that callers get each path in the order they asked for it; a write
+        arriving later cannot take one of the paths while an earlier caller still waits
+        for another.
+        """
+        turns = [(path, self.queue_path(path)) for path in paths]
+        try:
+            for _, turn in turns:
+                await turn
+        except BaseException:
+            for path, turn in turns:
+                self.leave_path(path, turn)
+            raise
+
+    async def acquire_path(self, path):
+        await self.acquire_paths([path])
+
+    def release_path(self, path):
+        self.leave_path(path, self.path_locks[path][0])
+
+    def leave_path(self, path, turn):
+        turns = self.path_locks[path]
+        turns.remove(turn)
+        if not turns:
+            del self.path_locks[path]
+        elif not turns[0].done():
+            # A cancelled waiter is done too; it wakes the next one when it leaves
+            turns[0].set_result(None)
+
+    async def apply_locked(self, path, *entries):
+        await self.acquire_path(path)
+        try:
+            for entry in entries:
+                # Writes that arrived while an earlier write of this path was running joined this entry
+                if self.pending.get(path) is entry:
+                    del self.pending[path]
+                await self.apply(path, entry)
+        finally:
+            self.release_path(path)
+
+    async def write_batch(self, operations):
+        """
+        Applies a group of writes all-or-nothing.
+
+        Writes to distinct paths run in parallel on the executor; writes to the same path
+        run in order. A WriteJournal preserves every target first, and if any write fails
+        all targets are restored. The batch holds every path it writes, all queued for at
+        once, and applies the coalesced writes still pending for them first.
+
+        Args:
+            operations (list[tuple]): (path, content, merge) for each write; see write.
+
+        Returns:
+            dict: 'committed', whether the batch was applied, 'latencyMs', and 'items', one
+                dict per operation with its 'status' ('success', 'unchanged', 'error',
+                'rolled_back' or 'skipped'), the merge 'hunks' and an error 'message'.
+        """
+        loop = asyncio.get_running_loop()
+        self.stats['requested'] += len(operations)
+        groups = {}
+        for index, (path, content, merge) in enumerate(operations):
+            groups.setdefault(path, []).append((index, content, merge))
+        paths = sorted(groups)
+
+        # Writes waiting for their window arrived first; they are applied in the batch's turn
+        pending = [(path, self.pending.pop(path)) for path in paths if path in self.pending]
+        for _, entry in pending:
+            entry.task.cancel()
+        await self.acquire_paths(paths)
+        try:
+            for path, entry in pending:
+                await self.apply(path, entry)
+            start = time.perf_counter()
+            journal = WriteJournal(paths)
+            try:
+                await loop.run_in_executor(None, journal.begin)
+            except Exception as e:
+                # Nothing was written yet; the batch fails as a whole
+                logging.error(f'Error preserving the targets of a batch: {e}')
+                items = [{'status': 'error', 'hunks': None, 'message': str(e)} for _ in operations]
+                committed = False
+            else:
+                outcomes = await asyncio.gather(
+                    *(loop.run_in_executor(None, apply_group, path, groups[path]) for path in paths))
+                items = [None] * len(operations)
+                for outcome in outcomes:
+                    for index, item in outcome:
+                        items[index] = item
+                committed = all(item is not None and item['status'] != 'error' for item in items)
+                if committed:
+                    await loop.run_in_executor(None, journal.commit)
+                else:
+                    await loop.run_in_executor(None, journal.rollback)
+        finally:
+            for path in paths:
+                self.release_path(path)
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        for index, item in enumerate(items):
+            if item is None:
+                items[index] = {'status': 'skipped', 'hunks': None}
+            elif not committed and item['status'] != 'error':
+                item['status'] = 'rolled_back'
+        if committed:
+            for path in paths:
+                get_name_allocator().record(path)
+            written = sum(1 for item in items if item['status'] == 'success')
+            self.stats['written'] += written
+            self.stats['unchanged'] += len(items) - written
+            metrics.inc('files_written_total', written)
+            metrics.inc('writes_unchanged_total', len(items) - written)
+            logging.info(f'Applied batch of {len(items)} writes in {latency_ms:.1f} ms')
+        else:
+            self.stats['failed'] += 1
+            metrics.inc('errors_total', kind='write')
+            logging.error(f'Rolled back batch of {len(items)} writes')
+        return {'committed': committed, 'latencyMs': round(latency_ms, 3), 'items': items}
+
+    async def apply(self, path, entry):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        hunks = None
+        try:
+            if entry.merge:
+                written, hunks = await loop.run_in_executor(None, merge_file, path, entry.content)
+            else:
+                written = await loop.run_in_executor(None, write_file_if_changed, path, entry.content)
+        except Exception as e:
+            self.stats['failed'] += 1
+            metrics.inc('errors_total', kind='write')
+            for future in entry.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        get_name_allocator().record(path)
+        latency_ms = (time.perf_counter() - start) * 1000
+        coalesced = len(entry.futures) - 1
+        if written:
+            self.stats['written'] += 1
+            metrics.inc('files_written_total')
+        else:
+            self.stats['unchanged'] += 1
+            metrics.inc('writes_unchanged_total')
+            logging.info(f'Skipped write of {path}: content unchanged')
+        metrics.inc('writes_coalesced_total', coalesced)
+        self.stats['coalesced'] += coalesced
+        self.stats['latency_ms_total'] += latency_ms
+        self.stats['latency_ms_max'] = max(self.stats['latency_ms_max'], latency_ms)
+        if coalesced:
+            logging.info(f'Coalesced {coalesced} earlier writes into one write of {path}')
+        logging.debug(f'Wrote {path} in {latency_ms:.1f} ms')
+
+        last = len(entry.futures) - 1
+        for index, future in enumerate(entry.futures):
+            if not future.done():
+                future.set_result({
+                    'latencyMs': round(latency_ms, 3),
+                    'coalesced': coalesced,
+                    'superseded': index != last,
+                    'unchanged': not written,
+                    'hunks': hunks
+                })
+
+
+_write_coalescer = None
+
+
+def get_write_coalescer():
+    """
+    Returns the process-wide write coalescer.
+    """
+    global _write_coalescer
+    if _write_coalescer is None:
+        _write_coalescer = WriteCoalescer()
+        metrics.add_collector(lambda: {'writes_pending': len(_write_coalescer.pending)})
+    return _write_coalescer
@@ -0,0 +1,222 @@
+import asyncio
+import codecs
+import hashlib
+import logging
+
+from app.config.settings import SYNC_BATCH_MAX_BYTES, SYNC_BATCH_MAX_FILES, SYNC_CHUNK_BYTES, SYNC_ZSTD_LEVEL
+from app.utils.codec import JSON_CODEC
+from app.utils.metrics import record_frame_sent
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FRAMING_CONTENT = 'content'
+FRAMING_BATCH = 'batch'
+FRAMINGS = (FRAMING_CONTENT, FRAMING_BATCH)
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_DEFLATE = 'deflate'
+COMPRESSION_ZSTD = 'zstd'
+
+
+def negotiate_framing(requested):
+    """
+    Picks the framing mode for a SYNC. Unknown or missing values fall back to
+    one FILE_CONTENT frame per file, which every extension build understands.
+
+    Args:
+        requested (str | None): The 'framing' field of the SYNC message.
+
+    Returns:
+        str: The framing mode.
+    """
+    return requested if requested in FRAMINGS else FRAMING_CONTENT
+
+
+def negotiate_compression(websocket, accepted):
+    """
+    Picks the compression for a SYNC from the methods the client accepts.
+
+    zstd compresses each frame at the application level and sends it as a binary frame.
+    deflate relies on the permessage-deflate extension negotiated with the connection.
+
+    Args:
+        websocket: The websocket connection.
+        accepted (list[str] | None): The 'compression' field of the SYNC message.
+
+    Returns:
+        str: The compression method.
+    """
+    accepted = accepted or []
+    if COMPRESSION_ZSTD in accepted and zstandard is not None:
+        return COMPRESSION_ZSTD
+    if COMPRESSION_DEFLATE in accepted and has_permessage_deflate(websocket):
+        return COMPRESSION_DEFLATE
+    return COMPRESSION_NONE
+
+
+def has_permessage_deflate(websocket):
+    # The legacy API exposes extensions on the connection, the new one on its protocol
+    protocol = getattr(websocket, 'protocol', websocket)
+    extensions = getattr(protocol, 'extensions', None) or getattr(websocket, 'extensions', None) or []
+    return any(getattr(extension, 'name', None) == 'permessage-deflate' for extension in extensions)
+
+
+def encode_frame(message, codec, compression):
+    """
+    Serializes a message with the connection codec, compressing it if zstd was negotiated.
+
+    Returns:
+        str | bytes: A frame as produced by the codec, or a binary frame holding the
+            zstd compressed encoding.
+    """
+    frame = codec.dumps(message)
+    if compression == COMPRESSION_ZSTD:
+        if isinstance(frame, str):
+            frame = frame.encode('utf-8')
+        return zstandard.ZstdCompressor(level=SYNC_ZSTD_LEVEL).compress(frame)
+    return frame
+
+
+def decode_text(raw):
+    """
+    Decodes file content the way text mode reads it, translating newlines.
+    """
+    return raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+class FrameWriter:
+    """
+    Turns SYNC file records into websocket frames.
+
+    In 'content' framing each file becomes a FILE_CONTENT frame. In 'batch' framing small
+    files are packed into FILE_BATCH frames and files larger than the chunk size are
+    streamed as FILE_CHUNK frames, so memory use stays bounded whatever the file size.
+
+    With a binary codec file bodies are sent as the raw bytes read from disk.
+    """
+
+    def __init__(self, websocket, executor, framing=FRAMING_CONTENT, compression=COMPRESSION_NONE, codec=JSON_CODEC):
+        self.websocket = websocket
+        self.executor = executor
+        self.codec = codec
+        self.framing = framing
+        self.compression = compression
+        self.batch = []
+        self.batch_bytes = 0
+
+    @property
+    def max_inline_size(self):
+        """
+        Largest file read in one piece, or None when every file is sent whole.
+        """
+        return SYNC_CHUNK_BYTES if self.framing == FRAMING_BATCH else None
+
+    async def start(self, destination):
+        """
+        Tells the client which framing and compression this SYNC uses. The frame is never
+        compressed so the client can read it before knowing the outcome.
+        """
+        frame = self.codec.dumps({
+            'type': 'SYNC_START',
+            'destination': destination,
+            'framing': self.framing,
+            'compression': self.compression,
+            'chunkBytes': SYNC_CHUNK_BYTES
+        })
+        await self.websocket.send(frame)
+        record_frame_sent(frame)
+
+    async def send_message(self, message):
+        loop = asyncio.get_running_loop()
+        frame = await loop.run_in_executor(self.executor, encode_frame, message, self.codec, self.compression)
+        await self.websocket.send(frame)
+        record_frame_sent(frame)
+
+    async def send_file(self, record, hash_cache):
+        """
+        Sends one file record.
+
+        Args:
+            record (dict): filePath, content, hash and size of the file, or only filePath,
+                size and stat for a file too large to be read in one piece.
+            hash_cache (HashCache): The digest cache, updated when a file is streamed.
+        """
+        if 'content' not in record:
+            await self.flush()
+            await self.send_chunked_file(record, hash_cache)
+        elif self.framing == FRAMING_CONTENT:
+            await self.send_message({'type': 'FILE_CONTENT', **record})
+        else:
+            self.batch.append(record)
+            self.batch_bytes += len(record['content'])
+            if self.batch_bytes >= SYNC_BATCH_MAX_BYTES or len(self.batch) >= SYNC_BATCH_MAX_FILES:
+                await self.flush()
+
+    async def flush(self):
+        """
+        Sends the pending FILE_BATCH frame, if any.
+        """
+        if not self.batch:
+            return
+        files, self.batch, self.batch_bytes = self.batch, [], 0
+        await self.send_message({'type': 'FILE_BATCH', 'files': files})
+        logging.debug(f'Sent file batch of {len(files)} files')
+
+    async def send_chunked_file(self, record, hash_cache):
+        """
+        Streams a large file as FILE_CHUNK frames, holding one chunk in memory at a time.
+        The final chunk carries the hash and size of the whole file.
+        """
+        loop = asyncio.get_running_loop()
+        file_path = record['filePath']
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        digest = hashlib.sha256()
+        carry = ''
+        index = 0
+        f = await loop.run_in_executor(self.executor, open, file_path, 'rb')
+        try:
+            while True:
+                raw = await loop.run_in_executor(self.executor, f.read, SYNC_CHUNK_BYTES)
+                final = not raw
+                digest.update(raw)
+                if self.codec.binary:
+                    content = raw
+                else:
+                    text = carry + decoder.decode(raw, final=final)
+                    carry = ''
+                    # A '\r' at the chunk boundary may be the first half of '\r\n'
+                    if not final and text.endswith('\r'):
+                        text, carry = text[:-1], '\r'
+                    content = text.replace('\r\n', '\n').replace('\r', '\n')
+                message = {
+                    'type': 'FILE_CHUNK',
+                    'filePath': file_path,
+                    'index': index,
+                    'content': content,
+                    'final': final
+                }
+                if final:
+                    message['hash'] = digest.hexdigest()
+                    message['size'] = record['size']
+                await self.send_message(message)
+                index += 1
+                if final:
+                    break
+        except UnicodeDecodeError as e:
+            # Tell the client to discard the chunks it already received
+            logging.error(f'Error streaming file {file_path}: {e}')
+            await self.send_message({
+                'type': 'FILE_CHUNK',
+                'filePath': file_path,
+                'index': index,
+                'final': True,
+                'error': 'File is not valid UTF-8.'
+            })
+            return
+        finally:
+            await loop.run_in_executor(self.executor, f.close)
+        hash_cache.store(file_path, record['stat'], digest.hexdigest())
+        logging.debug(f'Streamed {file_path} in {index} chunks')
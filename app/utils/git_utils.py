@@ -1,28 +1,223 @@
-import subprocess
+import asyncio
 import logging
-import tempfile
 import os
+import time
+
+from app.config.settings import TRACKED_FILES_CACHE_MAX_AGE_S
+
+GIT_LS_FILES_COMMAND = ['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard']
+READ_CHUNK_SIZE = 64 * 1024
+
+GIT_LS_IGNORED_DIRECTORIES_COMMAND = ['ls-files', '-z', '--others', '--ignored', '--exclude-standard', '--directory']
+GIT_CHECK_IGNORE_COMMAND = ['git', 'check-ignore', '-z', '--stdin']
+
+# destination -> {'git_dir': str, 'ignored': set, 'config_paths': list, 'signature': tuple, 'files': list,
+#                 'listed_at': float}
+_tracked_files_cache = {}
 
 
 async def get_tracked_files(destination):
+    """
+    Lists the tracked and untracked, non-ignored files of the repository at destination.
+
+    Results are cached per destination and reused until the git index, the git config,
+    an ignore file of the worktree root or of a top-level directory, or the entries of
+    the worktree root or of a top-level directory outside ignored ones change. Deeper
+    changes that leave the index alone, like a new untracked file in a nested
+    directory, are picked up once the result is TRACKED_FILES_CACHE_MAX_AGE_S old, or
+    at once for files created by this server; see forget_tracked_files_of.
+
+    Args:
+        destination (str): The repository worktree.
+
+    Returns:
+        list[str]: Paths relative to destination, or an empty list on error.
+    """
     try:
-        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-            tmp_file_path = tmp_file.name
-            subprocess.run(
-                ['git', 'ls-files', '--cached', '--others', '--exclude-standard'],
-                cwd=destination,
-                stdout=tmp_file,
-                text=True,
-                encoding='utf-8'
-            )
-
-        with open(tmp_file_path, 'r', encoding='utf-8') as file:
-            tracked_files = file.read().splitlines()
-
-        os.remove(tmp_file_path)
-
-        logging.debug(f'Tracked files: {tracked_files}')
-        return tracked_files
+        cached = _tracked_files_cache.get(destination)
+        if cached and time.monotonic() - cached['listed_at'] > TRACKED_FILES_CACHE_MAX_AGE_S:
+            cached = _tracked_files_cache.pop(destination)
+            git_dir = cached['git_dir']
+        elif cached:
+            signature = await asyncio.to_thread(
+                compute_signature, destination, cached['git_dir'], cached['ignored'], cached['config_paths'])
+            if signature == cached['signature']:
+                logging.debug(f'Tracked files cache hit for {destination}')
+                return list(cached['files'])
+            git_dir = cached['git_dir']
+        else:
+            git_dir = await resolve_git_dir(destination)
+
+        config_paths = await resolve_config_paths(destination, git_dir)
+        ignored = await list_ignored_directories(destination)
+        # Take the signature before listing so that changes made meanwhile invalidate the entry
+        signature = await asyncio.to_thread(compute_signature, destination, git_dir, ignored, config_paths)
+        listed_at = time.monotonic()
+        tracked_files = await list_files(destination)
+        if signature == await asyncio.to_thread(compute_signature, destination, git_dir, ignored, config_paths):
+            _tracked_files_cache[destination] = {
+                'git_dir': git_dir,
+                'ignored': ignored,
+                'config_paths': config_paths,
+                'signature': signature,
+                'files': tracked_files,
+                'listed_at': listed_at
+            }
+
+        logging.debug(f'Tracked files: {len(tracked_files)} in {destination}')
+        return list(tracked_files)
     except Exception as e:
         logging.error(f'Error retrieving tracked files: {e}')
         return []
+
+
+def invalidate_tracked_files(destination=None):
+    """
+    Drops the cached file list of destination, or of every destination if omitted.
+    """
+    if destination is None:
+        _tracked_files_cache.clear()
+    else:
+        _tracked_files_cache.pop(destination, None)
+
+
+def forget_tracked_files_of(path):
+    """
+    Drops the cached file lists of the worktrees containing path, a file just created.
+    """
+    path = os.path.abspath(path)
+    for destination in list(_tracked_files_cache):
+        if path.startswith(os.path.join(os.path.abspath(destination), '')):
+            _tracked_files_cache.pop(destination, None)
+
+
+async def run_git(destination, *args):
+    process = await asyncio.create_subprocess_exec(
+        'git', *args,
+        cwd=destination,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(stderr.decode('utf-8', errors='replace').strip())
+    return stdout.decode('utf-8').strip()
+
+
+async def resolve_git_dir(destination):
+    """
+    Resolves the git directory of destination, which may live outside the worktree.
+    """
+    return await run_git(destination, 'rev-parse', '--absolute-git-dir')
+
+
+async def list_files(destination):
+    """
+    Streams the NUL separated output of git ls-files without buffering it to disk.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *GIT_LS_FILES_COMMAND,
+        cwd=destination,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    tracked_files = []
+    pending = b''
+    while True:
+        chunk = await process.stdout.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        entries = (pending + chunk).split(b'\0')
+        pending = entries.pop()
+        tracked_files.extend(entry.decode('utf-8') for entry in entries if entry)
+    if pending:
+        tracked_files.append(pending.decode('utf-8'))
+
+    stderr = await process.stderr.read()
+    if await process.wait() != 0:
+        raise RuntimeError(stderr.decode('utf-8', errors='replace').strip())
+    return tracked_files
+
+
+async def list_ignored_directories(destination):
+    """
+    Returns the worktree directories git ignores as a whole, relative to destination.
+    Nothing inside them can change the output of git ls-files. Directories that merely
+    hold ignored files, such as logs/ under '*.log', are not among them.
+    """
+    output = await run_git(destination, *GIT_LS_IGNORED_DIRECTORIES_COMMAND)
+    candidates = [entry for entry in output.split('\0') if entry.endswith('/')]
+    if not candidates:
+        return set()
+    process = await asyncio.create_subprocess_exec(
+        *GIT_CHECK_IGNORE_COMMAND,
+        cwd=destination,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate('\0'.join(candidates).encode('utf-8') + b'\0')
+    # check-ignore exits with 1 when none of the paths is ignored
+    if process.returncode not in (0, 1):
+        raise RuntimeError(stderr.decode('utf-8', errors='replace').strip())
+    return {entry.rstrip('/') for entry in stdout.decode('utf-8').split('\0') if entry}
+
+
+async def resolve_config_paths(destination, git_dir):
+    """
+    Returns the git config files and the global excludes file (core.excludesFile, or
+    its default location), whose changes can change which files are ignored.
+    """
+    xdg_config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+    try:
+        excludes_file = await run_git(destination, 'config', '--path', 'core.excludesFile')
+    except RuntimeError:
+        excludes_file = ''  # Not set
+    if not excludes_file:
+        excludes_file = os.path.join(xdg_config_home, 'git', 'ignore')
+    return [
+        os.path.join(git_dir, 'config'),
+        os.path.join(os.path.expanduser('~'), '.gitconfig'),
+        os.path.join(xdg_config_home, 'git', 'config'),
+        os.path.join(destination, excludes_file)
+    ]
+
+
+def compute_signature(destination, git_dir, ignored, config_paths):
+    """
+    Builds a cheap fingerprint of what most often changes the output of git ls-files.
+
+    It covers the index, the config and exclude files, and the mtime of the worktree
+    root and of its top-level directories, except the git directory, nested
+    repositories and ignored directories, since adding, removing or renaming an entry
+    updates its directory, together with their .gitignore files. Only the top level is
+    looked at, so the cost does not grow with the size of the tree.
+
+    Args:
+        destination (str): The repository worktree.
+        git_dir (str): The repository's git directory.
+        ignored (set[str]): The ignored directories, see list_ignored_directories.
+        config_paths (list[str]): The files returned by resolve_config_paths.
+
+    Returns:
+        tuple: The fingerprint.
+    """
+    paths = [os.path.join(git_dir, 'index'), os.path.join(git_dir, 'info', 'exclude')] + config_paths
+    paths += [destination, os.path.join(destination, '.gitignore')]
+    with os.scandir(destination) as entries:
+        directories = sorted(
+            entry.path for entry in entries
+            if entry.is_dir(follow_symlinks=False) and entry.name != '.git' and entry.name not in ignored
+            and not os.path.exists(os.path.join(entry.path, '.git'))
+        )
+    for directory in directories:
+        paths += [directory, os.path.join(directory, '.gitignore')]
+
+    signature = []
+    for path in paths:
+        try:
+            stat_result = os.stat(path)
+            signature.append((path, stat_result.st_mtime_ns, stat_result.st_size))
+        except FileNotFoundError:
+            signature.append((path, None, None))
+    return tuple(signature)
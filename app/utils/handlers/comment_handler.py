@@ -0,0 +1,169 @@
+import logging
+
+from app.utils.path_mapper import PathMappingError, get_path_mapper
+
+
+class CommentSyntax:
+    """
+    A form of the path comment, e.g. '// Path: app.js' or '<!-- Path: index.html -->'.
+    """
+
+    def __init__(self, prefix, suffix=''):
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def extract_path(self, line):
+        """
+        Returns the path held by a stripped header line, or None if the line is not a
+        path comment of this form.
+        """
+        if (line.startswith(self.prefix) and line.endswith(self.suffix)
+                and len(line) >= len(self.prefix) + len(self.suffix)):
+            return line[len(self.prefix):len(line) - len(self.suffix)].strip()
+        return None
+
+
+def read_line(content, start):
+    """
+    Returns the line starting at start and the offset of the next line, without
+    splitting the rest of the content.
+    """
+    end = content.find('\n', start)
+    if end == -1:
+        return content[start:], len(content)
+    return content[start:end], end + 1
+
+
+class CommentPathHandler:
+    """
+    Handler for any language whose snippets announce their path in a header comment.
+
+    Only the header lines are inspected; the body is taken as a single slice of the
+    content, so the cost does not depend on the number of lines.
+    """
+
+    def __init__(self, extension, syntaxes, preamble=None, trailing_newline=False):
+        """
+        Args:
+            extension (str): Extension appended to the base path when there is no path comment.
+            syntaxes (tuple[CommentSyntax]): Accepted forms of the path comment.
+            preamble (str, optional): A line that must open the file and precede the path
+                comment, such as '<?php'. It is kept at the top of the processed content.
+            trailing_newline (bool): Whether the processed content ends with a newline.
+        """
+        self.extension = extension
+        self.syntaxes = syntaxes
+        self.preamble = preamble
+        self.trailing_newline = trailing_newline
+
+    def extract_path(self, line):
+        for syntax in self.syntaxes:
+            path = syntax.extract_path(line)
+            if path is not None:
+                return path
+        return None
+
+    def process_content(self, content, base_path):
+        """
+        Processes the content by extracting the path from the first comment line and
+        returns the processed content and the final path to save. With a preamble, the
+        path comment may follow it on the same line or on the next one.
+
+        Args:
+            content (str): The original file content.
+            base_path (str): The base path derived from the original file path.
+
+        Returns:
+            tuple: (processed_content, final_path)
+        """
+        if not content:
+            logging.error("Content is empty.")
+            return None, None
+
+        header_start = 0
+        path = None
+        if self.preamble:
+            first_line, header_start = read_line(content, 0)
+            first_line = first_line.strip()
+            if not first_line.startswith(self.preamble):
+                logging.error(f"File does not start with {self.preamble}")
+                return None, None
+            # The path comment may share the preamble's line, e.g. '<?php // Path: app.php'
+            path = self.extract_path(first_line[len(self.preamble):].strip())
+            body_start = header_start
+            if path is None and header_start >= len(content):
+                logging.error("File does not contain a path comment.")
+                return None, None
+
+        if path is None:
+            header_line, body_start = read_line(content, header_start)
+            path = self.extract_path(header_line.strip())
+        if path is not None:
+            final_path = path
+            # Drop the path comment; strip() also removes the blank lines after it
+            processed_content = content[body_start:].strip()
+        else:
+            # If no path comment, use the provided base_path
+            final_path = base_path + self.extension
+            processed_content = content[header_start:].strip()
+
+        if '\r' in processed_content:
+            processed_content = processed_content.replace('\r\n', '\n').replace('\r', '\n')
+
+        # Translate paths written on other machines and keep writes inside the project roots
+        try:
+            final_path = get_path_mapper().resolve(final_path)
+        except PathMappingError as e:
+            logging.error(f"Rejected path: {e}")
+            return None, None
+
+        if self.preamble:
+            processed_content = f"{self.preamble}\n\n{processed_content}"
+        if self.trailing_newline:
+            processed_content += '\n'
+        return processed_content, final_path
+
+
+SLASH = CommentSyntax('// Path: ')
+BLOCK = CommentSyntax('/* Path: ', '*/')
+HASH = CommentSyntax('# Path: ')
+HTML = CommentSyntax('<!-- Path: ', '-->')
+DASH = CommentSyntax('-- Path: ')
+SEMICOLON = CommentSyntax('; Path: ')
+PERCENT = CommentSyntax('% Path: ')
+QUOTE = CommentSyntax("' Path: ")
+REM = CommentSyntax('REM Path: ')
+DOUBLE_COLON = CommentSyntax(':: Path: ')
+
+# (extensions, path comment syntaxes, preamble, trailing newline)
+LANGUAGES = (
+    (('.js', '.jsx', '.mjs', '.cjs', '.ts', '.tsx', '.mts', '.cts'), (SLASH, BLOCK), None, False),
+    (('.css',), (BLOCK,), None, False),
+    (('.html', '.htm'), (HTML,), None, False),
+    (('.php',), (SLASH, HASH, BLOCK), '<?php', False),
+    (('.py', '.pyi'), (HASH,), None, True),
+    (('.go', '.rs', '.c', '.h', '.cc', '.cpp', '.cxx', '.hpp', '.hh', '.cs', '.java', '.kt', '.kts',
+      '.scala', '.swift', '.dart', '.groovy', '.gradle', '.m', '.mm', '.proto', '.zig', '.scss',
+      '.less', '.jsonc'), (SLASH, BLOCK), None, True),
+    (('.sass',), (SLASH,), None, True),
+    (('.rb', '.sh', '.bash', '.zsh', '.fish', '.pl', '.pm', '.r', '.ps1', '.yaml', '.yml', '.toml',
+      '.cfg', '.conf', '.tf', '.nim', '.cr', '.ex', '.exs', '.jl', '.cmake', '.coffee', '.dockerfile'),
+     (HASH,), None, True),
+    (('.xml', '.xhtml', '.svg', '.vue', '.svelte', '.md', '.markdown'), (HTML,), None, True),
+    (('.sql', '.lua', '.hs', '.elm'), (DASH,), None, True),
+    (('.clj', '.cljs', '.lisp', '.el', '.scm', '.asm', '.ini'), (SEMICOLON,), None, True),
+    (('.erl', '.tex'), (PERCENT,), None, True),
+    (('.vb', '.vbs'), (QUOTE,), None, True),
+    (('.bat', '.cmd'), (REM, DOUBLE_COLON), None, True),
+)
+
+
+def build_extension_handler_map(languages=LANGUAGES):
+    """
+    Creates one handler per extension from the language table.
+    """
+    handler_map = {}
+    for extensions, syntaxes, preamble, trailing_newline in languages:
+        for extension in extensions:
+            handler_map[extension] = CommentPathHandler(extension, syntaxes, preamble, trailing_newline)
+    return handler_map
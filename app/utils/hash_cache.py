@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from app.config.settings import HASH_CACHE_PATH
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_bytes(data):
+    """
+    Computes the content digest used throughout the SYNC protocol.
+
+    Args:
+        data (bytes): The raw file content.
+
+    Returns:
+        str: The hex encoded SHA-256 digest.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path):
+    """
+    Computes the content digest of a file without loading it fully into memory.
+
+    Args:
+        path (str): The file to hash.
+
+    Returns:
+        str: The hex encoded SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashCache:
+    """
+    Persistent cache of file content digests.
+
+    Entries are keyed by path and validated against (inode, mtime, size), so an
+    unchanged file is never re-read or re-hashed.
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def stat_key(stat_result):
+        return [stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size]
+
+    def load(self):
+        """
+        Loads the cache from disk. A missing or corrupt cache file starts an empty cache.
+        """
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+            logging.debug(f'Loaded {len(self.entries)} hash cache entries from {self.cache_path}')
+        except Exception as e:
+            logging.error(f'Error loading hash cache {self.cache_path}: {e}')
+            self.entries = {}
+
+    def save(self):
+        """
+        Writes the cache to disk if it changed since the last save.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            snapshot = dict(self.entries)
+            self.dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            tmp_path = f'{self.cache_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.cache_path)
+            logging.debug(f'Saved {len(snapshot)} hash cache entries to {self.cache_path}')
+        except Exception as e:
+            logging.error(f'Error saving hash cache {self.cache_path}: {e}')
+
+    def lookup(self, path, stat_result):
+        """
+        Returns the cached digest for path if the file is unchanged.
+
+        Args:
+            path (str): The file path.
+            stat_result (os.stat_result): A fresh stat of the file.
+
+        Returns:
+            str | None: The cached digest, or None on a miss.
+        """
+        entry = self.entries.get(path)
+        if entry and entry[0] == self.stat_key(stat_result):
+            return entry[1]
+        return None
+
+    def store(self, path, stat_result, digest):
+        """
+        Records the digest of path as of stat_result.
+        """
+        with self.lock:
+            self.entries[path] = [self.stat_key(stat_result), digest]
+            self.dirty = True
+
+    def get_digest(self, path, stat_result=None):
+        """
+        Returns the digest of path, hashing the file only on a cache miss.
+
+        Args:
+            path (str): The file path.
+            stat_result (os.stat_result, optional): A fresh stat of the file.
+
+        Returns:
+            str: The hex encoded digest.
+        """
+        if stat_result is None:
+            stat_result = os.stat(path)
+        digest = self.lookup(path, stat_result)
+        if digest is None:
+            digest = hash_file(path)
+            self.store(path, stat_result, digest)
+        return digest
+
+
+_hash_cache = None
+
+
+def get_hash_cache():
+    """
+    Returns the process-wide hash cache, loading it on first use.
+    """
+    global _hash_cache
+    if _hash_cache is None:
+        _hash_cache = HashCache(HASH_CACHE_PATH)
+    return _hash_cache
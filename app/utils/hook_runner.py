@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import os
+import shlex
+import time
+
+from app.config.settings import HOOK_CONCURRENCY, HOOK_DEBOUNCE_MS, HOOK_OUTPUT_MAX_CHARS, HOOKS_CONFIG_PATH
+from app.utils.codec import get_connection_codec
+from app.utils.file_writer import get_write_coalescer
+from app.utils.hash_cache import get_hash_cache
+from app.utils.metrics import metrics, record_frame_sent
+from app.utils.version_store import snapshot_previous_version
+
+# Seconds a hook may run before it is killed, unless configured otherwise
+DEFAULT_HOOK_TIMEOUT = 60
+
+
+class Hook:
+    """
+    A command run on files after they are written, e.g. a formatter or a linter.
+
+    The command is a list of arguments (or a string split like a shell would). The
+    argument '{paths}' is replaced by the written paths and '{directory}' by the
+    directory the hook runs in.
+    """
+
+    def __init__(self, name, extensions, command, cwd=None, timeout=DEFAULT_HOOK_TIMEOUT):
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.name = name or self.command[0]
+        self.extensions = frozenset(extension.lower() for extension in extensions)
+        self.cwd = os.path.abspath(os.path.expanduser(cwd)) if cwd else None
+        self.timeout = timeout
+
+    def matches(self, path):
+        return os.path.splitext(path)[1].lower() in self.extensions
+
+    def build_command(self, paths, directory):
+        arguments = []
+        for argument in self.command:
+            if argument == '{paths}':
+                arguments.extend(paths)
+            else:
+                arguments.append(argument.replace('{directory}', directory))
+        return arguments
+
+
+def file_digests(paths, reason=None):
+    """
+    Returns the digest of each path, None for missing files. With a reason, the current
+    content of each file is first recorded in the version store.
+    """
+    digests = {}
+    for path in paths:
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            digests[path] = None
+            continue
+        if reason is not None:
+            snapshot_previous_version(path, stat_result, reason)
+        digests[path] = get_hash_cache().get_digest(path, stat_result)
+    return digests
+
+
+class HookBatch:
+    """
+    Paths waiting for one run of a hook.
+    """
+
+    def __init__(self):
+        self.paths = {}
+        self.websockets = set()
+        self.handle = None
+
+
+class HookRunner:
+    """
+    Runs post-write hooks in the background.
+
+    Written paths are grouped per hook and per directory (the hook's configured working
+    directory, or else the directory of the file) and the group runs once no path has
+    been added for the debounce window, so a multi-file answer triggers one invocation.
+    Hooks run as subprocesses, at most `concurrency` at a time. The result is sent to
+    every connection that wrote one of the paths as a HOOK_RESULT message.
+
+    A hook may rewrite its files, like a formatter does, so it runs holding the write
+    coalescer's lock of every path in its batch: saves to those paths wait for it, and
+    it waits for the saves in progress. The content it replaces is kept in the version
+    store, and the result lists the paths it 'changed'.
+
+    schedule never waits, so hooks cannot delay snippet acks.
+    """
+
+    def __init__(self, hooks=(), debounce_ms=HOOK_DEBOUNCE_MS, concurrency=HOOK_CONCURRENCY):
+        self.hooks = list(hooks)
+        self.debounce = debounce_ms / 1000
+        self.concurrency = max(1, concurrency)
+        self.slots = None
+        self.batches = {}
+        self.tasks = set()
+
+    def schedule(self, path, websocket=None):
+        """
+        Queues the hooks matching a written path.
+
+        Args:
+            path (str): The written file.
+            websocket (optional): The connection to report the results to.
+
+        Returns:
+            int: The number of hooks queued.
+        """
+        loop = asyncio.get_running_loop()
+        queued = 0
+        for index, hook in enumerate(self.hooks):
+            if not hook.matches(path):
+                continue
+            directory = hook.cwd or os.path.dirname(os.path.abspath(path))
+            key = (index, directory)
+            batch = self.batches.get(key)
+            if batch is None:
+                batch = self.batches[key] = HookBatch()
+            batch.paths[os.path.abspath(path)] = None
+            if websocket is not None:
+                batch.websockets.add(websocket)
+            if batch.handle is not None:
+                batch.handle.cancel()
+            batch.handle = loop.call_later(self.debounce, self.start, key)
+            queued += 1
+        return queued
+
+    def start(self, key):
+        batch = self.batches.pop(key)
+        task = asyncio.create_task(self.run(self.hooks[key[0]], key[1], batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run(self, hook, directory, batch):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.concurrency)
+        paths = list(batch.paths)
+        async with self.slots:
+            result = await self.execute_locked(hook, directory, paths)
+        metrics.inc('hooks_run_total', hook=hook.name, status=result['status'])
+        metrics.observe('hook_duration_seconds', result['durationMs'] / 1000, hook=hook.name)
+        if result['status'] == 'success':
+            logging.info(f'Hook {hook.name} ran on {len(paths)} files in {result["durationMs"]} ms')
+        else:
+            logging.error(f'Hook {hook.name} failed on {len(paths)} files: {result["output"]}')
+        for websocket in batch.websockets:
+            await send_hook_result(websocket, result)
+        return result
+
+    async def execute_locked(self, hook, directory, paths):
+        loop = asyncio.get_running_loop()
+        coalescer = get_write_coalescer()
+        await coalescer.acquire_paths(paths)
+        try:
+            before = await loop.run_in_executor(None, file_digests, paths, f'hook:{hook.name}')
+            result = await self.execute(hook, directory, paths)
+            after = await loop.run_in_executor(None, file_digests, paths)
+        finally:
+            for path in paths:
+                coalescer.release_path(path)
+        result['changed'] = [path for path in paths if before[path] != after[path]]
+        return result
+
+    async def execute(self, hook, directory, paths):
+        start = time.perf_counter()
+        command = hook.build_command(paths, directory)
+        result = {'type': 'HOOK_RESULT', 'hook': hook.name, 'directory': directory, 'paths': paths}
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                cwd=directory,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT
+            )
+            try:
+                output, _ = await asyncio.wait_for(process.communicate(), hook.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                output, _ = await process.communicate()
+                result.update(status='timeout', returncode=None)
+            else:
+                result.update(status='success' if process.returncode == 0 else 'error', returncode=process.returncode)
+            result['output'] = output.decode('utf-8', errors='replace')[-HOOK_OUTPUT_MAX_CHARS:]
+        except OSError as e:
+            result.update(status='error', returncode=None, output=str(e))
+        result['durationMs'] = round((time.perf_counter() - start) * 1000, 3)
+        return result
+
+    async def drain(self):
+        """
+        Runs the queued batches now and waits for every hook to finish.
+        """
+        for key, batch in list(self.batches.items()):
+            batch.handle.cancel()
+            self.start(key)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def send_hook_result(websocket, result):
+    try:
+        frame = get_connection_codec(websocket).dumps(result)
+        await websocket.send(frame)
+        record_frame_sent(frame)
+    except Exception as e:
+        logging.debug(f'Could not report hook result: {e}')
+
+
+def load_hook_runner(config_path=HOOKS_CONFIG_PATH):
+    """
+    Builds a HookRunner from a JSON file such as:
+
+        {
+            "hooks": [
+                {"name": "black", "extensions": [".py"], "command": ["black", "-q", "{paths}"]},
+                {"name": "prettier", "extensions": [".js", ".css"],
+                 "command": "npx prettier --write {paths}", "cwd": "~/project", "timeout": 30}
+            ]
+        }
+
+    A missing file configures no hooks.
+    """
+    if not os.path.exists(config_path):
+        return HookRunner()
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        hooks = [
+            Hook(
+                hook.get('name'),
+                hook['extensions'],
+                hook['command'],
+                hook.get('cwd'),
+                hook.get('timeout', DEFAULT_HOOK_TIMEOUT)
+            )
+            for hook in config.get('hooks', [])
+        ]
+        logging.info(f'Loaded {len(hooks)} post-write hooks from {config_path}')
+        return HookRunner(hooks)
+    except Exception as e:
+        logging.error(f'Error loading post-write hooks {config_path}: {e}')
+        return HookRunner()
+
+
+_hook_runner = None
+
+
+def get_hook_runner():
+    """
+    Returns the process-wide hook runner, loading the hook configuration on first use.
+    """
+    global _hook_runner
+    if _hook_runner is None:
+        _hook_runner = load_hook_runner()
+    return _hook_runner
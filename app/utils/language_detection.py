@@ -0,0 +1,155 @@
+import re
+from collections import namedtuple
+
+from app.utils.handlers import EXTENSION_HANDLER_MAP
+
+# Only this much of a snippet is ever inspected, whatever its size
+DETECTION_PREFIX_CHARS = 2048
+DETECTION_MAX_LINES = 5
+
+Detection = namedtuple('Detection', ['extension', 'confidence', 'source'])
+
+# Confidence of each signal on its own
+PATH_COMMENT_CONFIDENCE = 1.0
+FILENAME_COMMENT_CONFIDENCE = 0.9
+SHEBANG_CONFIDENCE = 0.8
+FENCE_CONFIDENCE = 0.7
+
+# A comment holding 'Path: <path>' or just a file name, e.g. '# Path: app/main.py',
+# '<!-- index.html -->' or '<?php // Path: app.php'
+COMMENT_PATTERN = re.compile(
+    r'^\s*(?:<\?php\s+)?(?://+|#|/\*+|<!--|--|;+|%|\'|REM\b|::)\s*'
+    r'(?P<label>Path:\s*)?(?P<path>[^\s]+?)\s*(?:\*/|-->)?\s*$',
+    re.IGNORECASE
+)
+EXTENSION_PATTERN = re.compile(r'(\.[A-Za-z0-9_+-]+)$')
+SHEBANG_PATTERN = re.compile(r'^#!\s*(?:\S*/)?(?:env\s+(?:-\S+\s+)*)?(?P<interpreter>[A-Za-z]+)')
+
+SHEBANG_EXTENSIONS = {
+    'python': '.py', 'node': '.js', 'deno': '.ts', 'bun': '.ts', 'bash': '.sh', 'sh': '.sh',
+    'zsh': '.zsh', 'fish': '.fish', 'ruby': '.rb', 'perl': '.pl', 'php': '.php', 'lua': '.lua',
+    'pwsh': '.ps1', 'julia': '.jl', 'elixir': '.exs', 'rscript': '.r',
+}
+
+FENCE_EXTENSIONS = {
+    'python': '.py', 'py': '.py', 'javascript': '.js', 'js': '.js', 'jsx': '.jsx', 'typescript': '.ts',
+    'ts': '.ts', 'tsx': '.tsx', 'html': '.html', 'css': '.css', 'scss': '.scss', 'less': '.less',
+    'php': '.php', 'go': '.go', 'golang': '.go', 'rust': '.rs', 'java': '.java', 'kotlin': '.kt',
+    'c': '.c', 'cpp': '.cpp', 'c++': '.cpp', 'csharp': '.cs', 'c#': '.cs', 'cs': '.cs', 'swift': '.swift',
+    'ruby': '.rb', 'bash': '.sh', 'sh': '.sh', 'shell': '.sh', 'zsh': '.zsh', 'powershell': '.ps1',
+    'yaml': '.yaml', 'yml': '.yml', 'toml': '.toml', 'sql': '.sql', 'lua': '.lua', 'vue': '.vue',
+    'svelte': '.svelte', 'xml': '.xml', 'markdown': '.md', 'md': '.md', 'dart': '.dart', 'scala': '.scala',
+    'r': '.r', 'perl': '.pl', 'haskell': '.hs', 'elixir': '.ex', 'dockerfile': '.dockerfile',
+}
+
+# Keywords opening a block in C-like languages, which a CSS selector line cannot start with
+BLOCK_KEYWORDS = (
+    'class', 'interface', 'struct', 'enum', 'type', 'trait', 'impl', 'object', 'record', 'namespace',
+    'module', 'export', 'public', 'private', 'protected', 'abstract', 'if', 'else', 'for', 'while',
+    'do', 'switch', 'try', 'func', 'fn', 'function',
+)
+
+# Cheap content heuristics over the prefix: (pattern, extension, confidence). Patterns must
+# not nest quantifiers, so that a pathological prefix cannot make them backtrack.
+CONTENT_HEURISTICS = (
+    (re.compile(r'^\s*<\?php\b'), '.php', 0.6),
+    (re.compile(r'^\s*(?:<!DOCTYPE html|<html\b)', re.IGNORECASE), '.html', 0.6),
+    (re.compile(r'^package\s+\w+\s*$', re.MULTILINE), '.go', 0.4),
+    (re.compile(r'^(?:def|class)\s+\w+.*:\s*$|^(?:from\s+[\w.]+\s+)?import\s+[\w.]+(?:\s+as\s+\w+)?\s*$',
+                re.MULTILINE), '.py', 0.4),
+    (re.compile(r'^(?:fn|pub fn|use\s+\w+::)', re.MULTILINE), '.rs', 0.4),
+    (re.compile(r'^(?:import\s.+\sfrom\s|export\s|const\s+\w+\s*=|function\s+\w+\s*\()', re.MULTILINE),
+     '.js', 0.35),
+    # A selector line opening a block, not led by a keyword, followed by a 'property: value;' line
+    (re.compile(r'^(?!(?:' + '|'.join(BLOCK_KEYWORDS) + r')\b)[.#]?[\w-][^\n{};()=]*\{[ \t]*\n'
+                r'[ \t]*[\w-]+[ \t]*:[^\n{};]*;', re.MULTILINE), '.css', 0.3),
+)
+
+
+def supported_extension(extension):
+    """
+    Returns the lower-cased extension if a handler exists for it, else None.
+    """
+    if extension:
+        extension = extension.lower()
+        if extension in EXTENSION_HANDLER_MAP:
+            return extension
+    return None
+
+
+def detect_path_comment(lines):
+    for line in lines:
+        match = COMMENT_PATTERN.match(line)
+        if not match:
+            continue
+        extension_match = EXTENSION_PATTERN.search(match.group('path'))
+        extension = supported_extension(extension_match.group(1)) if extension_match else None
+        if extension:
+            if match.group('label'):
+                return Detection(extension, PATH_COMMENT_CONFIDENCE, 'path_comment')
+            return Detection(extension, FILENAME_COMMENT_CONFIDENCE, 'filename_comment')
+    return None
+
+
+def detect_shebang(first_line):
+    match = SHEBANG_PATTERN.match(first_line)
+    if match:
+        interpreter = match.group('interpreter').lower().rstrip('0123456789')
+        extension = SHEBANG_EXTENSIONS.get(interpreter)
+        if extension:
+            return Detection(extension, SHEBANG_CONFIDENCE, 'shebang')
+    return None
+
+
+def detect_fence(language):
+    if language:
+        extension = supported_extension(FENCE_EXTENSIONS.get(language.strip().lower()))
+        if extension:
+            return Detection(extension, FENCE_CONFIDENCE, 'fence')
+    return None
+
+
+def detect_content(prefix):
+    for pattern, extension, confidence in CONTENT_HEURISTICS:
+        if pattern.search(prefix):
+            return Detection(extension, confidence, 'content')
+    return None
+
+
+def detect_language(content, language=None):
+    """
+    Detects the language of a snippet from its path comment, shebang, the fence language
+    reported by the extension and cheap content heuristics.
+
+    Only the first DETECTION_PREFIX_CHARS characters and DETECTION_MAX_LINES lines are
+    inspected. The strongest signal wins; signals that agree with it raise its confidence.
+
+    Args:
+        content (str): The snippet.
+        language (str, optional): The language of the code fence, e.g. 'python'.
+
+    Returns:
+        Detection | None: The extension, a confidence in [0, 1] and the winning signal.
+    """
+    prefix = content[:DETECTION_PREFIX_CHARS]
+    lines = prefix.split('\n', DETECTION_MAX_LINES)[:DETECTION_MAX_LINES]
+
+    detections = [
+        detection
+        for detection in (
+            detect_path_comment(lines),
+            detect_shebang(lines[0]) if lines else None,
+            detect_fence(language),
+            detect_content(prefix),
+        )
+        if detection
+    ]
+    if not detections:
+        return None
+
+    best = max(detections, key=lambda detection: detection.confidence)
+    doubt = 1.0 - best.confidence
+    for detection in detections:
+        if detection is not best and detection.extension == best.extension:
+            doubt *= 1.0 - detection.confidence
+    return best._replace(confidence=round(1.0 - doubt, 3))
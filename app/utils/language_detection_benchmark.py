@@ -0,0 +1,53 @@
+"""
+Micro-benchmark and accuracy report of the snippet language detection.
+
+Run with: python -m app.utils.language_detection_benchmark [lines]
+"""
+import json
+import os
+import re
+import sys
+import timeit
+
+from app.utils.language_detection import detect_language
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), '..', 'tests', 'language_detection_corpus.json')
+
+
+def legacy_detect_extension(content):
+    # The former detect_extension, kept for comparison
+    for line in content.splitlines()[:5]:
+        if match := re.search(r'\.\w+\s|\.\w+$', line):
+            return match.group().strip()
+
+
+def accuracy(detect):
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    hits = sum(1 for case in corpus if detect(case) == case['expected'])
+    return hits, len(corpus)
+
+
+def main(lines=200000):
+    content = '# Path: /tmp/project/generated.py\n' + '\n'.join(
+        f'def function_{index}(value):\n    return value * {index}' for index in range(lines // 2))
+    runs = 20
+
+    legacy = timeit.timeit(lambda: legacy_detect_extension(content), number=runs) / runs
+    engine = timeit.timeit(lambda: detect_language(content), number=runs) / runs
+
+    def detect(case):
+        detection = detect_language(case['content'], case.get('language'))
+        return detection.extension if detection else None
+
+    legacy_hits, total = accuracy(lambda case: legacy_detect_extension(case['content']))
+    engine_hits, _ = accuracy(detect)
+
+    print(f'{len(content) / 1e6:.1f} MB, {lines} lines')
+    print(f'legacy detection: {legacy * 1000:8.3f} ms, {legacy_hits}/{total} correct')
+    print(f'engine:           {engine * 1000:8.3f} ms, {engine_hits}/{total} correct ({legacy / engine:.0f}x)')
+    print(json.dumps(detect_language(content)._asdict()))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
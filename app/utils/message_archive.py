@@ -0,0 +1,558 @@
+import bisect
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config.settings import (
+    MESSAGE_ARCHIVE_DIRECTORY,
+    MESSAGE_ARCHIVE_FSYNC_INTERVAL_MS,
+    MESSAGE_ARCHIVE_FSYNC_RECORDS,
+    MESSAGE_ARCHIVE_SEGMENT_BYTES
+)
+from app.utils.archive_codec import CODEC_ZSTD, DICTIONARY_MAX_SAMPLES, RecordCodec
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Record layout: magic, body length, CRC-32 of the rest of the header and the body,
+# timestamp (ms), flags (the content encoding, see archive_codec), id length, path
+# length; then the id, path and encoded content bytes
+RECORD_MAGIC = b'CTFM'
+RECORD_HEADER = struct.Struct('>4sIIqHHI')
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{8})\.log$')
+# Held by the process that has the archive open for writing
+LOCK_NAME = 'LOCK'
+
+# Sealed segments are rewritten by compact once this share of their bytes is superseded
+COMPACT_MIN_DEAD_RATIO = 0.3
+
+IndexEntry = namedtuple('IndexEntry', ['segment', 'offset', 'length', 'timestamp'])
+ArchivedMessage = namedtuple('ArchivedMessage', ['id', 'timestamp', 'path', 'content'])
+
+
+class ArchiveCorruptError(ValueError):
+    """
+    Raised when a record does not match its checksum.
+    """
+
+
+class ArchiveLockedError(RuntimeError):
+    """
+    Raised when the archive is opened for writing while another process has it open for
+    writing, e.g. the archive CLI while the server is running.
+    """
+
+
+def lock_file(path):
+    """
+    Opens path and takes an exclusive lock on it without waiting. Returns the open file,
+    which holds the lock until it is closed.
+
+    Raises:
+        ArchiveLockedError: If another process holds the lock.
+    """
+    f = open(path, 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        raise ArchiveLockedError(f'{os.path.dirname(path)} is open for writing by another process.')
+    return f
+
+
+def segment_name(number, suffix='.log'):
+    return f'segment-{number:08d}{suffix}'
+
+
+def message_timestamp(message_id):
+    """
+    Returns the millisecond timestamp embedded in an extension message id
+    ('<prefix>-<ms>...'), or the current time for ids without one.
+    """
+    try:
+        return int(str(message_id).split('-')[1])
+    except (IndexError, ValueError):
+        return int(time.time() * 1000)
+
+
+def encode_record(message_id, payload, path, timestamp, flags=0):
+    """
+    Returns the bytes of a record holding payload, the content as encoded by the
+    archive's RecordCodec with these flags.
+    """
+    id_bytes = message_id.encode('utf-8')
+    path_bytes = (path or '').encode('utf-8')
+    body = id_bytes + path_bytes + payload
+    fields = struct.pack('>qHHI', timestamp, flags, len(id_bytes), len(path_bytes))
+    crc = zlib.crc32(body, zlib.crc32(fields))
+    return RECORD_HEADER.pack(RECORD_MAGIC, len(body), crc, timestamp, flags, len(id_bytes), len(path_bytes)) + body
+
+
+def decode_header(data, offset):
+    """
+    Returns (body length, crc, timestamp, flags, id length, path length) of the record at
+    offset, or None if no complete header is there.
+    """
+    if offset + RECORD_HEADER.size > len(data):
+        return None
+    magic, *fields = RECORD_HEADER.unpack_from(data, offset)
+    if magic != RECORD_MAGIC:
+        return None
+    return fields
+
+
+def read_record(data, offset):
+    """
+    Returns (message id, timestamp, path, flags, payload) of the record at offset, with
+    the payload still encoded.
+    """
+    body_length, crc, timestamp, flags, id_length, path_length = decode_header(data, offset)
+    start = offset + RECORD_HEADER.size
+    body = data[start:start + body_length]
+    if zlib.crc32(body, zlib.crc32(struct.pack('>qHHI', timestamp, flags, id_length, path_length))) != crc:
+        raise ArchiveCorruptError(f'Corrupt archive record at offset {offset}.')
+    message_id = body[:id_length].decode('utf-8')
+    path = body[id_length:id_length + path_length].decode('utf-8') or None
+    return message_id, timestamp, path, flags, body[id_length + path_length:]
+
+
+def decode_record(data, offset, codec):
+    message_id, timestamp, path, flags, payload = read_record(data, offset)
+    return ArchivedMessage(message_id, timestamp, path, codec.decompress(flags, payload).decode('utf-8'))
+
+
+def format_document(message):
+    """
+    Returns an archived message as the HTML document the chat browser parses, with the
+    project path in a leading <path> element.
+    """
+    return f'<path>{message.path}</path>\n{message.content}'
+
+
+class MessageArchive:
+    """
+    Append-only log of assistant messages, split into numbered segment files.
+
+    Messages are appended to the active segment as checksummed, length-prefixed records.
+    Once it reaches segment_bytes the segment is sealed: it is fsync'ed and its offset
+    index is written next to it as segment-N.idx, so opening the archive only scans the
+    active segment. Appends are fsync'ed in batches, every fsync_records records or
+    fsync_interval_ms, and on sync or close; a torn record left by a crash is cut off
+    when the archive is next opened for writing.
+
+    The in-memory index maps message ids to their latest record and keeps the messages
+    sorted by timestamp. Records are read through mmap. Appending an id again supersedes
+    its earlier record, whose space compact reclaims.
+
+    Message content is compressed by a RecordCodec; the record flags say how, so reads
+    decompress transparently whatever the archive was written with. With zstd, a
+    dictionary is trained when the first segment is sealed, and recompress re-encodes
+    an existing archive.
+
+    Opened for writing, the archive holds an exclusive lock on its LOCK file until it is
+    closed, so the server and the archive CLI never modify it at the same time. Opened
+    read-only, e.g. by the chat browser while the server is running, the archive takes
+    no lock and never modifies the files.
+    """
+
+    def __init__(self, directory=MESSAGE_ARCHIVE_DIRECTORY, readonly=False,
+                 segment_bytes=MESSAGE_ARCHIVE_SEGMENT_BYTES,
+                 fsync_records=MESSAGE_ARCHIVE_FSYNC_RECORDS,
+                 fsync_interval_ms=MESSAGE_ARCHIVE_FSYNC_INTERVAL_MS,
+                 codec=None):
+        self.directory = directory
+        self.readonly = readonly
+        self.segment_bytes = segment_bytes
+        self.fsync_records = fsync_records
+        self.fsync_interval = fsync_interval_ms / 1000
+        self.index = {}
+        self.by_time = []
+        self.segment_sizes = {}
+        self.maps = {}
+        self.active = None
+        self.active_file = None
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.lock = threading.RLock()
+        self.lock_file = None
+        self.codec = RecordCodec(directory, codec)
+        self.load()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, message_id):
+        return message_id in self.index
+
+    def segment_path(self, number, suffix='.log'):
+        return os.path.join(self.directory, segment_name(number, suffix))
+
+    def load(self):
+        if not os.path.isdir(self.directory):
+            if self.readonly:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+        if not self.readonly:
+            self.lock_file = lock_file(os.path.join(self.directory, LOCK_NAME))
+        numbers = sorted(
+            int(match.group(1))
+            for match in map(SEGMENT_PATTERN.match, os.listdir(self.directory)) if match
+        )
+        for number in numbers:
+            if self.load_segment_index(number):
+                continue
+            sealed = number != numbers[-1] or os.path.exists(self.segment_path(number, '.idx'))
+            size = self.scan_segment(number, truncate=not sealed and not self.readonly)
+            if sealed and not self.readonly:
+                self.write_segment_index(number, size)
+        if not self.readonly:
+            if numbers and not os.path.exists(self.segment_path(numbers[-1], '.idx')):
+                self.open_active(numbers[-1])
+            else:
+                self.open_active(numbers[-1] + 1 if numbers else 1)
+
+    def add_entry(self, message_id, entry):
+        previous = self.index.get(message_id)
+        if previous is not None:
+            position = bisect.bisect_left(self.by_time, (previous.timestamp, message_id))
+            if position < len(self.by_time) and self.by_time[position] == (previous.timestamp, message_id):
+                del self.by_time[position]
+        self.index[message_id] = entry
+        bisect.insort(self.by_time, (entry.timestamp, message_id))
+
+    def load_segment_index(self, number):
+        """
+        Loads the index of a sealed segment. Returns False if there is none, or it does not
+        describe the segment as it is on disk.
+        """
+        try:
+            with open(self.segment_path(number, '.idx'), 'r', encoding='utf-8') as f:
+                segment_index = json.load(f)
+            size = os.path.getsize(self.segment_path(number))
+        except (OSError, ValueError):
+            return False
+        if segment_index.get('size') != size:
+            return False
+        for message_id, offset, length, timestamp in segment_index['entries']:
+            self.add_entry(message_id, IndexEntry(number, offset, length, timestamp))
+        self.segment_sizes[number] = size
+        return True
+
+    def scan_segment(self, number, truncate=False):
+        """
+        Indexes a segment by walking its record headers and returns the size of its valid
+        part. With truncate, a torn or corrupt tail is cut off the file.
+        """
+        path = self.segment_path(number)
+        size = os.path.getsize(path)
+        offset = 0
+        if size:
+            with self.map_segment(number) as data:
+                while True:
+                    header = decode_header(data, offset)
+                    if header is None:
+                        break
+                    length = RECORD_HEADER.size + header[0]
+                    if offset + length > size:
+                        break
+                    try:
+                        message_id, timestamp = read_record(data, offset)[:2]
+                    except (ArchiveCorruptError, UnicodeDecodeError):
+                        break
+                    self.add_entry(message_id, IndexEntry(number, offset, length, timestamp))
+                    offset += length
+        if offset < size:
+            if truncate:
+                logging.warning(f'Truncating {size - offset} bytes of torn records from {path}')
+                with open(path, 'r+b') as f:
+                    f.truncate(offset)
+            else:
+                logging.debug(f'Ignoring {size - offset} incomplete bytes at the end of {path}')
+        self.segment_sizes[number] = offset
+        return offset
+
+    def write_segment_index(self, number, size):
+        entries = [
+            [message_id, entry.offset, entry.length, entry.timestamp]
+            for message_id, entry in self.index.items() if entry.segment == number
+        ]
+        entries.sort(key=lambda entry: entry[1])
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'size': size, 'entries': entries}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.segment_path(number, '.idx'))
+
+    def open_active(self, number):
+        self.active = number
+        self.active_file = open(self.segment_path(number), 'ab')
+        self.segment_sizes.setdefault(number, self.active_file.tell())
+
+    def append(self, message_id, content, path=None, timestamp=None):
+        """
+        Appends a message to the archive.
+
+        Args:
+            message_id (str): The message id; a later record with the same id supersedes
+                this one.
+            content (str): The message HTML.
+            path (str, optional): The project path the message belongs to.
+            timestamp (int, optional): Milliseconds since the epoch, by default taken
+                from the message id.
+
+        Returns:
+            IndexEntry: Where the record was written.
+        """
+        if self.readonly:
+            raise PermissionError('The message archive is open read-only.')
+        if timestamp is None:
+            timestamp = message_timestamp(message_id)
+        flags, payload = self.codec.compress(content.encode('utf-8'))
+        record = encode_record(message_id, payload, path, timestamp, flags)
+        with self.lock:
+            if self.segment_sizes[self.active] and self.segment_sizes[self.active] + len(record) > self.segment_bytes:
+                self.roll_over()
+            offset = self.segment_sizes[self.active]
+            self.active_file.write(record)
+            self.active_file.flush()
+            self.segment_sizes[self.active] = offset + len(record)
+            entry = IndexEntry(self.active, offset, len(record), timestamp)
+            self.add_entry(message_id, entry)
+            self.unsynced += 1
+            if self.unsynced >= self.fsync_records or time.monotonic() - self.last_sync >= self.fsync_interval:
+                self.sync()
+            return entry
+
+    def sync(self):
+        """
+        fsyncs the records appended since the last sync.
+        """
+        with self.lock:
+            if self.active_file is not None and self.unsynced:
+                self.active_file.flush()
+                os.fsync(self.active_file.fileno())
+            self.unsynced = 0
+            self.last_sync = time.monotonic()
+
+    def roll_over(self):
+        self.sync()
+        self.active_file.close()
+        self.write_segment_index(self.active, self.segment_sizes[self.active])
+        logging.info(f'Sealed message archive segment {segment_name(self.active)}')
+        self.open_active(self.active + 1)
+        if self.codec.codec == CODEC_ZSTD and not self.codec.dictionary_id:
+            self.train_dictionary()
+
+    def train_dictionary(self):
+        """
+        Trains a zstd dictionary on the latest messages; records appended from then on use
+        it. Returns the dictionary id, or None.
+        """
+        with self.lock:
+            samples = [
+                self.read(message_id).content.encode('utf-8')
+                for _, message_id in self.by_time[-DICTIONARY_MAX_SAMPLES:]
+            ]
+            return self.codec.train(samples)
+
+    def map_segment(self, number):
+        with open(self.segment_path(number), 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_map(self, number, end):
+        """
+        Returns a mapping of a segment covering its first end bytes; the active segment is
+        remapped as it grows.
+        """
+        mapped = self.maps.get(number)
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+            mapped = self.maps[number] = self.map_segment(number)
+        return mapped
+
+    def read(self, message_id):
+        """
+        Returns the latest ArchivedMessage with this id, or None.
+        """
+        with self.lock:
+            entry = self.index.get(message_id)
+            if entry is None:
+                return None
+            mapped = self.get_map(entry.segment, entry.offset + entry.length)
+            return decode_record(mapped, entry.offset, self.codec)
+
+    def list_messages(self, since=None, until=None, limit=None):
+        """
+        Returns (timestamp, message id) pairs, newest first, optionally restricted to
+        timestamps in [since, until) and to the first limit pairs.
+        """
+        with self.lock:
+            start = 0 if since is None else bisect.bisect_left(self.by_time, (since,))
+            end = len(self.by_time) if until is None else bisect.bisect_left(self.by_time, (until,))
+            if limit is not None:
+                start = max(start, end - limit)
+            return self.by_time[start:end][::-1]
+
+    def compact(self, min_dead_ratio=COMPACT_MIN_DEAD_RATIO):
+        """
+        Rewrites the sealed segments in which at least min_dead_ratio of the bytes belong
+        to superseded records, keeping only the latest record of each id. Segments left
+        without live records are deleted.
+
+        Returns:
+            int: The number of bytes reclaimed.
+        """
+        if self.readonly:
+            raise PermissionError('The message archive is open read-only.')
+        reclaimed = 0
+        with self.lock:
+            for number in sorted(self.segment_sizes):
+                if number == self.active:
+                    continue
+                size = self.segment_sizes[number]
+                live = sorted(
+                    ((message_id, entry) for message_id, entry in self.index.items() if entry.segment == number),
+                    key=lambda item: item[1].offset
+                )
+                live_bytes = sum(entry.length for _, entry in live)
+                if not size or (size - live_bytes) / size < min_dead_ratio:
+                    continue
+                reclaimed += size - live_bytes
+                mapped = self.maps.pop(number, None)
+                if not live:
+                    if mapped is not None:
+                        mapped.close()
+                    os.remove(self.segment_path(number, '.idx'))
+                    os.remove(self.segment_path(number))
+                    del self.segment_sizes[number]
+                    continue
+                if mapped is None:
+                    mapped = self.map_segment(number)
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                offset = 0
+                with os.fdopen(fd, 'wb') as f:
+                    for message_id, entry in live:
+                        f.write(mapped[entry.offset:entry.offset + entry.length])
+                        self.index[message_id] = entry._replace(offset=offset)
+                        offset += entry.length
+                    f.flush()
+                    os.fsync(f.fileno())
+                mapped.close()
+                # A crash between the two renames leaves an index whose size does not match
+                # the segment, which is then rescanned on load
+                os.replace(tmp_path, self.segment_path(number))
+                self.segment_sizes[number] = offset
+                self.write_segment_index(number, offset)
+        if reclaimed:
+            logging.info(f'Compacted the message archive, reclaiming {reclaimed} bytes')
+        return reclaimed
+
+    def rewrite_segment(self, number):
+        """
+        Writes the live records of a sealed segment, encoded with the current codec, to a
+        temporary file. Returns (number, temporary path, {message id: new offset and
+        length}).
+        """
+        live = sorted(
+            ((message_id, entry) for message_id, entry in self.index.items() if entry.segment == number),
+            key=lambda item: item[1].offset
+        )
+        mapped = self.map_segment(number)
+        moved = {}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                offset = 0
+                for message_id, entry in live:
+                    message = decode_record(mapped, entry.offset, self.codec)
+                    flags, payload = self.codec.compress(message.content.encode('utf-8'))
+                    record = encode_record(message_id, payload, message.path, message.timestamp, flags)
+                    f.write(record)
+                    moved[message_id] = (offset, len(record))
+                    offset += len(record)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        finally:
+            mapped.close()
+        return number, tmp_path, moved
+
+    def recompress(self, workers=None):
+        """
+        Re-encodes every message with the current codec, dropping superseded records on
+        the way. The active segment is sealed first, and a zstd dictionary is trained if
+        there is none yet. Segments are rewritten in parallel; zstd and zlib release the
+        GIL while they compress.
+
+        Returns:
+            tuple: The archive size in bytes before and after.
+        """
+        if self.readonly:
+            raise PermissionError('The message archive is open read-only.')
+        with self.lock:
+            if self.segment_sizes[self.active]:
+                self.roll_over()
+            if self.codec.codec == CODEC_ZSTD and not self.codec.dictionary_id and self.index:
+                self.train_dictionary()
+            numbers = [number for number in sorted(self.segment_sizes) if number != self.active]
+            before = sum(self.segment_sizes[number] for number in numbers)
+            with ThreadPoolExecutor(workers) as pool:
+                rewritten = list(pool.map(self.rewrite_segment, numbers))
+            for number, tmp_path, moved in rewritten:
+                mapped = self.maps.pop(number, None)
+                if mapped is not None:
+                    mapped.close()
+                os.replace(tmp_path, self.segment_path(number))
+                for message_id, (offset, length) in moved.items():
+                    self.index[message_id] = self.index[message_id]._replace(offset=offset, length=length)
+                self.segment_sizes[number] = sum(length for _, length in moved.values())
+                self.write_segment_index(number, self.segment_sizes[number])
+            after = sum(self.segment_sizes[number] for number in numbers)
+        logging.info(f'Recompressed the message archive from {before} to {after} bytes')
+        return before, after
+
+    def close(self):
+        with self.lock:
+            if self.active_file is not None:
+                self.sync()
+                self.active_file.close()
+                self.active_file = None
+            for mapped in self.maps.values():
+                mapped.close()
+            self.maps.clear()
+            if self.lock_file is not None:
+                self.lock_file.close()
+                self.lock_file = None
+
+
+_message_archive = None
+
+
+def get_message_archive():
+    """
+    Returns the process-wide message archive, opening it for writing on first use.
+    """
+    global _message_archive
+    if _message_archive is None:
+        _message_archive = MessageArchive()
+    return _message_archive
@@ -0,0 +1,253 @@
+import asyncio
+import bisect
+import logging
+import time
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = 'chatgpt_to_file_'
+
+MESSAGE_KINDS = ('SYNC', 'METRICS', 'VERSIONS', 'snippet', 'batch', 'assistant')
+
+METRIC_HELP = {
+    'message_duration_seconds': ('histogram', 'Time spent handling a message, by message kind.'),
+    'frames_received_total': ('counter', 'Websocket frames received.'),
+    'frames_sent_total': ('counter', 'Websocket frames sent.'),
+    'bytes_received_total': ('counter', 'Websocket payload bytes received.'),
+    'bytes_sent_total': ('counter', 'Websocket payload bytes sent.'),
+    'files_written_total': ('counter', 'Files written to disk.'),
+    'writes_coalesced_total': ('counter', 'Writes folded into a later write of the same file.'),
+    'writes_unchanged_total': ('counter', 'Writes skipped because the file already held the content.'),
+    'hooks_run_total': ('counter', 'Post-write hook runs, by hook and status.'),
+    'hook_duration_seconds': ('histogram', 'Duration of post-write hook runs, by hook.'),
+    'message_store_evictions_total': ('counter', 'Assistant messages evicted from the in-memory store.'),
+    'message_store_archive_reads_total': ('counter', 'Evicted assistant messages read back from disk.'),
+    'messages_archived_total': ('counter', 'Assistant messages appended to the message archive.'),
+    'message_flush_seconds': ('histogram', 'Time spent archiving a batch of assistant messages.'),
+    'duplicates_total': ('counter', 'Re-sent messages answered as already stored, by message kind.'),
+    'errors_total': ('counter', 'Error responses and failed operations, by message kind.'),
+    'log_records_dropped_total': ('counter', 'Log records dropped because the log queue was full.'),
+    'connections': ('gauge', 'Open websocket connections.'),
+    'messages_in_flight': ('gauge', 'Messages being handled.'),
+    'syncs_in_flight': ('gauge', 'SYNC requests being served.'),
+    'message_store_messages': ('gauge', 'Assistant messages held in memory.'),
+    'message_store_bytes': ('gauge', 'Bytes of assistant message content held in memory.'),
+    'message_write_queue_depth': ('gauge', 'Assistant messages waiting to be archived.'),
+    'writes_pending': ('gauge', 'File writes waiting for their coalescing window.'),
+}
+
+
+class Histogram:
+    """
+    A cumulative histogram with fixed bucket bounds, as exposed by Prometheus.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(list(self.buckets) + [float('inf')], self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """
+    Holds the server's counters, gauges and histograms, keyed by name and labels.
+
+    Metrics are updated from the event loop only. Collectors registered with
+    add_collector compute additional gauges when the metrics are read.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = []
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self.key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        self.gauges[self.key(name, labels)] = value
+
+    def add_gauge(self, name, amount, **labels):
+        key = self.key(name, labels)
+        self.gauges[key] = self.gauges.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = self.key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def add_collector(self, collector):
+        """
+        Registers a callable returning {gauge name: value}, evaluated on every read.
+        """
+        self.collectors.append(collector)
+
+    def collect(self):
+        for collector in self.collectors:
+            try:
+                for name, value in collector().items():
+                    self.set_gauge(name, value)
+            except Exception as e:
+                logging.error(f'Error collecting metrics: {e}')
+
+    def snapshot(self):
+        """
+        Returns every metric as plain data, for the METRICS websocket message.
+        """
+        self.collect()
+
+        def entries(metrics, render):
+            result = {}
+            for (name, labels), value in sorted(metrics.items()):
+                result.setdefault(name, []).append({'labels': dict(labels), **render(value)})
+            return result
+
+        return {
+            'counters': entries(self.counters, lambda value: {'value': value}),
+            'gauges': entries(self.gauges, lambda value: {'value': value}),
+            'histograms': entries(self.histograms, lambda histogram: {
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'buckets': [[bound if bound != float('inf') else '+Inf', total]
+                            for bound, total in histogram.cumulative()]
+            })
+        }
+
+    def render_prometheus(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        self.collect()
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name in described:
+                return
+            described.add(name)
+            metric_type, text = METRIC_HELP.get(name, ('untyped', name))
+            lines.append(f'# HELP {METRIC_PREFIX}{name} {text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}{name} {metric_type}')
+
+        for metrics in (self.counters, self.gauges):
+            for (name, labels), value in sorted(metrics.items()):
+                describe(name)
+                lines.append(f'{METRIC_PREFIX}{name}{format_labels(labels)} {value}')
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            describe(name)
+            for bound, total in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{METRIC_PREFIX}{name}_bucket{format_labels(labels + (("le", le),))} {total}')
+            lines.append(f'{METRIC_PREFIX}{name}_sum{format_labels(labels)} {histogram.sum}')
+            lines.append(f'{METRIC_PREFIX}{name}_count{format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in labels) + '}'
+
+
+def message_kind(data):
+    """
+    Returns the label identifying a message in metrics, bounded to the known kinds.
+    """
+    kind = data.get('type') or data.get('kind')
+    return kind if kind in MESSAGE_KINDS else 'unknown'
+
+
+def frame_size(frame):
+    """
+    Returns the payload size in bytes of a websocket frame.
+    """
+    if isinstance(frame, str) and not frame.isascii():
+        return len(frame.encode('utf-8'))
+    return len(frame)
+
+
+def record_frame_received(frame):
+    metrics.inc('frames_received_total')
+    metrics.inc('bytes_received_total', frame_size(frame))
+
+
+def record_frame_sent(frame):
+    metrics.inc('frames_sent_total')
+    metrics.inc('bytes_sent_total', frame_size(frame))
+
+
+class Timer:
+    """
+    Context manager observing the elapsed time into a latency histogram.
+    """
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+async def handle_metrics_request(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', metrics.render_prometheus().encode('utf-8')
+        else:
+            status, body = '404 Not Found', b'Not Found\n'
+        writer.write(
+            f'HTTP/1.1 {status}\r\n'
+            'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            'Connection: close\r\n\r\n'.encode('latin-1') + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logging.error(f'Error serving metrics request: {e}')
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host, port):
+    """
+    Serves the metrics in the Prometheus text format at http://host:port/metrics.
+    """
+    server = await asyncio.start_server(handle_metrics_request, host, port)
+    logging.info(f'Metrics endpoint started on http://{host}:{port}/metrics')
+    return server
+
+
+metrics = MetricsRegistry()
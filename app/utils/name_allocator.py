@@ -0,0 +1,130 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Directories whose suffix index is kept in memory
+NAME_INDEX_MAX_DIRECTORIES = 256
+
+SUFFIX_PATTERN = re.compile(r'^(?P<stem>.*)\((?P<counter>\d+)\)$')
+
+
+def split_name(name):
+    """
+    Splits a file name into (stem, extension, counter), where 'a(3).py' gives
+    ('a', '.py', 3) and 'a.py' gives ('a', '.py', 0).
+    """
+    root, extension = os.path.splitext(name)
+    match = SUFFIX_PATTERN.match(root)
+    if match:
+        return match.group('stem'), extension, int(match.group('counter'))
+    return root, extension, 0
+
+
+class NameAllocator:
+    """
+    Picks free 'base(N).ext' names for saves that must not overwrite an existing file.
+
+    Each directory is listed once with os.scandir into an index of whether the plain name
+    exists and the highest counter used per (stem, extension); later allocations take the
+    next counter without probing the disk. Names are claimed by creating the file with
+    O_EXCL, so two concurrent saves never get the same name; a claim that loses to a file
+    created behind our back simply moves on to the next counter. Claims touch the disk,
+    so they run on the writer's executor; see file_writer.write_new_file.
+    """
+
+    def __init__(self, max_directories=NAME_INDEX_MAX_DIRECTORIES):
+        self.max_directories = max_directories
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_index(self, directory):
+        index = self.indexes.get(directory)
+        if index is not None:
+            self.indexes.move_to_end(directory)
+            return index
+        index = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    self.add(index, entry.name)
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        self.indexes[directory] = index
+        if len(self.indexes) > self.max_directories:
+            self.indexes.popitem(last=False)
+        return index
+
+    @staticmethod
+    def add(index, name):
+        stem, extension, counter = split_name(name)
+        used = index.setdefault((stem, extension), [False, 0])
+        if counter == 0:
+            used[0] = True
+        elif counter > used[1]:
+            used[1] = counter
+
+    def claim(self, path):
+        """
+        Creates an empty file at path, or at the first free 'base(N).ext' after the
+        highest counter in use, and returns its path.
+
+        Args:
+            path (str): The desired file path.
+
+        Returns:
+            str: The claimed file path, to be replaced with the real content.
+        """
+        directory, name = os.path.split(path)
+        directory = directory or '.'
+        stem, extension = os.path.splitext(name)
+        key = (stem, extension)
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            index = self.get_index(directory)
+            base_taken, highest = index.get(key, (False, 0))
+            counter = highest + 1 if base_taken else 0
+            while True:
+                candidate = name if counter == 0 else f'{stem}({counter}){extension}'
+                candidate_path = os.path.join(os.path.dirname(path), candidate)
+                try:
+                    fd = os.open(candidate_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+                except FileExistsError:
+                    counter = highest + 1 if counter == 0 else counter + 1
+                    continue
+                os.close(fd)
+                self.add(index, candidate)
+                return candidate_path
+
+    def release(self, path):
+        """
+        Removes a claimed file that was never written.
+        """
+        try:
+            if os.path.getsize(path) == 0:
+                os.remove(path)
+        except OSError:
+            pass
+
+    def record(self, path):
+        """
+        Notes that path now exists, for directories that are already indexed.
+        """
+        directory, name = os.path.split(path)
+        with self.lock:
+            index = self.indexes.get(directory or '.')
+            if index is not None:
+                self.add(index, name)
+
+
+_name_allocator = None
+
+
+def get_name_allocator():
+    """
+    Returns the process-wide name allocator.
+    """
+    global _name_allocator
+    if _name_allocator is None:
+        _name_allocator = NameAllocator()
+    return _name_allocator
@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+
+from app.config.settings import PATH_MAPPINGS_PATH
+
+# Directories whose resolved real path is kept in memory
+REALPATH_CACHE_SIZE = 4096
+
+DRIVE_PATTERN = re.compile(r'^[A-Za-z]:$')
+
+
+class PathMappingError(ValueError):
+    """
+    Raised when a snippet path is outside every configured project root.
+    """
+
+
+def split_path(path):
+    """
+    Splits a path written on any platform, with '/' or '\\' separators, into its
+    components. Absolute paths start with '/' or a lower-cased drive such as 'z:'.
+
+    Examples:
+        'Z:/home/user/app.py' -> ['z:', 'home', 'user', 'app.py']
+        '/home/user/./app.py' -> ['/', 'home', 'user', 'app.py']
+    """
+    path = path.replace('\\', '/')
+    components = [component for component in path.split('/') if component and component != '.']
+    if components and DRIVE_PATTERN.match(components[0]):
+        components[0] = components[0].lower()
+    elif path.startswith('/'):
+        components.insert(0, '/')
+    return components
+
+
+def is_absolute(components):
+    return bool(components) and (components[0] == '/' or DRIVE_PATTERN.match(components[0]) is not None)
+
+
+class TrieNode:
+    __slots__ = ('children', 'root')
+
+    def __init__(self):
+        self.children = {}
+        self.root = None
+
+
+class PathMapper:
+    """
+    Rewrites snippet paths written on other machines to the local project roots.
+
+    The prefixes of the mapping table are compiled into a trie of path components, so a
+    path is resolved by walking its own components, at a cost independent of the number
+    of configured projects; the longest matching prefix wins. Every local root also
+    maps to itself.
+
+    With sandboxing on, paths that match no prefix, or that leave their root through
+    '..' or symlinks, are rejected. The real paths of the directories involved are
+    cached; see realpath.
+    """
+
+    def __init__(self, mappings=(), roots=(), sandbox=True):
+        """
+        Args:
+            mappings (iterable[tuple]): (foreign prefix, local root) pairs.
+            roots (iterable[str]): Additional local roots, mapped to themselves.
+            sandbox (bool): Whether to reject paths outside the roots.
+        """
+        self.trie = TrieNode()
+        self.roots = set()
+        self.sandbox = sandbox
+        self.realpaths = OrderedDict()
+        for prefix, root in mappings:
+            self.add(prefix, root)
+        for root in roots:
+            self.add(root, root)
+
+    def add(self, prefix, root):
+        root = os.path.abspath(os.path.expanduser(root))
+        for components in (split_path(prefix), split_path(root)):
+            node = self.trie
+            for component in components:
+                node = node.children.setdefault(component, TrieNode())
+            if node.root is None:
+                node.root = root
+        self.roots.add(root)
+
+    @property
+    def enabled(self):
+        return bool(self.roots)
+
+    def realpath(self, directory):
+        """
+        Returns the real path of a directory. Cached entries are only reused while the
+        directory still stats as the same device and inode, so one swapped for a symlink,
+        or with a swapped parent, is resolved again.
+        """
+        try:
+            stat_result = os.stat(directory)
+        except OSError:
+            return os.path.realpath(directory)  # Not created yet; nothing to cache
+        identity = (stat_result.st_dev, stat_result.st_ino)
+        cached = self.realpaths.get(directory)
+        if cached is not None and cached[0] == identity:
+            self.realpaths.move_to_end(directory)
+            return cached[1]
+        real = os.path.realpath(directory)
+        self.realpaths[directory] = (identity, real)
+        self.realpaths.move_to_end(directory)
+        if len(self.realpaths) > REALPATH_CACHE_SIZE:
+            self.realpaths.popitem(last=False)
+        return real
+
+    def resolve(self, path):
+        """
+        Returns the local path a snippet path refers to.
+
+        Args:
+            path (str): The path from the snippet, possibly written on another machine.
+
+        Returns:
+            str: The local path; unchanged when no mapping is configured.
+
+        Raises:
+            PathMappingError: If sandboxing is on and the path is outside every root.
+        """
+        if not self.enabled:
+            return path
+        components = split_path(path)
+        if not is_absolute(components):
+            components = split_path(os.path.abspath(path))
+
+        node = self.trie
+        match = None
+        for depth, component in enumerate(components):
+            node = node.children.get(component)
+            if node is None:
+                break
+            if node.root is not None:
+                match = node.root, depth + 1
+        if match is None:
+            if self.sandbox:
+                raise PathMappingError(f'{path} is outside the configured project roots.')
+            return path
+
+        root, depth = match
+        target = os.path.normpath(os.path.join(root, *components[depth:]))
+        if self.sandbox:
+            real_root = self.realpath(root)
+            real_target = os.path.join(self.realpath(os.path.dirname(target)), os.path.basename(target))
+            if os.path.commonpath([real_root, real_target]) != real_root or real_target == real_root:
+                raise PathMappingError(f'{path} escapes the project root {root}.')
+        return target
+
+
+def load_path_mapper(config_path=PATH_MAPPINGS_PATH):
+    """
+    Builds a PathMapper from a JSON file such as:
+
+        {
+            "mappings": [{"prefix": "Z:/home/user/project", "root": "/Users/me/project"}],
+            "roots": ["/Users/me/other-project"],
+            "sandbox": true
+        }
+
+    A missing file disables mapping and sandboxing.
+    """
+    if not os.path.exists(config_path):
+        return PathMapper()
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        mapper = PathMapper(
+            [(mapping['prefix'], mapping['root']) for mapping in config.get('mappings', [])],
+            config.get('roots', []),
+            config.get('sandbox', True)
+        )
+        logging.info(f'Loaded {len(mapper.roots)} project roots from {config_path}')
+        return mapper
+    except Exception as e:
+        logging.error(f'Error loading path mappings {config_path}: {e}')
+        raise
+
+
+_path_mapper = None
+
+
+def get_path_mapper():
+    """
+    Returns the process-wide path mapper, loading the mapping table on first use.
+    """
+    global _path_mapper
+    if _path_mapper is None:
+        _path_mapper = load_path_mapper()
+    return _path_mapper
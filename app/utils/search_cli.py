@@ -0,0 +1,53 @@
+"""
+Searches the archived messages, or rebuilds their full-text index from the archive.
+
+Run with:
+    python -m app.utils.search_cli query <words...> [--limit N] [--raw]
+    python -m app.utils.search_cli rebuild
+"""
+import argparse
+import datetime
+import sys
+import time
+
+from app.utils.message_archive import MessageArchive
+from app.utils.search_index import SearchIndex
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.utils.search_cli', description=__doc__.strip().split('\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    query_command = commands.add_parser('query', help='print the best matches, best first')
+    query_command.add_argument('words', nargs='+')
+    query_command.add_argument('--limit', type=int, default=20)
+    query_command.add_argument('--raw', action='store_true', help='pass the words as an FTS5 query')
+    commands.add_parser('rebuild', help='index every message of the archive')
+    args = parser.parse_args(argv)
+
+    if args.command == 'rebuild':
+        index = SearchIndex()
+        archive = MessageArchive(readonly=True)
+        try:
+            print(f'Indexed {index.rebuild(archive)} messages')
+        finally:
+            archive.close()
+            index.close()
+        return 0
+
+    index = SearchIndex(readonly=True)
+    start = time.perf_counter()
+    results = index.search(' '.join(args.words), args.limit, args.raw)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    for result in results:
+        stored_at = ''
+        if result.timestamp is not None:
+            stored_at = datetime.datetime.fromtimestamp(result.timestamp / 1000).isoformat(sep=' ', timespec='seconds')
+        print(f'{stored_at:19}  {result.id}  {result.path or ""}')
+        print(f'    {result.snippet}')
+    print(f'{len(results)} results in {elapsed_ms:.1f} ms', file=sys.stderr)
+    index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
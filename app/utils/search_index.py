@@ -0,0 +1,313 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+from html.parser import HTMLParser
+
+from app.config.settings import SEARCH_INDEX_PATH
+from app.utils.language_detection import COMMENT_PATTERN, detect_language
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    timestamp INTEGER,
+    path TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    text, code, language, paths, model_slug,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+'''
+
+# Column weights of the bm25 ranking, in the column order of documents_fts
+RANK_WEIGHTS = (1.0, 1.0, 2.0, 4.0, 2.0)
+TOKEN_PATTERN = re.compile(r'"[^"]*"|\S+')
+
+SearchResult = namedtuple('SearchResult', ['id', 'timestamp', 'path', 'snippet', 'rank'])
+
+
+class MessageTextExtractor(HTMLParser):
+    """
+    Splits ChatGPT message markup into prose and code, the text of <pre> blocks, and picks
+    up the model slug of the message. Within a <pre> holding a <code> element only the
+    code is kept, not the language header and copy button around it.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.text = []
+        self.blocks = []
+        self.depth = 0
+        self.code_depth = 0
+        self.model_slug = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'pre':
+            if not self.depth:
+                self.blocks.append({'pre': [], 'code': None})
+            self.depth += 1
+        elif tag == 'code' and self.depth:
+            if self.blocks[-1]['code'] is None:
+                self.blocks[-1]['code'] = []
+            self.code_depth += 1
+        if self.model_slug is None:
+            self.model_slug = dict(attrs).get('data-message-model-slug')
+
+    def handle_endtag(self, tag):
+        if tag == 'pre' and self.depth:
+            self.depth -= 1
+        elif tag == 'code' and self.code_depth:
+            self.code_depth -= 1
+
+    def handle_data(self, data):
+        if not self.depth:
+            self.text.append(data)
+            return
+        self.blocks[-1]['pre'].append(data)
+        if self.code_depth:
+            self.blocks[-1]['code'].append(data)
+
+    def code_blocks(self):
+        return [''.join(block['pre'] if block['code'] is None else block['code']) for block in self.blocks]
+
+
+def code_metadata(blocks):
+    """
+    Returns the languages and the path comments of code blocks.
+    """
+    languages = []
+    paths = []
+    for code in blocks:
+        detection = detect_language(code)
+        if detection and detection.extension and detection.extension[1:] not in languages:
+            languages.append(detection.extension[1:])
+        for line in code.lstrip().split('\n', 2)[:2]:
+            match = COMMENT_PATTERN.match(line)
+            if match and ('/' in match.group('path') or '.' in match.group('path')):
+                paths.append(match.group('path'))
+                break
+    return languages, paths
+
+
+def extract_message(content):
+    """
+    Returns the indexed fields of an archived message's HTML.
+    """
+    extractor = MessageTextExtractor()
+    extractor.feed(content)
+    extractor.close()
+    blocks = extractor.code_blocks()
+    languages, paths = code_metadata(blocks)
+    return {
+        'text': ' '.join(' '.join(extractor.text).split()),
+        'code': '\n'.join(blocks),
+        'language': ' '.join(languages),
+        'paths': ' '.join(paths),
+        'model_slug': extractor.model_slug or ''
+    }
+
+
+def extract_parsed_message(parsed_json):
+    """
+    Returns the indexed fields of a message parsed by the chat browser.
+    """
+    message = parsed_json.get('message', {})
+    items = message.get('content', {}).get('items', [])
+    snippets = [item for item in items if item.get('type') == 'code_snippet']
+    blocks = [item.get('code', '') for item in snippets]
+    languages, paths = code_metadata(blocks)
+    for item in snippets:
+        language = (item.get('language') or '').lower()
+        if language and language not in languages:
+            languages.append(language)
+    return {
+        'text': ' '.join(f'{item.get("title", "")} {item.get("description", "")}' for item in snippets),
+        'code': '\n'.join(blocks),
+        'language': ' '.join(languages),
+        'paths': ' '.join(paths),
+        'model_slug': message.get('model_slug') or ''
+    }
+
+
+def build_query(query):
+    """
+    Turns free text into an FTS5 query: every word is matched as a quoted phrase, so
+    'auth.py' or 'user-id' need no escaping, and a trailing '*' keeps prefix matching.
+    Words already in double quotes are kept as phrases.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(query):
+        prefix = token.endswith('*') and not token.startswith('"')
+        token = token.rstrip('*') if prefix else token
+        token = token.strip('"').replace('"', '""')
+        if token:
+            terms.append(f'"{token}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+class SearchIndex:
+    """
+    SQLite FTS5 full-text index of the archived messages: their prose, code, languages,
+    file paths and model slug, ranked with bm25.
+
+    documents maps message ids to the rowids of documents_fts, so re-indexing a message
+    replaces its row instead of scanning the index. The database is in WAL mode, which
+    lets the chat browser search while the server indexes.
+    """
+
+    def __init__(self, index_path=SEARCH_INDEX_PATH, readonly=False):
+        self.index_path = index_path
+        self.readonly = readonly
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.connection is None:
+            if self.readonly:
+                self.connection = sqlite3.connect(f'file:{self.index_path}?mode=ro', uri=True, check_same_thread=False)
+            else:
+                os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+                self.connection = sqlite3.connect(self.index_path, check_same_thread=False)
+                self.connection.execute('PRAGMA journal_mode=WAL')
+                self.connection.execute('PRAGMA synchronous=NORMAL')
+                self.connection.executescript(SCHEMA)
+        return self.connection
+
+    def add_many(self, documents):
+        """
+        Indexes documents, replacing earlier versions with the same id, in one transaction.
+
+        Args:
+            documents (iterable[tuple]): (message id, timestamp, project path, fields)
+                tuples, with fields as returned by extract_message. The project path is
+                indexed with the paths of the code blocks.
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                for message_id, timestamp, path, fields in documents:
+                    row = connection.execute('SELECT rowid FROM documents WHERE id = ?', (message_id,)).fetchone()
+                    if row is None:
+                        rowid = connection.execute(
+                            'INSERT INTO documents (id, timestamp, path) VALUES (?, ?, ?)',
+                            (message_id, timestamp, path)
+                        ).lastrowid
+                    else:
+                        rowid = row[0]
+                        connection.execute(
+                            'UPDATE documents SET timestamp = COALESCE(?, timestamp), path = COALESCE(?, path) '
+                            'WHERE rowid = ?',
+                            (timestamp, path, rowid)
+                        )
+                        connection.execute('DELETE FROM documents_fts WHERE rowid = ?', (rowid,))
+                    connection.execute(
+                        'INSERT INTO documents_fts (rowid, text, code, language, paths, model_slug) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (rowid, fields['text'], fields['code'], fields['language'],
+                         f'{path or ""} {fields["paths"]}'.strip(), fields['model_slug'])
+                    )
+
+    def add_messages(self, messages):
+        """
+        Indexes archived messages with add_many. A message whose HTML cannot be extracted
+        is logged and left out instead of failing the others.
+
+        Args:
+            messages (iterable[tuple]): (message id, timestamp, project path, HTML) tuples.
+
+        Returns:
+            int: The number of messages indexed.
+        """
+        documents = []
+        for message_id, timestamp, path, content in messages:
+            try:
+                documents.append((message_id, timestamp, path, extract_message(content)))
+            except Exception as e:
+                logging.error(f'Error extracting message {message_id} for the search index: {e}')
+        self.add_many(documents)
+        return len(documents)
+
+    def add_message(self, message_id, content, path=None, timestamp=None):
+        self.add_messages([(message_id, timestamp, path, content)])
+
+    def add_parsed_message(self, message_id, content, parsed_json, timestamp=None):
+        """
+        Indexes a message the chat browser parsed, adding the snippet titles, languages
+        and model slug of the parsed JSON to the fields of its HTML.
+        """
+        fields = extract_message(content)
+        parsed = extract_parsed_message(parsed_json)
+        for name in ('language', 'paths'):
+            fields[name] = ' '.join(dict.fromkeys(f'{fields[name]} {parsed[name]}'.split()))
+        fields['text'] = f'{fields["text"]} {parsed["text"]}'.strip()
+        fields['model_slug'] = fields['model_slug'] or parsed['model_slug']
+        path = parsed_json.get('message', {}).get('path')
+        self.add_many([(message_id, timestamp, path, fields)])
+
+    def search(self, query, limit=20, raw=False):
+        """
+        Returns the best matches of a query, best first.
+
+        Args:
+            query (str): Free text, see build_query; with raw, an FTS5 query.
+            limit (int): The maximum number of results.
+
+        Returns:
+            list[SearchResult]: The matches; snippet highlights the terms with [ and ].
+        """
+        match = query if raw else build_query(query)
+        if not match:
+            return []
+        with self.lock:
+            try:
+                rows = self.connect().execute(
+                    'SELECT d.id, d.timestamp, d.path, '
+                    "snippet(documents_fts, -1, '[', ']', '...', 12), "
+                    f'bm25(documents_fts, {", ".join(map(str, RANK_WEIGHTS))}) AS rank '
+                    'FROM documents_fts JOIN documents d ON d.rowid = documents_fts.rowid '
+                    'WHERE documents_fts MATCH ? ORDER BY rank LIMIT ?',
+                    (match, limit)
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                if 'no such table' in str(e) or 'unable to open' in str(e):
+                    return []
+                raise
+        return [SearchResult(*row) for row in rows]
+
+    def rebuild(self, archive):
+        """
+        Indexes every message of a MessageArchive.
+
+        Returns:
+            int: The number of messages indexed.
+        """
+        messages = []
+        for timestamp, message_id in archive.list_messages():
+            message = archive.read(message_id)
+            messages.append((message_id, timestamp, message.path, message.content))
+        indexed = self.add_messages(messages)
+        logging.info(f'Indexed {indexed} of {len(messages)} archived messages')
+        return indexed
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+_search_index = None
+
+
+def get_search_index():
+    """
+    Returns the process-wide search index, opened for writing on first use.
+    """
+    global _search_index
+    if _search_index is None:
+        _search_index = SearchIndex()
+    return _search_index
@@ -0,0 +1,247 @@
+import difflib
+import re
+from collections import namedtuple
+
+# A whole comment line standing for omitted code and nothing else, e.g.
+# '// ... existing code ...', '# ...' or '<!-- rest of the file unchanged -->'.
+# Ordinary comments that merely mention such words, like '# call other functions
+# first', are not elisions.
+ELISION_PATTERN = re.compile(
+    r'^\s*(?://+|#+|/\*+|<!--|--|;+|\{/\*)\s*'
+    r'(?:\.{3}|…)?\s*'
+    r'(?P<phrase>(?:the )?(?:existing|previous|other|remaining|unchanged) '
+    r'(?:code|content|implementation|logic|imports|methods|functions|styles|rules)'
+    r'(?: (?:here|goes here|remains? unchanged|unchanged))?'
+    r'|(?:the )?rest of (?:the )?(?:code|file|class|function|component|implementation)'
+    r'(?: (?:remains? )?unchanged)?'
+    r'|(?:code|file) unchanged)?'
+    r'\s*(?:\.{3}|…)?\s*(?:\*+/|-->|\*/\})?\s*$',
+    re.IGNORECASE
+)
+ELLIPSIS_PATTERN = re.compile(r'\.{3}|…')
+# Lines too common to anchor a hunk on their own, such as '}' or 'end'
+MIN_ANCHOR_LENGTH = 4
+ANCHOR_PATTERN = re.compile(r'\w')
+# Hunk lines next to the matched ones replace file lines at least this similar
+FUZZY_MIN_RATIO = 0.75
+# Matched parts of a hunk are kept together when the file lines between them exceed the
+# hunk lines between them by at most this many; beyond that they belong elsewhere
+MAX_REMOVED_LINES = 20
+
+Hunk = namedtuple('Hunk', ['lines', 'elided_before', 'elided_after'])
+
+
+class MergeError(ValueError):
+    """
+    Raised when a partial snippet cannot be placed into the existing file. hunks holds
+    the per-hunk results when some hunks were placed and others were not.
+    """
+
+    def __init__(self, message, hunks=None):
+        super().__init__(message)
+        self.hunks = hunks
+
+
+def is_elision(line):
+    match = ELISION_PATTERN.match(line)
+    return match is not None and (match.group('phrase') is not None or ELLIPSIS_PATTERN.search(line) is not None)
+
+
+def has_elision(snippet):
+    """
+    Returns whether the snippet leaves out parts of the file with elision comments.
+    """
+    return any(is_elision(line) for line in snippet.split('\n'))
+
+
+def split_hunks(snippet):
+    """
+    Splits a partial snippet into the runs of lines between elision comments, without
+    the blank lines at their edges, noting whether code is elided before and after each.
+    """
+    hunks = []
+    current = []
+    elided = False
+    for line in snippet.split('\n') + [None]:
+        if line is None or is_elision(line):
+            while current and not current[-1].strip():
+                current.pop()
+            if current:
+                hunks.append(Hunk(current, elided, line is not None))
+            current = []
+            elided = elided or line is not None
+        elif current or line.strip():
+            current.append(line)
+    return hunks
+
+
+def is_anchor(key):
+    return len(key) >= MIN_ANCHOR_LENGTH and ANCHOR_PATTERN.search(key) is not None
+
+
+def similar(a, b):
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    return matcher.real_quick_ratio() >= FUZZY_MIN_RATIO and matcher.ratio() >= FUZZY_MIN_RATIO
+
+
+def indentation(line):
+    return len(line) - len(line.lstrip())
+
+
+def reach(lines, keys, line, positions):
+    """
+    Returns the first of the file positions whose line equals line, else the first whose
+    line resembles it before the scan leaves the block line belongs to, else None.
+    """
+    positions = list(positions)
+    exact = next((position for position in positions if lines[position] == line), None)
+    if exact is not None or not is_anchor(line.strip()):
+        return exact
+    for position in positions:
+        if keys[position] and indentation(lines[position]) < indentation(line):
+            return None
+        if similar(keys[position], line.strip()):
+            return position
+    return None
+
+
+def occurrences(keys, lines, start):
+    """
+    Returns the positions at or after start where the file lines equal keys.
+    """
+    return [
+        position for position in range(start, len(lines) - len(keys) + 1)
+        if lines[position] == keys[0] and lines[position:position + len(keys)] == keys
+    ]
+
+
+def locate(hunk, lines, keys, cursor):
+    """
+    Returns the [start, end) range of file lines a hunk replaces, 'ambiguous', or None.
+
+    The hunk is diffed against the file from cursor on. Its longest run of matching lines
+    is the core; it must occur only once, else the hunk is ambiguous. The other matching
+    runs join the core while they stay close to it, and the file lines between the first
+    and last joined runs are replaced by the hunk, so lines edited, inserted or removed
+    inside the hunk are all taken into account. Unmatched hunk lines at the edges
+    replace the neighbouring file lines they resemble; past those, the region reaches
+    to the nearest file line identical to the first or last hunk line, such as the
+    closing '}' of an edited function, or else to the nearest line of the same block
+    resembling it, such as the 'return' a new one replaces. The rest is inserted.
+    """
+    hunk_keys = [line.strip() for line in hunk]
+    region = keys[cursor:]
+    matcher = difflib.SequenceMatcher(lambda key: not is_anchor(key), region, hunk_keys, autojunk=False)
+    blocks = [block for block in matcher.get_matching_blocks() if block.size]
+    blocks = [block for block in blocks if any(is_anchor(key) for key in hunk_keys[block.b:block.b + block.size])]
+    if not blocks:
+        return None
+    core = max(range(len(blocks)), key=lambda index: blocks[index].size)
+    if len(occurrences(hunk_keys[blocks[core].b:blocks[core].b + blocks[core].size], region, 0)) > 1:
+        return 'ambiguous'
+
+    first = last = core
+    while first > 0 and (blocks[first].a - blocks[first - 1].a - blocks[first - 1].size) <= \
+            (blocks[first].b - blocks[first - 1].b - blocks[first - 1].size) + MAX_REMOVED_LINES:
+        first -= 1
+    while last < len(blocks) - 1 and (blocks[last + 1].a - blocks[last].a - blocks[last].size) <= \
+            (blocks[last + 1].b - blocks[last].b - blocks[last].size) + MAX_REMOVED_LINES:
+        last += 1
+
+    start = cursor + blocks[first].a
+    index = blocks[first].b - 1
+    while index >= 0 and start > cursor and similar(keys[start - 1], hunk_keys[index]):
+        start -= 1
+        index -= 1
+    if index >= 0:
+        floor = max(cursor, start - index - 1 - MAX_REMOVED_LINES)
+        reached = reach(lines, keys, hunk[0], range(start - 1, floor - 1, -1))
+        start = start if reached is None else reached
+    end = cursor + blocks[last].a + blocks[last].size
+    index = blocks[last].b + blocks[last].size
+    while index < len(hunk_keys) and end < len(keys) and similar(keys[end], hunk_keys[index]):
+        end += 1
+        index += 1
+    if index < len(hunk_keys):
+        ceiling = min(len(lines), end + len(hunk_keys) - index + MAX_REMOVED_LINES)
+        reached = reach(lines, keys, hunk[-1], range(end, ceiling))
+        end = end if reached is None else reached + 1
+    return start, end
+
+
+def merge_snippet(original, snippet):
+    """
+    Places the hunks of a partial snippet into the original text.
+
+    Each hunk is located after the previous one with locate, and the file lines it
+    covers are replaced by the hunk; everything outside the hunks is kept. A hunk that
+    matches nothing is appended after a blank line when it is the last one and only
+    follows elided code, and inserted at the top when it is the first one and only
+    precedes elided code. The snippet is applied whole or not at all.
+
+    Args:
+        original (str): The current file content.
+        snippet (str): The snippet, with elision comments for the omitted code.
+
+    Returns:
+        tuple: (merged text, list of per-hunk results with 'hunk', 'status' ('applied',
+            'unchanged', 'ambiguous' or 'unmatched'), 'startLine' and 'endLine', the
+            1-based range of original lines replaced, 'removed' and 'added'). A hunk
+            that only inserts lines replaces none; its 'startLine' and 'endLine' are
+            both the line it follows, 0 at the top of the file.
+
+    Raises:
+        MergeError: If any hunk is ambiguous or matches nothing.
+    """
+    trailing_newline = original.endswith('\n')
+    lines = (original[:-1] if trailing_newline else original).split('\n')
+    keys = [line.strip() for line in lines]
+    hunks = split_hunks(snippet)
+
+    cursor = 0
+    edits = []
+    results = []
+    for number, hunk in enumerate(hunks):
+        replacement = hunk.lines
+        located = locate(hunk.lines, lines, keys, cursor)
+        if located is None and number == len(hunks) - 1 and hunk.elided_before and not hunk.elided_after:
+            end = len(lines)
+            while end > cursor and not lines[end - 1].strip():
+                end -= 1
+            located = (end, end)
+            if end:
+                replacement = [''] + hunk.lines
+        elif located is None and number == 0 and hunk.elided_after and not hunk.elided_before:
+            located = (0, 0)
+        if located is None or located == 'ambiguous':
+            results.append({'hunk': number, 'status': located or 'unmatched', 'added': len(hunk.lines)})
+            continue
+        start, end = located
+        unchanged = lines[start:end] == replacement
+        if not unchanged:
+            edits.append((start, end, replacement))
+        results.append({
+            'hunk': number,
+            'status': 'unchanged' if unchanged else 'applied',
+            'startLine': start + 1 if end > start else start,
+            'endLine': end,
+            'removed': end - start,
+            'added': len(replacement)
+        })
+        cursor = end
+
+    unplaced = [result for result in results if result['status'] not in ('applied', 'unchanged')]
+    if len(unplaced) == len(results):
+        raise MergeError('No part of the snippet matches the existing file.')
+    if unplaced:
+        described = ', '.join(f'{result["hunk"] + 1} ({result["status"]})' for result in unplaced)
+        raise MergeError(f'Some hunks of the snippet could not be placed: {described}', results)
+
+    merged = []
+    position = 0
+    for start, end, hunk in edits:
+        merged.extend(lines[position:start])
+        merged.extend(hunk)
+        position = end
+    merged.extend(lines[position:])
+    return '\n'.join(merged) + ('\n' if trailing_newline else ''), results
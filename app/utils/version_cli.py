@@ -0,0 +1,51 @@
+"""
+Lists, shows and restores the versions of a file kept in its project's version store.
+
+Run with:
+    python -m app.utils.version_cli list <path>
+    python -m app.utils.version_cli show <path> <hash>
+    python -m app.utils.version_cli restore <path> <hash>
+"""
+import argparse
+import datetime
+import sys
+
+from app.utils.file_writer import write_file_if_changed
+from app.utils.version_store import get_version_store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.utils.version_cli', description=__doc__.strip().split('\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    list_command = commands.add_parser('list', help='list the stored versions, newest first')
+    list_command.add_argument('path')
+    for name, text in (('show', 'print a stored version'), ('restore', 'put a stored version back')):
+        command = commands.add_parser(name, help=text)
+        command.add_argument('path')
+        command.add_argument('hash', help='the version hash, or a unique prefix of it')
+    args = parser.parse_args(argv)
+
+    store = get_version_store(args.path)
+    versions = store.list_versions(args.path)
+    if args.command == 'list':
+        for entry in versions:
+            stored_at = datetime.datetime.fromtimestamp(entry['time']).isoformat(sep=' ', timespec='seconds')
+            print(f'{entry["hash"][:12]}  {stored_at}  {entry["size"]:>10}  {entry["reason"]}')
+        return 0
+
+    matches = {entry['hash'] for entry in versions if entry['hash'].startswith(args.hash)}
+    if len(matches) != 1:
+        print(f'{"Ambiguous" if matches else "Unknown"} version {args.hash} of {args.path}', file=sys.stderr)
+        return 1
+    content = store.read_version(args.path, matches.pop())
+    if args.command == 'show':
+        sys.stdout.buffer.write(content)
+    elif write_file_if_changed(args.path, content):
+        print(f'Restored {args.path}')
+    else:
+        print(f'{args.path} already holds this version')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+from app.config.settings import CACHE_DIRECTORY, VERSION_STORE_ENABLED, VERSION_STORE_MAX_FILE_BYTES
+from app.utils.hash_cache import get_hash_cache, hash_bytes
+
+# Directory, at the root of a project, holding the previous versions of its files
+VERSION_STORE_DIRNAME = os.path.join('.chatgpt-to-file', 'versions')
+VERSION_COMPRESSION_LEVEL = 6
+
+
+class VersionStore:
+    """
+    Content-addressed store of the versions of a project's files replaced by saves.
+
+    Each distinct content is kept once, zlib-compressed, under objects/ab/cdef... named by
+    its SHA-256 digest, so storage grows with the unique contents rather than with the
+    number of saves. index.jsonl is an append-only log of (path, digest, size, time)
+    records, loaded once into a per-path list for listing and restoring.
+    """
+
+    def __init__(self, root, directory=None):
+        """
+        Args:
+            root (str | None): The project root; paths are recorded relative to it. With
+                None, paths are recorded as absolute paths.
+            directory (str, optional): Where the store lives, by default inside the root.
+        """
+        self.root = root
+        self.directory = directory or os.path.join(root, VERSION_STORE_DIRNAME)
+        self.index_path = os.path.join(self.directory, 'index.jsonl')
+        self.index = None
+        self.lock = threading.Lock()
+
+    def relative_path(self, path):
+        path = os.path.abspath(path)
+        if self.root is not None:
+            path = os.path.relpath(path, self.root)
+        return path.replace(os.sep, '/')
+
+    def object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest[2:])
+
+    def get_index(self):
+        if self.index is None:
+            self.index = {}
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue  # A record cut short by a crash
+                        self.index.setdefault(entry['path'], []).append(entry)
+            except FileNotFoundError:
+                pass
+        return self.index
+
+    def write_object(self, digest, data):
+        object_path = self.object_path(digest)
+        if os.path.exists(object_path):
+            return
+        directory = os.path.dirname(object_path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+            ignore_path = os.path.join(self.directory, '.gitignore')
+            if not os.path.exists(ignore_path):
+                with open(ignore_path, 'w', encoding='utf-8') as f:
+                    f.write('*\n')
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(zlib.compress(data, VERSION_COMPRESSION_LEVEL))
+            os.replace(tmp_path, object_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def snapshot(self, path, stat_result, reason='overwrite'):
+        """
+        Preserves the current content of path, unless it is already its latest version.
+        The file is only read when the hash cache has no digest for it or the content is
+        not stored yet.
+
+        Args:
+            path (str): The file about to be replaced.
+            stat_result (os.stat_result): A fresh stat of the file.
+            reason (str): Why the version was recorded.
+
+        Returns:
+            dict | None: The new index entry, or None if nothing was recorded.
+        """
+        relative_path = self.relative_path(path)
+        hash_cache = get_hash_cache()
+        with self.lock:
+            versions = self.get_index().get(relative_path, [])
+            digest = hash_cache.lookup(path, stat_result)
+            if digest is None or not os.path.exists(self.object_path(digest)):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                digest = hash_bytes(data)
+                hash_cache.store(path, stat_result, digest)
+                if versions and versions[-1]['hash'] == digest:
+                    return None
+                self.write_object(digest, data)
+            elif versions and versions[-1]['hash'] == digest:
+                return None
+
+            entry = {
+                'path': relative_path,
+                'hash': digest,
+                'size': stat_result.st_size,
+                'time': time.time(),
+                'reason': reason
+            }
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+            self.index.setdefault(relative_path, []).append(entry)
+            return entry
+
+    def list_versions(self, path):
+        """
+        Returns the stored versions of path, newest first.
+        """
+        with self.lock:
+            return list(reversed(self.get_index().get(self.relative_path(path), [])))
+
+    def read_version(self, path, digest):
+        """
+        Returns the content of a stored version of path.
+
+        Raises:
+            KeyError: If the version is not recorded for path.
+        """
+        if not any(entry['hash'] == digest for entry in self.list_versions(path)):
+            raise KeyError(f'No version {digest} of {path}.')
+        with open(self.object_path(digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+
+_project_roots = {}
+_version_stores = {}
+
+
+def find_project_root(directory):
+    """
+    Returns the nearest ancestor of directory holding a .git entry, or None.
+    Results are cached per directory.
+    """
+    if directory in _project_roots:
+        return _project_roots[directory]
+    current = directory
+    root = None
+    while True:
+        if os.path.exists(os.path.join(current, '.git')):
+            root = current
+            break
+        parent = os.path.dirname(current)
+        if parent == current:
+            break
+        current = parent
+    _project_roots[directory] = root
+    return root
+
+
+def get_version_store(path):
+    """
+    Returns the version store of the project containing path. Files outside any git
+    repository share a store in the cache directory.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    root = find_project_root(directory)
+    key = root or ''
+    store = _version_stores.get(key)
+    if store is None:
+        if root is None:
+            store = VersionStore(None, os.path.join(CACHE_DIRECTORY, 'versions'))
+        else:
+            store = VersionStore(root)
+        store = _version_stores.setdefault(key, store)
+    return store
+
+
+def snapshot_previous_version(path, stat_result, reason='overwrite'):
+    """
+    Records the content a save, or a post-write hook, is about to replace. Empty files, such as names claimed
+    for a new save, and files above VERSION_STORE_MAX_FILE_BYTES are skipped. Errors are
+    logged, never raised, so a failing store does not block saves.
+    """
+    if not VERSION_STORE_ENABLED or not 0 < stat_result.st_size <= VERSION_STORE_MAX_FILE_BYTES:
+        return None
+    try:
+        return get_version_store(path).snapshot(path, stat_result, reason)
+    except Exception as e:
+        logging.error(f'Error storing the previous version of {path}: {e}')
+        return None
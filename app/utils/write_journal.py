@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import shutil
+import uuid
+
+from app.config.settings import JOURNAL_DIRECTORY
+
+
+def missing_directories(path):
+    """
+    Returns the directories above path that do not exist yet, deepest first.
+    """
+    directories = []
+    directory = os.path.dirname(os.path.abspath(path))
+    while not os.path.exists(directory) and directory != os.path.dirname(directory):
+        directories.append(directory)
+        directory = os.path.dirname(directory)
+    return directories
+
+
+def fsync_directory(directory):
+    """
+    Makes the creation, renaming or removal of files in directory durable.
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # Not supported on this platform
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class WriteJournal:
+    """
+    Rollback journal making a group of file writes all-or-nothing.
+
+    Before the writes, the list of targets is written to a journal file, and then the
+    current version of every target is preserved next to it as a hard link (a copy when
+    linking is not possible). Since saves replace files by renaming a new file over
+    them, the preserved link keeps the old content. rollback puts every target back;
+    commit marks the journal committed and then discards the backups. Every backup is
+    named by a journal before it is made and until it is removed, so a journal left
+    behind by a crash is rolled back, or its backups removed if it was committed, on
+    startup by recover_journals.
+    """
+
+    def __init__(self, paths, directory=JOURNAL_DIRECTORY):
+        self.journal_id = uuid.uuid4().hex
+        self.journal_path = os.path.join(directory, f'{self.journal_id}.json')
+        self.entries = [{'path': path, 'backup': self.backup_path(path)} for path in paths]
+        self.committed = False
+
+    def backup_path(self, path):
+        directory, name = os.path.split(path)
+        return os.path.join(directory, f'.{name}.{self.journal_id}.bak')
+
+    @classmethod
+    def load(cls, journal_path):
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        journal = cls.__new__(cls)
+        journal.journal_id = data['id']
+        journal.journal_path = journal_path
+        journal.entries = data['entries']
+        journal.committed = data.get('committed', False)
+        return journal
+
+    def record(self):
+        """
+        Writes the journal durably, replacing the previous record atomically.
+        """
+        directory = os.path.dirname(self.journal_path)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.journal_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'id': self.journal_id, 'entries': self.entries, 'committed': self.committed}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        fsync_directory(directory)
+
+    def begin(self):
+        """
+        Records the journal on disk and then preserves the current version of every
+        target. Targets that do not exist yet are recorded without a backup, so that
+        rollback removes them, together with the directories that do not exist yet above
+        them. If a target cannot be preserved, the backups already made are removed and
+        the error is raised.
+        """
+        for entry in self.entries:
+            entry['directories'] = missing_directories(entry['path'])
+            if not os.path.lexists(entry['path']):
+                entry['backup'] = None
+        self.record()
+        try:
+            for entry in self.entries:
+                if entry['backup'] is None:
+                    continue
+                try:
+                    os.link(entry['path'], entry['backup'])
+                except OSError:
+                    shutil.copy2(entry['path'], entry['backup'])
+        except Exception:
+            self.discard()
+            raise
+
+    def rollback(self):
+        """
+        Restores every target to its version from before the journal began, and removes
+        the directories created for new targets once they are empty.
+        """
+        for entry in self.entries:
+            try:
+                if entry['backup'] is None:
+                    if os.path.exists(entry['path']):
+                        os.remove(entry['path'])
+                elif os.path.exists(entry['backup']):
+                    os.replace(entry['backup'], entry['path'])
+            except OSError as e:
+                logging.error(f'Error rolling back {entry["path"]}: {e}')
+        for entry in self.entries:
+            for directory in entry.get('directories', []):
+                try:
+                    os.rmdir(directory)
+                except FileNotFoundError:
+                    continue
+                except OSError:
+                    break  # Not empty: still holds other files
+        self.discard()
+
+    def commit(self):
+        """
+        Keeps the new versions. The journal is marked committed before the backups are
+        removed, so that a crash in between is not mistaken for an interrupted batch.
+        """
+        self.committed = True
+        self.record()
+        self.discard()
+
+    def discard(self):
+        for entry in self.entries:
+            if entry.get('backup') is not None:
+                try:
+                    os.remove(entry['backup'])
+                except FileNotFoundError:
+                    pass
+        for path in (self.journal_path, f'{self.journal_path}.tmp'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def recover_journals(directory=JOURNAL_DIRECTORY):
+    """
+    Rolls back the groups of writes interrupted by a crash, and removes the backups left
+    by groups that committed before the crash.
+
+    Returns:
+        int: The number of journals rolled back.
+    """
+    if not os.path.isdir(directory):
+        return 0
+    recovered = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith('.json.tmp') and not os.path.exists(path[:-4]):
+            # Torn first record; no backup was made yet
+            os.remove(path)
+            continue
+        if not name.endswith('.json'):
+            continue
+        try:
+            journal = WriteJournal.load(path)
+            if journal.committed:
+                journal.discard()
+                logging.info(f'Removed the backups of committed batch {name[:-5]}')
+            else:
+                journal.rollback()
+                recovered += 1
+                logging.warning(f'Rolled back interrupted batch {name[:-5]}')
+        except Exception as e:
+            logging.error(f'Error recovering journal {path}: {e}')
+    return recovered
@@ -1,4 +1,5 @@
 # components/config_manager.py
+import os
 import yaml
 from pathlib import Path
 
@@ -16,7 +17,8 @@ class ConfigManager:
     def default_config(self):
         return {
             'monitor_path': 'tmp/messages/',
-            'parsed_path': 'tmp/parsed/'
+            'parsed_path': 'tmp/parsed/',
+            'search_index_path': 'tmp/cache/search.sqlite3'
         }
 
     def save_config(self, new_config):
@@ -27,5 +29,14 @@ class ConfigManager:
     def get(self, key, default=None):
         return self.config.get(key, default)
 
+    def get_search_index_path(self):
+        # Without a configured path, the index sits where the server keeps it: in the
+        # cache directory next to the message archive
+        path = self.get('search_index_path')
+        if path:
+            return path
+        monitor_path = os.path.normpath(self.get('monitor_path', 'tmp/messages/'))
+        return os.path.join(os.path.dirname(monitor_path), 'cache', 'search.sqlite3')
+
     def set(self, key, value):
         self.config[key] = value
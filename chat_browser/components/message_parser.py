@@ -3,11 +3,15 @@ import logging
 import os
 import json
 from chat_browser.components.parsers.parser_type_a import ParserTypeA
+from app.utils.archive_codec import read_document_file
+from app.utils.search_index import get_search_index
 
 
 class MessageParser:
-    def __init__(self):
+    def __init__(self, search_index=None):
         self.parsers = [ParserTypeA()]  # Add more parsers as needed
+        # The index parsed messages are added to; the server's by default
+        self.search_index = search_index
 
     def parse(self, html_content):
         for parser in self.parsers:
@@ -22,15 +26,28 @@ class MessageParser:
 
     def parse_and_save(self, html_file, parsed_path):
         filename = os.path.basename(html_file)
-        parsed_file = os.path.join(parsed_path, f"{os.path.splitext(filename)[0]}.json")
+        name = filename.split('.html')[0]
+        if os.path.exists(os.path.join(parsed_path, f"{name}.json")):
+            logging.warning(f"Parsed file for {name} already exists. Skipping.")
+            return
+
+        # Reads .html files as well as compressed .html.gz and .html.zst ones
+        html_content = read_document_file(html_file)
+
+        self.parse_and_save_content(html_content, name, parsed_path)
+
+    def parse_and_save_content(self, html_content, name, parsed_path):
+        parsed_file = os.path.join(parsed_path, f"{name}.json")
         if os.path.exists(parsed_file):
             logging.warning(f"Parsed file {parsed_file} already exists. Skipping.")
             return
 
-        with open(html_file, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-
         parsed_json = self.parse(html_content)
         os.makedirs(parsed_path, exist_ok=True)
         with open(parsed_file, 'w', encoding='utf-8') as f:
             json.dump(parsed_json, f, indent=2)
+
+        try:
+            (self.search_index or get_search_index()).add_parsed_message(name, html_content, parsed_json)
+        except Exception as e:
+            logging.error(f"Error indexing parsed message {name}: {e}")
@@ -6,6 +6,9 @@ from components.message_parser import MessageParser
 from components.to_markdown import ConverterManager
 from components.code_writer import write_code_snippets  # Import the code_writer
 import json
+from datetime import datetime
+from app.utils.message_archive import MessageArchive, format_document
+from app.utils.search_index import SearchIndex
 
 
 def main():
@@ -14,6 +17,7 @@ def main():
     config_manager = ConfigManager()
     monitor_path = config_manager.get('monitor_path')
     parsed_path = config_manager.get('parsed_path')
+    search_index_path = config_manager.get_search_index_path()
 
     # Ensure paths exist
     if not Path(monitor_path).exists():
@@ -24,39 +28,51 @@ def main():
         st.error(f"Parsed path does not exist: {parsed_path}")
         return
 
-    # List and sort HTML files by timestamp
-    html_files = sorted(
-        Path(monitor_path).glob("*.html"),
-        key=lambda x: x.stat().st_mtime,
-        reverse=True
-    )
-
-    if not html_files:
-        st.info("No HTML files found in the monitor path.")
-        return
-
-    options = [str(f.name) for f in html_files]
-    selected_file = st.selectbox("Select a message file", options)
-
-    if selected_file:
-        html_file_path = os.path.join(monitor_path, selected_file)
+    # List archived messages, newest first, or the best matches of a search
+    archive = MessageArchive(monitor_path, readonly=True)
+    query = st.text_input("Search messages", placeholder="e.g. auth.py token refresh")
+    if query:
+        search_index = SearchIndex(search_index_path, readonly=True)
+        try:
+            results = [result for result in search_index.search(query, limit=50) if result.id in archive]
+        finally:
+            search_index.close()
+        if not results:
+            st.info("No messages match the search.")
+            return
+        labels = {result.id: f"{result.id}: {result.snippet}" for result in results}
+    else:
+        messages = archive.list_messages()
+        if not messages:
+            st.info("No messages found in the message archive.")
+            return
+        labels = {
+            message_id: f"{datetime.fromtimestamp(timestamp / 1000):%Y-%m-%d %H:%M:%S} {message_id}"
+            for timestamp, message_id in messages
+        }
+    selected_id = st.selectbox("Select a message", list(labels), format_func=labels.get)
+
+    if selected_id:
+        html_content = format_document(archive.read(selected_id))
         # show in max height 400 with scrollable content
         st.components.v1.html(
-            f'<div style="height: 400px; overflow-y: scroll;">{
-                open(html_file_path, "r", encoding="utf-8").read()}</div>',
+            f'<div style="height: 400px; overflow-y: scroll;">{html_content}</div>',
             height=400
         )
 
-        parser = MessageParser()
-        with st.spinner("Parsing the selected HTML file..."):
+        search_index = SearchIndex(search_index_path)
+        parser = MessageParser(search_index)
+        with st.spinner("Parsing the selected message..."):
             try:
-                parser.parse_and_save(html_file_path, parsed_path)
+                parser.parse_and_save_content(html_content, selected_id, parsed_path)
                 st.success("Parsing completed successfully!")
             except Exception as e:
                 st.error(f"Error during parsing: {e}")
                 return
+            finally:
+                search_index.close()
 
-        parsed_file = os.path.join(parsed_path, f"{Path(selected_file).stem}.json")
+        parsed_file = os.path.join(parsed_path, f"{selected_id}.json")
 
         if os.path.exists(parsed_file):
             # Add button to remove existing parsed_file.
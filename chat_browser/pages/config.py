@@ -9,11 +9,13 @@ def main():
 
     monitor_path = st.text_input("Monitor Path", value=config_manager.get('monitor_path'))
     parsed_path = st.text_input("Parsed Path", value=config_manager.get('parsed_path'))
+    search_index_path = st.text_input("Search Index Path", value=config_manager.get_search_index_path())
 
     if st.button("Save Configuration"):
         new_config = {
             'monitor_path': monitor_path,
-            'parsed_path': parsed_path
+            'parsed_path': parsed_path,
+            'search_index_path': search_index_path
         }
         config_manager.save_config(new_config)
         st.success("Configuration saved successfully!")
@@ -1,10 +1,18 @@
 import asyncio
-import json
 import logging
+import signal
 
 import websockets
-from app.handlers.message_handler import handle_message
-from app.config.logging_config import setup_logging
+from app.handlers.dispatcher import MessageDispatcher
+from app.config.logging_config import LogPayload, setup_logging
+from app.config.settings import METRICS_HOST, METRICS_PORT
+from app.managers.message_manager import message_writer
+from app.utils.codec import available_subprotocols
+from app.utils.hook_runner import get_hook_runner
+from app.utils.message_archive import get_message_archive
+from app.utils.metrics import metrics, start_metrics_server
+from app.utils.search_index import get_search_index
+from app.utils.write_journal import recover_journals
 
 # Initialize logging
 setup_logging()
@@ -12,21 +20,44 @@ setup_logging()
 
 async def handler(websocket, path):
     logging.info('Client connected.')
+    metrics.add_gauge('connections', 1)
+    dispatcher = MessageDispatcher(websocket)
     try:
         async for message in websocket:
-            logging.debug(f'Received message: {message}')
-            response = await handle_message(message, websocket)
-            if response:
-                await websocket.send(json.dumps(response))
-                logging.debug(f'Sent response: {response}')
+            logging.debug('Received message: %s', LogPayload(message))
+            await dispatcher.submit(message)
     except websockets.exceptions.ConnectionClosed as e:
         logging.info(f'Connection closed: {e}')
+    finally:
+        await dispatcher.drain()
+        metrics.add_gauge('connections', -1)
 
 
 async def main():
-    server = await websockets.serve(handler, 'localhost', 8765)
+    recover_journals()
+    if METRICS_PORT:
+        metrics_server = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    server = await websockets.serve(handler, 'localhost', 8765, subprotocols=available_subprotocols())
     logging.info('WebSocket server started on ws://localhost:8765')
-    await server.wait_closed()
+    # Ctrl+C and SIGTERM close the server, so the queued writes below are still flushed
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, server.close)
+        except (NotImplementedError, RuntimeError):
+            pass  # Not supported on Windows event loops
+    try:
+        await server.wait_closed()
+    finally:
+        logging.info('Shutting down; flushing queued writes.')
+        try:
+            await get_hook_runner().drain()
+            await message_writer.drain()
+        finally:
+            get_message_archive().close()
+            get_search_index().close()
+            if METRICS_PORT:
+                metrics_server.close()
 
 
 if __name__ == '__main__':